@@ -0,0 +1,393 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+current_dir = Path(os.path.dirname(__file__))
+sys.path.insert(1, os.path.join(current_dir.absolute(), "tp_utils"))
+
+from fs_helpers import *
+from chunks import ChunkIndex
+from adef import ActorStringsEntry
+from textures import TextureListEntry
+from batch import FILE_CHUNKS, parallel_map, read_file, decode_image, decode_textures, parse_models
+from lp2 import LevelMaterialsEntry, GeometrySection, AIMapListEntry, SplineListEntry, LightsEntry, ActorInfoListEntry, load_adef
+from p2m import ModlMaterialsEntry
+from p2s import SkeletonEntry, SkelModelEntry
+import benchmark
+
+try:
+  from decompress import decompress
+  has_decompress = True
+except ImportError:
+  has_decompress = False
+
+# Command line tools built on the tp_utils parsers, no Blender needed:
+#   python -m io_assets_treasureplanet.cli <command> [--jobs N] [-o OUTPUT] PATH...
+# Directories are searched recursively and their layout is mirrored under OUTPUT.
+#   python -m io_assets_treasureplanet.cli bench [--scale N] [--save FILE] [--compare FILE]
+# runs the synthetic parse/save benchmark instead.
+
+KINDS = ("lp2", "p2m", "p2s", "tp2")
+
+def file_kind(path):
+  return os.path.splitext(path)[1][1:].lower()
+
+def collect_files(paths, kinds=KINDS):
+  # (path, path relative to the argument it was found under) for every matching file
+  files = []
+  for path in paths:
+    if not os.path.isdir(path):
+      files.append((path, os.path.basename(path)))
+      continue
+    for root, dirs, names in os.walk(path):
+      dirs.sort()
+      for name in sorted(names):
+        if file_kind(name) in kinds:
+          files.append((os.path.join(root, name), os.path.relpath(os.path.join(root, name), path)))
+  return files
+
+def output_path(output, relative, extension=None):
+  path = os.path.join(output, relative)
+  if extension != None: path = os.path.splitext(path)[0] + extension
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+  return path
+
+def file_name(name):
+  return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", name)
+
+def to_json(value):
+  if isinstance(value, (np.ndarray, np.generic)): return value.tolist()
+  raise TypeError("%s is not JSON serializable" % type(value).__name__)
+
+def write_png(path, width, height, pixels):
+  # 8-bit RGBA. Blender pixel rows start at the bottom, PNG rows at the top.
+  rows = np.asarray(pixels, dtype=np.uint8).reshape(height, width * 4)[::-1]
+  raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+  raw[:, 1:] = rows
+  def chunk(tag, body): return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body))
+  with open(path, "wb") as f:
+    f.write(b"\x89PNG\r\n\x1a\n")
+    f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+    f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+    f.write(chunk(b"IEND", b""))
+
+adef = None
+def get_adef():
+  global adef
+  if adef == None: adef = load_adef(os.path.join(current_dir.absolute(), "tp_utils"))
+  return adef
+
+def file_blocks(data, kind):
+  if not kind in FILE_CHUNKS: return []
+  return ChunkIndex(data, *FILE_CHUNKS[kind]).blocks()
+
+def block_bytes(data, block):
+  # A block as stored: magic, size and contents
+  return bytes(data.view(block - 0x4, data.sread_u32(block) + 0x8))
+
+# decompress
+
+def decompress_file(path, relative, output):
+  if not has_decompress: return False, "decompress module unavailable"
+  with open(path, "rb") as f: raw = f.read()
+  if raw[:3] != b"PK2": return True, "not compressed"
+  out_path = output_path(output, relative)
+  if os.path.abspath(out_path) == os.path.abspath(path): return False, "output would overwrite the input"
+  data = decompress(raw)
+  with open(out_path, "wb") as f: f.write(data)
+  return True, "%d -> %d bytes" % (len(raw), len(data))
+
+# dump
+
+def dump_lp2(data, name):
+  summary = {"blocks": []}
+  arrays = {}
+  version = 0
+  materials = []
+  stringlists = {}
+  aimaps = None
+  splines = None
+  for key, block in file_blocks(data, "lp2"):
+    summary["blocks"].append([key, block])
+    data.seek(block)
+    if key == "INFO":
+      version = summary["version"] = sread_u32(data, block + 0x4)
+    elif key == "TEX ":
+      summary["textures"] = [texture.name for texture in TextureListEntry(block, data, name).textures]
+    elif key == "MAT ":
+      materials = LevelMaterialsEntry(data).materials
+      summary["material_count"] = len(materials)
+    elif key == "SECT":
+      geometry = GeometrySection(data, version, materials)
+      summary["render_sections"] = []
+      for i, section in enumerate(geometry.render_sections):
+        vertices, normals, faces, colors, material_ranges, vertex_groups = section.get_section_geometry()
+        arrays["render%d_vertices" % i] = vertices
+        arrays["render%d_normals" % i] = normals
+        arrays["render%d_faces" % i] = faces
+        summary["render_sections"].append({"vertices": len(vertices), "faces": len(faces), "materials": [material_index for material_index, face_offset, face_count, uv_layers in material_ranges]})
+      summary["collision_sections"] = []
+      for i, section in enumerate(geometry.collision_sections):
+        if section.coll_geom_count == 0:
+          summary["collision_sections"].append({"vertices": 0, "faces": 0, "layer_masks": []})
+          continue
+        vertices, faces, tri_normals, vertex_groups, layer_masks = section.get_geometry_per_section()
+        arrays["collision%d_vertices" % i] = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+        arrays["collision%d_faces" % i] = np.array(faces, dtype=np.int64).reshape(-1, 3)
+        summary["collision_sections"].append({"vertices": len(vertices), "faces": len(faces), "layer_masks": layer_masks})
+      for instance_key, instances in (("static_instances", geometry.model_instances), ("dynamic_instances", geometry.dynamic_model_instances)):
+        summary[instance_key] = [{
+          "transform": instance.transform,
+          "render": [[render.sect_index, render.min, render.max] for render in instance.render_instances],
+          "collision": [[collision.sect_index, collision.min, collision.max] for collision in instance.collision_instances],
+        } for instance in instances]
+    elif key == "AIMP":
+      aimaps = AIMapListEntry(data)
+      summary["ai_maps"] = [{"vertices": len(aimap.vertices), "cells": len(aimap.map_cells), "transform": aimap.transform} for aimap in aimaps.maps]
+    elif key == "SPLN":
+      splines = SplineListEntry(data)
+      summary["splines"] = [{"loop": spline.loop_flag, "points": spline.points, "transform": spline.transform} for spline in splines.splines]
+    elif key == "LITE":
+      lights = LightsEntry(data, name)
+      summary["lights"] = []
+      for light in lights.lights:
+        light_type, color, radfall, spot, transform = light.get_bpylight()
+        summary["lights"].append({"type": light_type, "color": color, "radius_falloff": radfall, "spot": spot, "transform": transform})
+    elif key == "ASTR" or key == "PSTR":
+      stringlists[key] = ActorStringsEntry(data)
+    elif key == "AINF":
+      actor_list = ActorInfoListEntry(data, get_adef().classes, get_adef().enums, get_adef().strings, stringlists["ASTR"], stringlists["PSTR"], aimaps, splines, None)
+      summary["actors"] = [{"name": actor.name, "transform": actor.transform} for actor in actor_list.actors]
+  return summary, arrays
+
+def dump_p2m(data, name):
+  blocks = file_blocks(data, "p2m")
+  summary = {"blocks": [[key, block] for key, block in blocks], "models": []}
+  arrays = {}
+  textures = decode_textures(data, name, blocks)
+  summary["textures"] = [image[0] for images in textures.values() for image in images]
+  for m, lods in enumerate(parse_models(data, name, blocks).values()):
+    summary["models"].append({"lod_radii": []})
+    for lod, (vertices, normals, faces, material_ranges, vertex_groups, lod_radii) in enumerate(lods):
+      arrays["model%d_lod%d_vertices" % (m, lod)] = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+      arrays["model%d_lod%d_normals" % (m, lod)] = np.array(normals, dtype=np.float32).reshape(-1, 3)
+      arrays["model%d_lod%d_faces" % (m, lod)] = np.array(faces, dtype=np.int64).reshape(-1, 3)
+      summary["models"][-1]["lod_radii"].append(lod_radii)
+  return summary, arrays
+
+def dump_p2s(data, name):
+  blocks = file_blocks(data, "p2s")
+  summary = {"blocks": [[key, block] for key, block in blocks]}
+  arrays = {}
+  for key, block in blocks:
+    data.seek(block)
+    if key == "INFO":
+      summary["version"] = sread_u32(data, block + 0x4)
+    elif key == "SKEL":
+      skeleton = SkeletonEntry(data, name)
+      summary["bones"] = [{
+        "index": bone.bone_index,
+        "parent": None if bone.parent == None else bone.parent.bone_index,
+        "transform": bone.transform,
+      } for bone in skeleton.bones if bone != None]
+    elif key == "MODL":
+      model = SkelModelEntry(data)
+      summary["lod_radii"] = []
+      for i in range(model.mesh_count):
+        geometry, lod_radii = model.get_model_geometry(i)
+        summary["lod_radii"].append(lod_radii)
+        for s, (vertices, normals, faces) in enumerate(geometry):
+          arrays["lod%d_%d_vertices" % (i, s)] = np.array(vertices, dtype=np.float32).reshape(-1, 3)
+          arrays["lod%d_%d_normals" % (i, s)] = np.array(normals, dtype=np.float32).reshape(-1, 3)
+          arrays["lod%d_%d_faces" % (i, s)] = np.array(faces, dtype=np.int64).reshape(-1, 3)
+  return summary, arrays
+
+def dump_tp2(data, name):
+  image_name, width, height, pixels, has_alpha = decode_image(data, name)
+  return {"width": width, "height": height, "has_alpha": bool(has_alpha)}, {"pixels": pixels.reshape(height, width, 4)}
+
+DUMPERS = {
+  "lp2": dump_lp2,
+  "p2m": dump_p2m,
+  "p2s": dump_p2s,
+  "tp2": dump_tp2,
+}
+
+def dump_file(path, relative, output):
+  kind = file_kind(path)
+  if not kind in DUMPERS: return False, "unknown file type"
+  summary, arrays = DUMPERS[kind](read_file(path), os.path.splitext(os.path.basename(path))[0])
+  with open(output_path(output, relative, ".json"), "w") as f:
+    json.dump(summary, f, indent=1, default=to_json)
+  if len(arrays) > 0: np.savez_compressed(output_path(output, relative, ".npz"), **arrays)
+  return True, "%d arrays" % len(arrays)
+
+# textures
+
+def export_textures(path, relative, output):
+  kind = file_kind(path)
+  data = read_file(path)
+  name = os.path.splitext(os.path.basename(path))[0]
+  if kind == "tp2":
+    image_name, width, height, pixels, has_alpha = decode_image(data, name)
+    write_png(output_path(output, relative, ".png"), width, height, pixels)
+    return True, "1 texture"
+  # Embedded textures go into a folder named after the file
+  directory = os.path.splitext(relative)[0]
+  images = [image for images in decode_textures(data, name, file_blocks(data, kind)).values() for image in images]
+  for image_name, width, height, pixels, has_alpha in images:
+    write_png(output_path(output, os.path.join(directory, file_name(image_name) + ".png")), width, height, pixels)
+  return True, "%d textures" % len(images)
+
+# verify
+
+def verify_section(original, section):
+  section.save_changes()
+  return bytes(section.data.raw) == original
+
+def verify_lp2(data, name):
+  # Every block with a save_changes path is parsed and saved again on its own
+  results = []
+  version = 0
+  materials = []
+  stringlists = {}
+  aimaps = None
+  splines = None
+  for key, block in file_blocks(data, "lp2"):
+    original = block_bytes(data, block)
+    data.seek(block)
+    output = None
+    if key == "INFO":
+      version = sread_u32(data, block + 0x4)
+    elif key == "TEX ":
+      output = TextureListEntry(block, data, name).save_changes("TEX ")
+    elif key == "MAT ":
+      material_list = LevelMaterialsEntry(data)
+      materials = material_list.materials
+      output = material_list.save_changes()
+    elif key == "SECT":
+      geometry = GeometrySection(data, version, materials)
+      sections = [("render%d" % i, section) for i, section in enumerate(geometry.render_sections)]
+      sections += [("collision%d" % i, section) for i, section in enumerate(geometry.collision_sections)]
+      for section_name, section in sections:
+        section_original = bytes(section.data.view(section.entry_offset, section.data_size))
+        results.append(("SECT " + section_name, verify_section(section_original, section)))
+      output = geometry.save_injected_changes(version)
+    elif key == "AIMP":
+      aimaps = AIMapListEntry(data)
+      output = aimaps.save_changes()
+    elif key == "SPLN":
+      splines = SplineListEntry(data)
+      output = splines.save_changes()
+    elif key == "LITE":
+      output = LightsEntry(data, name).save_changes()
+    elif key == "ASTR" or key == "PSTR":
+      stringlists[key] = ActorStringsEntry(data)
+      output = BinaryWriter()
+      stringlists[key].save_changes(key, output)
+    elif key == "AINF":
+      output = ActorInfoListEntry(data, get_adef().classes, get_adef().enums, get_adef().strings, stringlists["ASTR"], stringlists["PSTR"], aimaps, splines, None).save_changes()
+    if output != None: results.append((key, output.getvalue() == original))
+  return results
+
+def verify_models(data, name, kind):
+  results = []
+  for key, block in file_blocks(data, kind):
+    original = block_bytes(data, block)
+    data.seek(block)
+    if key == "TEXT":
+      results.append((key, TextureListEntry(block, data, name).save_changes("TEXT").getvalue() == original))
+    elif key == "MATL" and kind == "p2m":
+      results.append((key, ModlMaterialsEntry(data).save_changes().getvalue() == original))
+  return results
+
+def verify_file(path, relative, output):
+  kind = file_kind(path)
+  data = read_file(path)
+  name = os.path.splitext(os.path.basename(path))[0]
+  if kind == "lp2": results = verify_lp2(data, name)
+  elif kind == "p2m" or kind == "p2s": results = verify_models(data, name, kind)
+  else: return True, "no save path"
+  failed = [key for key, identical in results if not identical]
+  if len(failed) > 0: return False, "differs: " + ", ".join(failed)
+  return True, "%d blocks identical" % len(results)
+
+COMMANDS = {
+  "decompress": decompress_file,
+  "dump": dump_file,
+  "textures": export_textures,
+  "verify": verify_file,
+}
+
+def run_file(command, path, relative, output, verbose=False):
+  # Runs in the worker processes. Parser output is dropped unless verbose, errors are reported per file.
+  start = time.perf_counter()
+  log = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(sys.stdout if verbose else log):
+      ok, message = COMMANDS[command](path, relative, output)
+  except Exception as e:
+    ok, message = False, "%s: %s" % (type(e).__name__, e)
+  return relative, ok, message, time.perf_counter() - start
+
+def run_bench(args):
+  results = benchmark.run(args.scale, args.repeat, args.seed)
+  benchmark.print_results(results)
+  failures = [result.name for result in results if result.identical == False]
+  if len(failures) > 0: print("Round trip mismatch: " + ", ".join(failures))
+  if args.save != None: benchmark.save_results(results, args.save)
+  if args.compare != None:
+    regressions = benchmark.compare_results(results, args.compare, args.tolerance)
+    for regression in regressions: print("Regression: " + regression)
+    failures += regressions
+  return 1 if len(failures) > 0 else 0
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m io_assets_treasureplanet.cli", description="Treasure Planet asset tools")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  for command, help_text in (
+    ("decompress", "decompress PK2 compressed files"),
+    ("dump", "write a JSON summary and NPZ geometry/pixel arrays for LP2/P2M/P2S/TP2 files"),
+    ("textures", "export TP2 files and embedded textures to PNG"),
+    ("verify", "check that every block with a save path round-trips byte for byte"),
+  ):
+    subparser = subparsers.add_parser(command, help=help_text)
+    subparser.add_argument("paths", nargs="+", help="files or directories, searched recursively")
+    if command != "verify": subparser.add_argument("-o", "--output", required=True, help="output directory")
+    subparser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    subparser.add_argument("-v", "--verbose", action="store_true", help="show parser output")
+  subparser = subparsers.add_parser("bench", help="time parse and save of synthetic payloads and check they round-trip")
+  subparser.add_argument("--scale", type=int, default=1, help="payload size multiplier")
+  subparser.add_argument("--repeat", type=int, default=5, help="runs per case, the best time is kept")
+  subparser.add_argument("--seed", type=int, default=0, help="payload random seed")
+  subparser.add_argument("--save", default=None, help="write the results to this JSON file")
+  subparser.add_argument("--compare", default=None, help="fail when slower or larger than this saved JSON baseline")
+  subparser.add_argument("--tolerance", type=float, default=0.25, help="allowed increase over the baseline (default: 0.25)")
+  args = parser.parse_args(argv)
+  if args.command == "bench": return run_bench(args)
+  
+  output = getattr(args, "output", None)
+  files = collect_files(args.paths)
+  start = time.perf_counter()
+  results = parallel_map(run_file, [(args.command, path, relative, output, args.verbose) for path, relative in files], args.jobs)
+  wall_time = time.perf_counter() - start
+  
+  failures = 0
+  for relative, ok, message, elapsed in results:
+    if not ok: failures += 1
+    print("%8.3fs %-4s %s: %s" % (elapsed, "ok" if ok else "FAIL", relative, message))
+  print("%d files, %d failed, %.3fs (%.3fs in workers)" % (len(results), failures, wall_time, sum(result[3] for result in results)))
+  return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
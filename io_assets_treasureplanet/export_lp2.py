@@ -2,6 +2,7 @@ from io import BytesIO
 import os
 import sys
 import math
+import numpy as np
 from pathlib import Path
 
 current_dir = Path(os.path.dirname(__file__))
@@ -11,10 +12,14 @@ import bpy
 import bmesh
 from mathutils import Vector, Matrix, Quaternion, Euler
 from fs_helpers import *
+from chunks import ChunkIndex, LP2_CONTAINERS, LP2_CHUNKS
 from adef import ActorStringsEntry
 from textures import TextureListEntry, AnimatedTexturesEntry
 from lp2 import LightsEntry, LightEntry, SplineListEntry, AIMapListEntry, ActorInfoListEntry, Models, LevelModelInstance, LevelMaterialsEntry, GeometrySection, RenderSection, CollisionSection, load_adef, LevelMaterialEntry
+from linalg import from_mathutils
+from collision import collision_edges, validate_collision
 from tristripper import TriangleStripper, PrimitiveType, triangle_from_strip_to_triangle_list
+from compress import compress, DEFAULT_COMPRESSION_LEVEL
 
 try:
     from decompress import *
@@ -23,102 +28,73 @@ except ImportError:
     has_decompress = False
 
 
+def collision_vertex_groups(collOb, collMesh):
+  # Collision group of every vertex from its heaviest "subN" vertex group, ungrouped vertices fall back to group 0.
+  # Group weights have no foreach_get accessor, so this single comprehension is the only per vertex Python pass.
+  group_subs = np.zeros(len(collOb.vertex_groups) + 1, dtype=np.int64)
+  for group in collOb.vertex_groups:
+    if group.name.startswith("sub") and group.name[3:].isdigit(): group_subs[group.index] = int(group.name[3:])
+  if len(collOb.vertex_groups) == 0: return np.zeros(len(collMesh.vertices), dtype=np.int64)
+  heaviest = [max(vert.groups, key=lambda element: element.weight).group if len(vert.groups) > 0 else -1 for vert in collMesh.vertices]
+  return group_subs[np.array(heaviest, dtype=np.int64).reshape(-1)]
+
 def extract_blender_collision(collOb):
   try: collMesh = collOb.to_mesh()
   except RuntimeError: return []
-  bm = bmesh.new()
-  bm.from_mesh(collMesh)
-  collOb.to_mesh_clear()
   
-  vertex_groups = collOb.vertex_groups
-  deforms = bm.verts.layers.deform.values()
   collision_layers = {}
-  for group in vertex_groups:
+  for group in collOb.vertex_groups:
     layer_name = group.name + "_layer"
     if not layer_name in collOb: continue
     collision_layers[int(group.name.replace("sub", ""))] = collOb[layer_name]
-  if not collision_layers: collision_layers[0] = [0x3e00]
   
-  #bbox_corners = [Vector(corner) for corner in collOb.bound_box]
-  #bbox_transpose = [[cor[co] for cor in bbox_corners] for co in range(3)]
-  #minVec = Vector([min(co) for co in bbox_transpose])
-  #maxVec = Vector([max(co) for co in bbox_transpose])
-  minX = sys.maxsize
-  minY = sys.maxsize
-  minZ = sys.maxsize
-  maxX = -sys.maxsize - 1
-  maxY = -sys.maxsize - 1
-  maxZ = -sys.maxsize - 1
+  positions = np.empty(len(collMesh.vertices) * 3, dtype=np.float32)
+  collMesh.vertices.foreach_get("co", positions)
+  positions = positions.reshape(-1, 3).astype(np.float64)
+  collMesh.calc_loop_triangles()
+  triangles = np.empty(len(collMesh.loop_triangles) * 3, dtype=np.int32)
+  collMesh.loop_triangles.foreach_get("vertices", triangles)
+  triangles = triangles.reshape(-1, 3).astype(np.int64)
+  vertex_groups = collision_vertex_groups(collOb, collMesh)
+  collOb.to_mesh_clear()
+  
+  if len(positions) > 0:
+    minVec = Vector(positions.min(axis=0).tolist())
+    maxVec = Vector(positions.max(axis=0).tolist())
+  else:
+    minVec = Vector((0.0, 0.0, 0.0))
+    maxVec = Vector((0.0, 0.0, 0.0))
+  
+  # A triangle belongs to the group most of its corners are in, or its first corner's group when all three differ
+  corner_groups = vertex_groups[triangles]
+  tri_groups = np.where(corner_groups[:, 1] == corner_groups[:, 2], corner_groups[:, 1], corner_groups[:, 0])
+  
+  # Planes for every triangle at once: unit normal and w = -dot(normal, v0), zero for degenerate triangles
+  corners = positions[triangles]
+  normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+  lengths = np.linalg.norm(normals, axis=1)
+  normals = np.where(lengths[:, None] > 1e-12, normals / np.where(lengths > 1e-12, lengths, 1.0)[:, None], 0.0)
+  planes = np.column_stack((normals, -np.einsum("ij,ij->i", normals, corners[:, 0])))
   
   sub_sections = {}
-  for vert in bm.verts:
-    groupIndex = -1
-    for g, deform in enumerate(deforms):
-      try:
-        dv = vert[deform]
-        groupIndex = g
-      except: pass
-    
-    if groupIndex != -1:
-      groupName = vertex_groups[groupIndex].name
-    elif len(vertex_groups) == 0: groupIndex = 0
-    else: continue
-    
-    if not "verts" in sub_sections: sub_sections["verts"] = {}
-    if not groupIndex in sub_sections:
-      sub_sections[groupIndex] = {}
-    if not "verts" in sub_sections[groupIndex]:
-      sub_sections[groupIndex]["verts"] = []
-    if not vert.index in sub_sections["verts"]:
-      sub_sections["verts"][vert.index] = (groupIndex, len(sub_sections[groupIndex]["verts"]))
-    sub_sections[groupIndex]["verts"].append(list(vert.co[:]) + [1.0])
+  for groupIndex in np.unique(np.concatenate((vertex_groups, tri_groups))).tolist():
+    group_triangles = triangles[tri_groups == groupIndex]
+    # The game slides along the edge table, so it is rebuilt from the triangles instead of taken from the mesh
+    group_edges, tri_edge_indices, edge_uses = collision_edges(group_triangles)
+    problems = validate_collision(positions, group_triangles, tri_edge_indices, edge_uses)
+    for problem, indices in problems.items():
+      if len(indices) == 0: continue
+      print("%s sub%d: %d %s triangles, first at %s" % (collOb.name, groupIndex, len(indices), problem.replace("_", " "), group_triangles[indices[0]].tolist()))
     
-    minX = min(vert.co[:][0], minX)
-    minY = min(vert.co[:][1], minY)
-    minZ = min(vert.co[:][2], minZ)
-    maxX = max(vert.co[:][0], maxX)
-    maxY = max(vert.co[:][1], maxY)
-    maxZ = max(vert.co[:][2], maxZ)
-  minVec = Vector([minX, minY, minZ])
-  maxVec = Vector([maxX, maxY, maxZ])
-
-  for edge in bm.edges:
-    indices = []
-    for vert in edge.verts:
-      groupIndex, vertIndex = sub_sections["verts"][vert.index]
-      indices.append(vertIndex)
-    if not "edges" in sub_sections: sub_sections["edges"] = {}
-    if not groupIndex in sub_sections:
-      sub_sections[groupIndex] = {}
-    if not "edges" in sub_sections[groupIndex]:
-      sub_sections[groupIndex]["edges"] = []
-    if not edge.index in sub_sections["edges"]:
-      sub_sections["edges"][edge.index] = len(sub_sections[groupIndex]["edges"])
-    sub_sections[groupIndex]["edges"].append(indices)
-
-  for face in bm.faces:
-    indices = []
-    for vert in face.verts:
-      groupIndex, vertIndex = sub_sections["verts"][vert.index]
-      indices.append(vertIndex)
-    edge_indices = []
-    for edge in face.edges:
-      edge_indices.append(sub_sections["edges"][edge.index])
-    if not groupIndex in sub_sections:
-      sub_sections[groupIndex] = {}
-    if not "faces" in sub_sections[groupIndex]:
-      sub_sections[groupIndex]["faces"] = []
-    vs = [v.co for v in face.verts]
-    edge1 = vs[1] - vs[0]
-    edge2 = vs[2] - vs[0]
-    face_dir = edge1.cross(edge2)
-    face_dir.normalized()
-    sub_sections[groupIndex]["faces"].append((indices, edge_indices, list(face_dir.normalized()[:]) + [face_dir.magnitude]))#list(face.normal[:]) + [0.75]))
-
-  del sub_sections["verts"]
-  del sub_sections["edges"]
-  for groupIndex in sub_sections.keys():
-    sub_sections[groupIndex]["layer"] = collision_layers[groupIndex]
+    group_vertices = np.unique(np.concatenate((np.nonzero(vertex_groups == groupIndex)[0], group_triangles.reshape(-1))))
+    verts = np.column_stack((positions[group_vertices], np.ones(len(group_vertices))))
+    local_triangles = np.searchsorted(group_vertices, group_triangles)
+    sub_sections[groupIndex] = {
+      "verts": verts.tolist(),
+      "edges": np.searchsorted(group_vertices, group_edges).tolist(),
+      "faces": list(zip(local_triangles.tolist(), tri_edge_indices.tolist(), planes[tri_groups == groupIndex].tolist())),
+      "layer": collision_layers.get(groupIndex, 0x3e00),
+    }
   return minVec, maxVec, sub_sections
 
 def extract_blender_render(rendOb):
@@ -279,27 +255,7 @@ def extract_blender_render(rendOb):
   maxVec = Vector([maxX, maxY, maxZ])
   return minVec, maxVec, mesh_data, len(col_lays)
 
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic == "LEVL" or magic == "GMSH" or magic == "ACTR":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic.startswith("TEX") or magic == "ANIM" or magic == "MAT " or magic == "SECT" or magic == "NODE" or magic == "PVS " or magic == "AIMP" or magic == "GRID" or magic == "SPLN" or magic == "LITE" or magic == "ASTR" or magic == "PSTR" or magic == "AINF":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
-
-def save(context, filepath="", save_mesh_changes=False, save_collision_changes=False, save_actor_changes=True, save_dynamic_instance_changes=True, save_spline_changes=True, save_light_changes=True, save_aimap_changes=False, use_selection=False):
+def save(context, filepath="", save_mesh_changes=False, save_collision_changes=False, save_actor_changes=True, save_dynamic_instance_changes=True, save_spline_changes=True, save_light_changes=True, save_aimap_changes=False, use_selection=False, compress_output=False, compression_level=DEFAULT_COMPRESSION_LEVEL):
   #adef_data = None
   adef_path = os.path.join(current_dir.absolute(), "tp_utils")
   adef = load_adef(adef_path)
@@ -312,18 +268,13 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
   lp2data = None
   if os.path.isfile(filepath):
     with open(filepath, 'rb') as f:
-      lp2data = BytesIO(f.read())
+      lp2data = read_data(f) if has_decompress else BinaryReader(f.read())
       magic = try_read_str(lp2data, 0, 4)
       lp2data.seek(0)
-      if magic is not None:
-        if magic.startswith("PK2") and has_decompress:
-          d = Decompressor(BytesIO(lp2data.read()))
-          d.decompressed.seek(0)
-          lp2data = BytesIO(d.decompressed.read())
-        #load_lp2(lp2data, os.path.splitext(os.path.basename(f.name))[0])
-  blocks = {}
+      #load_lp2(lp2data, os.path.splitext(os.path.basename(f.name))[0])
+  blocks = []
   if lp2data != None:
-    find_blocks(lp2data, blocks)
+    blocks = ChunkIndex(lp2data, LP2_CONTAINERS, LP2_CHUNKS).blocks()
     print(blocks)
   
   lp2_version = 4
@@ -338,6 +289,8 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
   aimaps = AIMapListEntry()
   grid_data = None
   spline_data = None
+  light_data = None
+  actor_data = None
   splines = SplineListEntry()
   lights = LightsEntry()
   TP2Textures = None
@@ -345,8 +298,7 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
   
   actors = ActorInfoListEntry(None, adef.classes, adef.enums, adef.strings, ActorStringsEntry(), ActorStringsEntry(), aimaps, splines, None)
   
-  for key in blocks.keys():
-    block = blocks[key]
+  for key, block in blocks:
     if key == "INFO":
       lp2_version = sread_u32(lp2data, block + 0x4)
     elif key == "TEX ":
@@ -356,55 +308,37 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
       #lp2data.seek(block - 0x4)
       #texture_data = BytesIO(lp2data.read(texture_block_size + 0x8))
     elif key == "MAT ":
-      lp2data.seek(block)
-      material_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      material_data = BytesIO(lp2data.read(material_block_size + 0x8))
+      material_block_size = lp2data.sread_u32(block)
+      material_data = lp2data.view(block - 0x4, material_block_size + 0x8)
       lp2data.seek(block)
       materials = LevelMaterialsEntry(lp2data)
     elif key == "SECT":
       lp2data.seek(block)
-      geometry = GeometrySection(lp2data, lp2_version, materials.materials)
+      geometry = GeometrySection(lp2data, lp2_version, materials.materials, lazy=True)
     elif key == "AIMP":
-      lp2data.seek(block)
-      aimp_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      aimap_data = BytesIO(lp2data.read(aimp_block_size + 0x8))
+      aimp_block_size = lp2data.sread_u32(block)
+      aimap_data = lp2data.view(block - 0x4, aimp_block_size + 0x8)
     elif key == "NODE":
-      lp2data.seek(block)
-      node_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      node_data = BytesIO(lp2data.read(node_block_size + 0x8))
+      node_block_size = lp2data.sread_u32(block)
+      node_data = lp2data.view(block - 0x4, node_block_size + 0x8)
     elif key == "PVS ":
-      lp2data.seek(block)
-      pvs_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      pvs_data = BytesIO(lp2data.read(pvs_block_size + 0x8))
+      pvs_block_size = lp2data.sread_u32(block)
+      pvs_data = lp2data.view(block - 0x4, pvs_block_size + 0x8)
     elif key == "GRID":
-      lp2data.seek(block)
-      grid_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      grid_data = BytesIO(lp2data.read(grid_block_size + 0x8))
+      grid_block_size = lp2data.sread_u32(block)
+      grid_data = lp2data.view(block - 0x4, grid_block_size + 0x8)
     elif key == "LITE":
-      lp2data.seek(block)
-      light_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      light_data = BytesIO(lp2data.read(light_block_size + 0x8))
+      light_block_size = lp2data.sread_u32(block)
+      light_data = lp2data.view(block - 0x4, light_block_size + 0x8)
     elif key == "ANIM":
-      lp2data.seek(block)
-      anim_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      anim_data = BytesIO(lp2data.read(anim_block_size + 0x8))
+      anim_block_size = lp2data.sread_u32(block)
+      anim_data = lp2data.view(block - 0x4, anim_block_size + 0x8)
     elif key == "ACTR":
-      lp2data.seek(block)
-      actr_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      actor_data = BytesIO(lp2data.read(actr_block_size + 0x8))
+      actr_block_size = lp2data.sread_u32(block)
+      actor_data = lp2data.view(block - 0x4, actr_block_size + 0x8)
     elif key == "SPLN":
-      lp2data.seek(block)
-      spln_block_size = sread_u32(lp2data, lp2data.tell())
-      lp2data.seek(block - 0x4)
-      spline_data = BytesIO(lp2data.read(spln_block_size + 0x8))
+      spln_block_size = lp2data.sread_u32(block)
+      spline_data = lp2data.view(block - 0x4, spln_block_size + 0x8)
   
   if materials == None: materials = LevelMaterialsEntry()
   
@@ -495,7 +429,7 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
   for ob_eval in dynamicInstanceObjects:
     levelInst = LevelModelInstance(None, lp2_version)
     dynamicInstances.append(levelInst)
-    levelInst.transform = Euler((math.radians(-90), 0, 0)).to_matrix().to_4x4() @ ob_eval.matrix_world
+    levelInst.transform = from_mathutils(Euler((math.radians(-90), 0, 0)).to_matrix().to_4x4() @ ob_eval.matrix_world)
     levelInst.inv_transform = levelInst.transform.inverted_safe()
     levelInst.vertex_color_index = 0 if not "Vertex Color Index" in ob_eval else ob_eval["Vertex Color Index"]
     levelInst.effects = 0 if not "Effects" in ob_eval else ob_eval["Effects"]
@@ -545,8 +479,9 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
     texture_index = {}
     for t, img in enumerate(material_textures):
       imgw, imgh = img.size
-      imgdata = list(img.pixels)
-      imgpixels = [[int(imgdata[pxc + ipx] * 255) for pxc in range(img.channels)] for ipx in range(0, len(imgdata), img.channels)]
+      imgdata = np.empty(len(img.pixels), dtype=np.float32)
+      img.pixels.foreach_get(imgdata)
+      imgpixels = (imgdata.reshape(-1, img.channels) * 255).astype(np.uint8)
       texture_index[img.name] = len(TP2Textures.textures)
       TP2Textures.add_texture(img.name, imgw, imgh, imgpixels)
     
@@ -760,65 +695,51 @@ def save(context, filepath="", save_mesh_changes=False, save_collision_changes=F
   print(actors.AStringEntry.table)
   print(actors.PStringEntry.table)
   
-  gmesh_data = BytesIO()
-  write_magic_str(gmesh_data, 0x0, "GMSH", 4)
-  write_u32(gmesh_data, 0x4, 0)
+  lp2_data = BinaryWriter()
+  level_offset = lp2_data.begin_block("LEVL")
+  lp2_data.write_magic_str("INFO", 4)
+  lp2_data.swrite_u32(4)
+  lp2_data.swrite_u32(lp2_version)
   
-  if TP2Textures != None: write_bytes(gmesh_data, gmesh_data.tell(), TP2Textures.save_changes("TEX ").read())
-  if anim_data != None: write_bytes(gmesh_data, gmesh_data.tell(), anim_data.read())
-  #if material_data != None: write_bytes(gmesh_data, gmesh_data.tell(), material_data.read())
-  if materials != None: write_bytes(gmesh_data, gmesh_data.tell(), materials.save_changes().read())
-  geometry_data = None
+  gmesh_offset = lp2_data.begin_block("GMSH")
+  if TP2Textures != None: TP2Textures.save_changes("TEX ", lp2_data)
+  if anim_data != None: lp2_data.write(anim_data)
+  #if material_data != None: lp2_data.write(material_data)
+  if materials != None: materials.save_changes(lp2_data)
   if geometry != None:
     if save_dynamic_instance_changes:
       geometry.dynamic_model_instances = dynamicInstances.copy()
-    geometry_data = geometry.save_injected_changes(lp2_version)
-  if geometry_data != None: write_bytes(gmesh_data, gmesh_data.tell(), geometry_data.read())
-  if node_data != None: write_bytes(gmesh_data, gmesh_data.tell(), node_data.read())
-  if pvs_data != None: write_bytes(gmesh_data, gmesh_data.tell(), pvs_data.read())
-  if save_aimap_changes: aimap_data = aimaps.save_changes()
-  if aimap_data != None: write_bytes(gmesh_data, gmesh_data.tell(), aimap_data.read())
-  if grid_data != None: write_bytes(gmesh_data, gmesh_data.tell(), grid_data.read())
-  write_magic_str(gmesh_data, gmesh_data.tell(), "END ", 4)
-  write_u32(gmesh_data, gmesh_data.tell(), 0)
-  gmesh_data.seek(0)
-  write_u32(gmesh_data, 0x4, swap32(data_len(gmesh_data) - 8))
-  gmesh_data.seek(0)
-  
-  if save_spline_changes:
-    spline_data = splines.save_changes()
+    geometry.save_injected_changes(lp2_version, lp2_data)
+  if node_data != None: lp2_data.write(node_data)
+  if pvs_data != None: lp2_data.write(pvs_data)
+  if save_aimap_changes: aimaps.save_changes(lp2_data)
+  elif aimap_data != None: lp2_data.write(aimap_data)
+  if grid_data != None: lp2_data.write(grid_data)
+  lp2_data.write_magic_str("END ", 4)
+  lp2_data.swrite_u32(0)
+  lp2_data.end_block(gmesh_offset)
+  
+  if save_spline_changes: splines.save_changes(lp2_data)
+  elif spline_data != None: lp2_data.write(spline_data)
+  if save_light_changes: lights.save_changes(lp2_data)
+  elif light_data != None: lp2_data.write(light_data)
   
   if save_actor_changes:
-    actor_data = BytesIO()
-    write_magic_str(actor_data, 0x0, "ACTR", 4)
-    write_u32(actor_data, 0x4, 0)
-    astring_data = actors.AStringEntry.save_changes("ASTR")
-    write_bytes(actor_data, actor_data.tell(), astring_data.read())
-    pstring_data = actors.PStringEntry.save_changes("PSTR")
-    write_bytes(actor_data, actor_data.tell(), pstring_data.read())
-    write_bytes(actor_data, actor_data.tell(), actors.save_changes().read())
-    write_magic_str(actor_data, actor_data.tell(), "END ", 4)
-    write_u32(actor_data, actor_data.tell(), 0)
-    actor_data.seek(0)
-    write_u32(actor_data, 0x4, swap32(data_len(actor_data) - 8))
-    actor_data.seek(0)
-  
-  lp2_data = BytesIO()
-  write_magic_str(lp2_data, 0x0, "LEVL", 4)
-  write_u32(lp2_data, 0x4, 0)
-  write_magic_str(lp2_data, lp2_data.tell(), "INFO", 4)
-  write_u32(lp2_data, lp2_data.tell(), swap32(4))
-  write_u32(lp2_data, lp2_data.tell(), swap32(lp2_version))
-  write_bytes(lp2_data, lp2_data.tell(), gmesh_data.read())
-  write_bytes(lp2_data, lp2_data.tell(), spline_data.read())
-  if save_light_changes: light_data = lights.save_changes()
-  if light_data != None: write_bytes(lp2_data, lp2_data.tell(), light_data.read())
-  write_bytes(lp2_data, lp2_data.tell(), actor_data.read())
-  write_magic_str(lp2_data, lp2_data.tell(), "END ", 4)
-  write_u32(lp2_data, lp2_data.tell(), 0)
-  lp2_data.seek(0)
-  write_u32(lp2_data, 0x4, swap32(data_len(lp2_data) - 8))
-  lp2_data.seek(0)
+    actor_offset = lp2_data.begin_block("ACTR")
+    actors.AStringEntry.save_changes("ASTR", lp2_data)
+    actors.PStringEntry.save_changes("PSTR", lp2_data)
+    actors.save_changes(lp2_data)
+    lp2_data.write_magic_str("END ", 4)
+    lp2_data.swrite_u32(0)
+    lp2_data.end_block(actor_offset)
+  elif actor_data != None: lp2_data.write(actor_data)
+  
+  lp2_data.write_magic_str("END ", 4)
+  lp2_data.swrite_u32(0)
+  lp2_data.end_block(level_offset)
+  
+  output = lp2_data.buffer
+  if compress_output: output = compress(output, compression_level)
   
   with open(filepath, "wb") as f:
-    f.write(lp2_data.read())
+    f.write(output)
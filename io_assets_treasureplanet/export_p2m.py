@@ -2,6 +2,7 @@ from io import BytesIO
 import os
 import sys
 import math
+import numpy as np
 from pathlib import Path
 
 current_dir = Path(os.path.dirname(__file__))
@@ -12,10 +13,12 @@ import bmesh
 from mathutils import Vector, Matrix, Quaternion, Euler
 
 from fs_helpers import *
+from chunks import ChunkIndex, P2M_CONTAINERS, P2M_CHUNKS
 from textures import TextureListEntry
 from p2m import ModelBounds, ModlMaterialsEntry, ModelEntry, ModlMaterialEntry
 from tristripper import TriangleStripper, PrimitiveType, triangle_from_strip_to_triangle_list
 from tp2 import reduce_colors
+from compress import compress, DEFAULT_COMPRESSION_LEVEL
 
 try:
     from decompress import *
@@ -23,43 +26,18 @@ try:
 except ImportError:
     has_decompress = False
 
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic.startswith("P2M"):
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic == "SETT" or magic == "TEXT" or magic == "MATL" or magic.startswith("MODL"):
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
-
-def save(context, filepath="", use_selection=False):
+def save(context, filepath="", use_selection=False, compress_output=False, compression_level=DEFAULT_COMPRESSION_LEVEL):
   p2mdata = None
   magic = None
   if os.path.exists(filepath):
     with open(filepath, 'rb') as f:
-      p2mdata = BytesIO(f.read())
+      p2mdata = read_data(f) if has_decompress else BinaryReader(f.read())
       magic = try_read_str(p2mdata, 0, 4)
       p2mdata.seek(0)
-      if magic is not None:
-        if magic.startswith("PK2") and has_decompress:
-          d = Decompressor(BytesIO(p2mdata.read()))
-          d.decompressed.seek(0)
-          p2mdata = BytesIO(d.decompressed.read())
   
-  blocks = {}
+  blocks = []
   if p2mdata != None:
-    find_blocks(p2mdata, blocks)
+    blocks = ChunkIndex(p2mdata, P2M_CONTAINERS, P2M_CHUNKS).blocks()
     print(blocks)
   
   TP2Textures = None
@@ -68,8 +46,7 @@ def save(context, filepath="", use_selection=False):
   P2MModel = None
   P2MVersion = 5
   P2MName = os.path.splitext(os.path.basename(filepath))[0]
-  for key in blocks.keys():
-    block = blocks[key]
+  for key, block in blocks:
     if key == "INFO":
       P2MVersion = sread_u32(p2mdata, block + 0x4)
     elif key == "SETT":
@@ -188,24 +165,25 @@ def save(context, filepath="", use_selection=False):
   output_materials = list(set(output_materials))
   material_textures = list(set([n.image for m in output_materials for n in m.node_tree.nodes if n.type == 'TEX_IMAGE']))
   
-  bounds_data = P2MBounds.save_changes()
+  output_data = BinaryWriter()
+  p2m_offset = output_data.begin_block("P2M ")
+  output_data.write_magic_str("INFO", 4)
+  output_data.swrite_u32(4)
+  output_data.swrite_u32(P2MVersion)
+  P2MBounds.save_changes(output_data)
   
-  texture_data = BytesIO()
-  write_magic_str(texture_data, 0x0, "TEXT", 4)
-  write_u32(texture_data, 0x4, 0)
-  write_u32(texture_data, 0x8, swap32(len(material_textures)))
-  text_block_size = 4
+  text_offset = output_data.begin_block("TEXT")
+  output_data.swrite_u32(len(material_textures))
   texture_index = {}
   for t, img in enumerate(material_textures):
     imgw, imgh = img.size
-    imgdata = list(img.pixels)
-    imgpixels = [[int(imgdata[pxc + ipx] * 255) for pxc in range(img.channels)] for ipx in range(0, len(imgdata), img.channels)]
+    imgdata = np.empty(len(img.pixels), dtype=np.float32)
+    img.pixels.foreach_get(imgdata)
+    imgpixels = (imgdata.reshape(-1, img.channels) * 255).astype(np.uint8)
     tp2_data = reduce_colors(imgpixels, imgw, imgh, img.name)
     texture_index[img.name] = t
-    texture_data.write(tp2_data.read())
-    text_block_size += data_len(tp2_data)
-  write_u32(texture_data, 0x4, swap32(text_block_size))
-  texture_data.seek(0)
+    output_data.write(tp2_data.getvalue())
+  output_data.end_block(text_offset)
   
   P2MMaterial = ModlMaterialsEntry()
   material_index = {}
@@ -217,52 +195,37 @@ def save(context, filepath="", use_selection=False):
       if n.type != 'TEX_IMAGE': continue
       output_material.addProperty(texture_index[n.image.name], 0x1, 0x0, 0x0)
     P2MMaterial.materials.append(output_material)
-  material_data = P2MMaterial.save_changes()
+  P2MMaterial.save_changes(output_data)
   
-  model_data = BytesIO()
-  write_magic_str(model_data, 0x0, "MODL", 4)
-  write_u32(model_data, model_data.tell(), 0)
-  write_u32(model_data, model_data.tell(), swap32(len(mesh_sections)))
+  model_offset = output_data.begin_block("MODL")
+  output_data.swrite_u32(len(mesh_sections))
   for sm in mesh_sections.keys():
     submesh = mesh_sections[sm]
-    write_u32(model_data, model_data.tell(), swap32(len(submesh)))
+    output_data.swrite_u32(len(submesh))
     for lm in submesh.keys():
       lodmesh = submesh[lm]
-      write_float(model_data, model_data.tell(), swapfloat(lodmesh[1]))
-      write_u32(model_data, model_data.tell(), swap32(len(lodmesh[0])))
+      output_data.swrite_float(lodmesh[1])
+      output_data.swrite_u32(len(lodmesh[0]))
       lod_strip_count = 0
       for mm in lodmesh[0].keys():
         matmesh = lodmesh[0][mm]
         lod_strip_count += len(matmesh)
-        #write_u32(model_data, model_data.tell(), swap32(int(mm.split("_mat_")[1])))
-        write_u32(model_data, model_data.tell(), swap32(material_index[mm]))
-        write_u32(model_data, model_data.tell(), swap32(len(matmesh)))
+        #output_data.swrite_u32(int(mm.split("_mat_")[1]))
+        output_data.swrite_u32(material_index[mm])
+        output_data.swrite_u32(len(matmesh))
         for strip in matmesh:
-          write_u32(model_data, model_data.tell(), swap32(len(strip)))
-          for vert, norm, uv, flag in strip:
-            for co in vert: write_float(model_data, model_data.tell(), swapfloat(co))
-            for co in norm: write_float(model_data, model_data.tell(), swapfloat(co))
-            for co in uv: write_float(model_data, model_data.tell(), swapfloat(co))
-            write_u32(model_data, model_data.tell(), swap32(flag))
+          output_data.swrite_u32(len(strip))
+          output_data.swrite_records("8fI", [(*vert, *norm, *uv, flag) for vert, norm, uv, flag in strip])
       print("Strip count: %d" % lod_strip_count)
-  write_u32(model_data, 0x4, swap32(data_len(model_data)-0x8))
-  model_data.seek(0)
+  output_data.end_block(model_offset)
+  
+  output_data.write_magic_str("END ", 4)
+  output_data.swrite_u32(0)
+  output_data.end_block(p2m_offset)
   
-  output_data = BytesIO()
-  write_magic_str(output_data, 0x0, "P2M ", 4)
-  write_u32(output_data, 0x4, 0)
-  write_magic_str(output_data, output_data.tell(), "INFO", 4)
-  write_u32(output_data, output_data.tell(), swap32(4))
-  write_u32(output_data, output_data.tell(), swap32(P2MVersion))
-  output_data.write(bounds_data.read())
-  output_data.write(texture_data.read())
-  output_data.write(material_data.read())
-  output_data.write(model_data.read())
-  write_magic_str(output_data, output_data.tell(), "END ", 4)
-  write_u32(output_data, output_data.tell(), 0)
-  write_u32(output_data, 0x4, swap32(data_len(output_data)-8))
-  output_data.seek(0)
+  output = output_data.buffer
+  if compress_output: output = compress(output, compression_level)
   
   with open(filepath, "wb") as f:
-    f.write(output_data.read())
+    f.write(output)
   #print(mesh_sections)
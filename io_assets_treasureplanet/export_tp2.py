@@ -21,13 +21,8 @@ def save(context, filepath="", use_selection=False):
   magic = None
   if os.path.exists(filepath):
     with open(filepath, 'rb') as f:
-      filedata = BytesIO(f.read())
+      filedata = read_data(f) if has_decompress else BinaryReader(f.read())
       magic = try_read_str(filedata, 0, 4)
       filedata.seek(0)
-      if magic is not None:
-        if magic.startswith("PK2") and has_decompress:
-          d = Decompressor(BytesIO(filedata.read()))
-          d.decompressed.seek(0)
-          filedata = BytesIO(d.decompressed.read())
   
   
@@ -10,6 +10,9 @@ print(str(current_dir))
 sys.path.insert(1, os.path.join(current_dir.absolute(), "tp_utils"))
 
 from fs_helpers import *
+from chunks import ChunkIndex, LP2_CONTAINERS, LP2_CHUNKS
+from batch import prepare_files
+from mesh_builder import build_mesh, material_slots, range_loop_uvs, set_material_indices, add_uv_layer, add_color_layer
 
 try:
     from decompress import *
@@ -20,12 +23,15 @@ except ImportError:
 print("Decompressor: %d" % int(has_decompress))
 
 import bpy
+from bpy.app.handlers import persistent
 from mathutils import Vector, Matrix, Quaternion, Euler
 
 from adef import ActorStringsEntry
 from textures import TextureListEntry, AnimatedTexturesEntry
 
 from lp2 import LightsEntry, SplineListEntry, AIMapListEntry, ActorInfoListEntry, Models, GeometrySection, LevelMaterialsEntry, load_adef, PVS, Grid, NodeTree
+from linalg import to_mathutils, from_mathutils
+from collision import CollisionWorld, CollisionGrid
 
 import json
 
@@ -40,27 +46,22 @@ def create_actor(adef, class_name, asset_root = None, transform=Matrix()):
   actor = actors.create_new_actor(transform, class_name)
   return (actor, actors)
 
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic == "LEVL" or magic == "GMSH" or magic == "ACTR":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic.startswith("TEX") or magic == "ANIM" or magic == "MAT " or magic == "SECT" or magic == "NODE" or magic == "PVS " or magic == "AIMP" or magic == "GRID" or magic == "SPLN" or magic == "LITE" or magic == "ASTR" or magic == "PSTR" or magic == "AINF":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
+# Level name -> CollisionGrid over the collision of every instance, kept up to date as instances move
+collision_indices = {}
 
-def load_lp2(data, name, adef, asset_root):
+@persistent
+def update_collision_indices(scene, depsgraph):
+  if len(collision_indices) == 0: return
+  for update in depsgraph.updates:
+    if not update.is_updated_transform or not isinstance(update.id, bpy.types.Object): continue
+    for collision_index in collision_indices.values():
+      instance = collision_index.objects.get(update.id.name)
+      if instance == None: continue
+      is_dynamic, model_index = instance
+      transform = from_mathutils(Euler((math.radians(-90), 0, 0)).to_matrix().to_4x4() @ update.id.matrix_world)
+      collision_index.move_instance(is_dynamic, model_index, transform)
+
+def load_lp2(data, name, adef, asset_root, prepared=None):
   for ob in bpy.context.selected_objects: ob.select_set(False)
   
   ModelDirectory = None
@@ -72,8 +73,7 @@ def load_lp2(data, name, adef, asset_root):
   
   root_magic = try_read_str(data, 0, 4)
   
-  blocks = {}
-  find_blocks(data, blocks)
+  blocks = ChunkIndex(data, LP2_CONTAINERS, LP2_CHUNKS).blocks()
   print(blocks)
   
   from . import import_tp2
@@ -88,7 +88,9 @@ def load_lp2(data, name, adef, asset_root):
   splines = None
   aimaps = None
   geometry = None
+  grid = None
   nodetree = None
+  instance_objects = {}
   collisionMeshes = []
   
   actorMeshes = {}
@@ -108,14 +110,12 @@ def load_lp2(data, name, adef, asset_root):
     out = att;
 }""")
   
-  for key in blocks.keys():
-    block = blocks[key]
+  for key, block in blocks:
     if key == "INFO":
       lp2_version = sread_u32(data, block + 0x4)
     elif key == "TEX ":
       TP2Textures = TextureListEntry(block, data, name)
-      for texture in TP2Textures.textures:
-        textures.append(import_tp2.load_tp2(texture.read(), texture.name))
+      textures.extend(import_tp2.load_texture_list(TP2Textures, prepared.textures.get(block) if prepared != None else None))
     elif key == "ANIM":
       data.seek(block)
       animated_textures = AnimatedTexturesEntry(data, textures)
@@ -157,7 +157,7 @@ def load_lp2(data, name, adef, asset_root):
           bpylight.show_cone = True
         bpyob = bpy.data.objects.new(bpylight.name, bpylight)
         light_collection.objects.link(bpyob)
-        bpyob.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ matrix @ Euler((math.radians(180), 0, 0)).to_matrix().to_4x4()
+        bpyob.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(matrix) @ Euler((math.radians(180), 0, 0)).to_matrix().to_4x4()
         bpyob["_lp2_type"] = '%sLight' % _type
     elif key == "SPLN":
       data.seek(block)
@@ -177,7 +177,7 @@ def load_lp2(data, name, adef, asset_root):
         curveOB = bpy.data.objects.new('Spline %d' % s, curveData)
         curveData.bevel_depth = 0.4
         spline_collection.objects.link(curveOB)
-        curveOB.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ transform
+        curveOB.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(transform)
         curveOB["_lp2_type"] = "Spline"
     elif key == "ASTR" or key == "PSTR":
       data.seek(block)
@@ -298,7 +298,7 @@ def load_lp2(data, name, adef, asset_root):
       mesh.materials.append(pvs_material)
       mesh.attributes.new(name="Face Flags", type='FLOAT', domain='FACE')
       for cf, cell_flag in enumerate(pvs_cell_flags): mesh.attributes["Face Flags"].data[cf].value = cell_flag[0]
-      obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ transform
+      obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(transform)
       obj.select_set(False)
     elif key == "AIMP":
       data.seek(block)
@@ -425,7 +425,7 @@ def load_lp2(data, name, adef, asset_root):
         for eb, edge_block in enumerate(edge_blocks):
           mesh.attributes["Edge Blocks 1"].data[eb].value = edge_block[0]
           mesh.attributes["Edge Blocks 2"].data[eb].value = edge_block[-1]
-        obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ transform
+        obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(transform)
         obj.select_set(False)
         if a >= len(edge_planes): continue
         for t, plane_transform in enumerate(edge_planes[a]):
@@ -472,7 +472,7 @@ def load_lp2(data, name, adef, asset_root):
         obj["Actor Name"] = actor.name
         actor_collection.objects.link(obj)
         #bpy.context.view_layer.objects.active = obj
-        obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ actor.transform
+        obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(actor.transform)
         
         model_paths = actor.get_models()
         
@@ -657,7 +657,7 @@ def load_lp2(data, name, adef, asset_root):
       for c, collSect in enumerate(geometry.collision_sections):
         section_vertices, section_indices, section_triNormals, vertex_groups, coll_layers = collSect.get_geometry_per_section()
         mesh = bpy.data.meshes.new(name="Collision Mesh %d" % (c))
-        mesh.from_pydata(section_vertices, [], section_indices)
+        build_mesh(mesh, section_vertices, section_indices)
         mesh.update()
         mesh.validate()
         collisionMeshes.append((mesh, vertex_groups, coll_layers))
@@ -669,18 +669,13 @@ def load_lp2(data, name, adef, asset_root):
       bpy_materials = {}
       renderMeshes = []
       for r, rendSect in enumerate(geometry.render_sections):
-        section_vertices, section_normals, section_faces, section_colors, material_uvs, vertex_groups = rendSect.get_section_geometry()
+        section_vertices, section_normals, section_faces, section_colors, material_ranges, vertex_groups = rendSect.get_section_geometry()
         mesh = bpy.data.meshes.new(name="Render Mesh %d" % r)
-        mesh.from_pydata(section_vertices, [], section_faces)
-        per_mesh_materials = {}
+        build_mesh(mesh, section_vertices, section_faces)
 
-        uv_layers = []
-        for mat_index in material_uvs.keys():
-          face_offset, offset, face_len, mat_uvs = material_uvs[mat_index]
-          for lay, uv_map in enumerate(mat_uvs):
-            if lay == len(uv_layers): uv_layers.append(mesh.uv_layers.new())
-            for u, mat_uv in enumerate(uv_map): uv_layers[lay].data[offset+u].uv = mat_uv
-          
+        for loop_uvs in range_loop_uvs(material_ranges, len(section_faces)): add_uv_layer(mesh, loop_uvs)
+        mesh_materials, face_slots = material_slots(material_ranges, len(section_faces))
+        for mat_index in mesh_materials:
           lp2_material = materials.materials[mat_index]
           
           if not mat_index in bpy_materials:
@@ -781,21 +776,13 @@ def load_lp2(data, name, adef, asset_root):
             #  texture_associations[mat_property.type].append(mat_property.texture_index)
           #material_configurations.append(tuple(material_config))
 
-          if not mat_index in per_mesh_materials:
-            bpy_index = len(mesh.materials)
-            per_mesh_materials[mat_index] = bpy_index
-          else: bpy_index = per_mesh_materials[mat_index]
-          
-          faces = [f for f in mesh.polygons if f.index >= face_offset and f.index < face_offset + face_len]
-          for face in faces: face.material_index = bpy_index
           mesh.materials.append(bpy_material)
+        set_material_indices(mesh, face_slots)
         
         if rendSect.color_maps > 0:
           for chan, section_color in enumerate(section_colors):
             if len(section_color) == 0: continue
-            vcol_lay = mesh.vertex_colors.new()
-            for sc, col in enumerate(vcol_lay.data):
-              col.color = list(reversed(section_color[sc][0:3])) + [section_color[sc][3]]
+            add_color_layer(mesh, section_color[:, [2, 1, 0, 3]])
           
           #for chan, section_color in enumerate(section_colors):
           #  if len(section_color) == 0: continue
@@ -824,11 +811,12 @@ def load_lp2(data, name, adef, asset_root):
         iobj = bpy.data.objects.new("Model %d" % i, None)
         models_collection.objects.link(iobj)
         #bpy.context.view_layer.objects.active = iobj
-        transform = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ inst.transform
+        transform = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(inst.transform)
         iobj.matrix_world = transform
         iobj["Vertex Color Index"] = inst.vertex_color_index
         iobj["Effects"] = inst.effects
         iobj["_lp2_type"] = "Static Instance"
+        instance_objects[iobj.name] = (False, i)
         
         for r, render_instance in enumerate(inst.render_instances):
           rend_sect_index = render_instance.sect_index
@@ -839,7 +827,7 @@ def load_lp2(data, name, adef, asset_root):
             vgroup = obj.vertex_groups.new(name="sub%d" % v)
             vgroup.add(gindices, 1.0, 'REPLACE')
           if not mesh.name in renderMeshObjects: renderMeshObjects[mesh.name] = obj
-          obj["bounds"] = render_instance.max - render_instance.min
+          obj["bounds"] = to_mathutils(render_instance.max - render_instance.min)
           obj["Vertex Color Index"] = inst.vertex_color_index
           models_collection.objects.link(obj)
           obj.parent = iobj
@@ -897,7 +885,7 @@ def load_lp2(data, name, adef, asset_root):
             vgroup.add(gindices, 1.0, 'REPLACE')
             obj["sub%d_layer" % v] = coll_layers[v]
           
-          obj["bounds"] = coll_instance.max - coll_instance.min
+          obj["bounds"] = to_mathutils(coll_instance.max - coll_instance.min)
           models_collection.objects.link(obj)
           collision_collection.objects.link(obj)
           obj.parent = iobj
@@ -908,11 +896,12 @@ def load_lp2(data, name, adef, asset_root):
         iobj = bpy.data.objects.new("Dynamic Model %d" % i, None)
         dynamic_models_collection.objects.link(iobj)
         #bpy.context.view_layer.objects.active = iobj
-        transform = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ inst.transform
+        transform = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(inst.transform)
         iobj.matrix_world = transform
         iobj["Vertex Color Index"] = inst.vertex_color_index
         iobj["Effects"] = inst.effects
         iobj["_lp2_type"] = "Dynamic Instance"
+        instance_objects[iobj.name] = (True, i)
         for r, render_instance in enumerate(inst.render_instances):
           rend_sect_index = render_instance.sect_index
           mesh, vertex_groups = renderMeshes[rend_sect_index]
@@ -922,7 +911,7 @@ def load_lp2(data, name, adef, asset_root):
             vgroup = obj.vertex_groups.new(name="sub%d" % v)
             vgroup.add(gindices, 1.0, 'REPLACE')
           if not mesh.name in renderMeshObjects: renderMeshObjects[mesh.name] = obj
-          obj["bounds"] = render_instance.max - render_instance.min
+          obj["bounds"] = to_mathutils(render_instance.max - render_instance.min)
           obj["Vertex Color Index"] = inst.vertex_color_index
           dynamic_models_collection.objects.link(obj)
           obj.parent = iobj
@@ -979,15 +968,20 @@ def load_lp2(data, name, adef, asset_root):
             vgroup = obj.vertex_groups.new(name="sub%d" % v)
             vgroup.add(gindices, 1.0, 'REPLACE')
             obj["sub%d_layer" % v] = coll_layers[v]
-          obj["bounds"] = coll_instance.max - coll_instance.min
+          obj["bounds"] = to_mathutils(coll_instance.max - coll_instance.min)
           dynamic_models_collection.objects.link(obj)
           dynamic_collision_collection.objects.link(obj)
           obj.parent = iobj
           obj.hide_set(not obj.hide_get())
           #obj.matrix_world = transform
+  
+  if geometry != None:
+    # Cells as wide as the level's own Grid chunk cells when it has one
+    collision_indices[name] = CollisionGrid(CollisionWorld(geometry), grid.scale if grid != None else None)
+    collision_indices[name].objects = instance_objects
   bpy.context.scene.render.engine = 'BLENDER_EEVEE'
 
-def load(operator, context, filepath=""):
+def load(operator, context, filepath="", prepared=None):
   filedata = None
   
   #adef_data = None
@@ -998,16 +992,16 @@ def load(operator, context, filepath=""):
   #  adef_data = BytesIO(f.read())
   #  adef_data.seek(0)
   #adef = Adef(adef_data)
+  
+  if prepared != None:
+    load_lp2(BinaryReader(prepared.data), prepared.name, adef, filepath.split("LEVELS")[0], prepared)
+    return {'FINISHED'}
       
   with open(filepath, 'rb') as f:
-    filedata = BytesIO(f.read())
+    filedata = read_data(f) if has_decompress else BinaryReader(f.read())
     magic = try_read_str(filedata, 0, 4)
     filedata.seek(0)
     if magic is not None:
-      if magic.startswith("PK2") and has_decompress:
-        d = Decompressor(BytesIO(filedata.read()))
-        d.decompressed.seek(0)
-        filedata = BytesIO(d.decompressed.read())
       load_lp2(filedata, os.path.splitext(os.path.basename(f.name))[0], adef, filepath.split("LEVELS")[0])
   if filedata == None: return {'CANCELLED'}
   return {'FINISHED'}
@@ -9,6 +9,9 @@ current_dir = Path(os.path.dirname(__file__))
 sys.path.insert(1, os.path.join(current_dir.absolute(), "tp_utils"))
 
 from fs_helpers import *
+from chunks import ChunkIndex, P2M_CONTAINERS, P2M_CHUNKS
+from batch import prepare_files
+from mesh_builder import build_mesh, material_slots, range_loop_uvs, set_material_indices, add_uv_layer
 
 try:
     from decompress import *
@@ -16,6 +19,7 @@ try:
 except ImportError:
     has_decompress = False
 
+import numpy as np
 import bpy
 from bpy_extras.io_utils import unpack_list
 from mathutils import Vector
@@ -23,30 +27,9 @@ from mathutils import Vector
 from textures import TextureListEntry
 from p2m import ModelBounds, ModlMaterialsEntry, ModelEntry
 
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic.startswith("P2M"):
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic == "SETT" or magic == "TEXT" or magic == "MATL" or magic.startswith("MODL"):
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
-
-def load_p2m(data, name):
+def load_p2m(data, name, prepared=None):
   root_magic = try_read_str(data, 0, 4)
-  blocks = {}
-  find_blocks(data, blocks)
+  blocks = ChunkIndex(data, P2M_CONTAINERS, P2M_CHUNKS).blocks()
   
   from . import import_tp2
   textures = []
@@ -54,8 +37,7 @@ def load_p2m(data, name):
   P2MMaterial = None
   p2m_version = 0
   models = []
-  for key in blocks.keys():
-    block = blocks[key]
+  for key, block in blocks:
     if key == "INFO":
       p2m_version = sread_u32(data, block + 0x4)
     elif key == "SETT":
@@ -63,27 +45,28 @@ def load_p2m(data, name):
       P2MBounds = ModelBounds(data)
     elif key == "TEXT":
       TP2Textures = TextureListEntry(block, data, name)
-      for texture in TP2Textures.textures:
-        textures.append(import_tp2.load_tp2(texture.read(), texture.name))
+      textures.extend(import_tp2.load_texture_list(TP2Textures, prepared.textures.get(block) if prepared != None else None))
     elif key == "MATL":
       data.seek(block)
       P2MMaterial = ModlMaterialsEntry(data)
     elif key == "MODL":
-      data.seek(block)
-      P2MModel = ModelEntry(data, name)
+      if prepared != None and block in prepared.models: lod_geometry = prepared.models[block]
+      else:
+        data.seek(block)
+        P2MModel = ModelEntry(data, name)
+        lod_geometry = [P2MModel.get_model_geometry(i) for i in range(max(P2MModel.lod_counts))]
       if True:
         bpy_materials = {}
-        for i in range(max(P2MModel.lod_counts)):
-          mesh_vertices, mesh_normals, mesh_faces, material_uvs, vertex_groups, lod_radii = P2MModel.get_model_geometry(i)
+        for i, (mesh_vertices, mesh_normals, mesh_faces, material_ranges, vertex_groups, lod_radii) in enumerate(lod_geometry):
           mesh = bpy.data.meshes.new(name="%s_lod%d" % (name, i))
-          mesh.from_pydata(mesh_vertices, [], mesh_faces)
-          per_mesh_materials = {}
+          build_mesh(mesh, mesh_vertices, mesh_faces)
           #mesh.vertices.foreach_set("normal", [n for nv in mesh_normals for n in nv])
           
-          uv_layer = mesh.uv_layers.new()
-          for mat_index in material_uvs.keys():
-            face_offset, offset, face_len, mat_uvs = material_uvs[mat_index]
-            for u, mat_uv in enumerate(mat_uvs): uv_layer.data[offset+u].uv = mat_uv
+          for loop_uvs in range_loop_uvs(material_ranges, len(mesh_faces)): add_uv_layer(mesh, loop_uvs)
+          mesh_materials, face_slots = material_slots(material_ranges, len(mesh_faces))
+          # Faces of materials without a texture stay on the first material slot
+          bpy_indices = np.zeros(len(mesh_materials), dtype=np.int32)
+          for slot, mat_index in enumerate(mesh_materials):
             if P2MMaterial == None: continue
             p2m_material = P2MMaterial.materials[mat_index]
             if p2m_material.properties[0].texture_index < 0xff:
@@ -111,14 +94,9 @@ def load_p2m(data, name):
                 if mat_property.texture_index < 0xff: bpy_material["prop_%d_texture"%prop] = textures[mat_property.texture_index].name
                 bpy_material["prop_%d"%prop] = Vector([mat_property.texture_index, mat_property.type, mat_property.col_sel, mat_property.flags])
               
-              if not mat_index in per_mesh_materials:
-                bpy_index = len(mesh.materials)
-                per_mesh_materials[mat_index] = bpy_index
-              else: bpy_index = per_mesh_materials[mat_index]
-              
-              faces = [f for f in mesh.polygons if f.index >= face_offset and f.index < face_offset + face_len]
-              for face in faces: face.material_index = bpy_index
+              bpy_indices[slot] = len(mesh.materials)
               mesh.materials.append(bpy_material)
+          set_material_indices(mesh, bpy_indices[face_slots])
           
           mesh.update()
           mesh.validate()
@@ -143,19 +121,16 @@ def load_p2m(data, name):
 def try_decompress_p2m(filepath):
   model = None
   with open(filepath, 'rb') as f:
-    filedata = BytesIO(f.read())
+    filedata = read_data(f) if has_decompress else BinaryReader(f.read())
     magic = try_read_str(filedata, 0, 4)
     filedata.seek(0)
     if magic is not None:
-      if magic.startswith("PK2") and has_decompress:
-        d = Decompressor(BytesIO(filedata.read()))
-        d.decompressed.seek(0)
-        filedata = BytesIO(d.decompressed.read())
       model = load_p2m(filedata, os.path.splitext(os.path.basename(f.name))[0])
   return model
 
-def load(operator, context, filepath=""):
+def load(operator, context, filepath="", prepared=None):
   filedata = None
-  model = try_decompress_p2m(filepath)
+  if prepared != None: model = load_p2m(BinaryReader(prepared.data), prepared.name, prepared)
+  else: model = try_decompress_p2m(filepath)
   if model == None: return {'CANCELLED'}
   return {'FINISHED'}
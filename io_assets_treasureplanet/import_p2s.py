@@ -16,35 +16,16 @@ except ImportError:
 
 import bpy
 from fs_helpers import *
+from chunks import ChunkIndex, P2S_CONTAINERS, P2S_CHUNKS
 from textures import TextureListEntry
 
 from mathutils import Vector, Matrix, Euler
 
+from linalg import to_mathutils
 from p2s import SkelMaterialsEntry, SkelModelEntry, JointListEntry, SkeletonEntry, CyclesEntry
 
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic.startswith("P2S"):
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic == "SETT" or magic == "TEXT" or magic == "MATL" or magic == "SKEL" or magic == "CYCL" or magic == "JNTL" or magic == "MODL":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
-
 def load_p2s(data, name):
-  blocks = {}
-  find_blocks(data, blocks)
+  blocks = ChunkIndex(data, P2S_CONTAINERS, P2S_CHUNKS).blocks()
   
   from . import import_tp2
   textures = []
@@ -54,8 +35,7 @@ def load_p2s(data, name):
   P2SJoints = None
   P2SCycles = None
   p2s_version = 0
-  for key in blocks.keys():
-    block = blocks[key]
+  for key, block in blocks:
     if key == "INFO":
       p2s_version = sread_u32(data, block + 0x4)
     elif key == "TEXT":
@@ -83,8 +63,8 @@ def load_p2s(data, name):
         obj.empty_display_size = 0.01
         if bone.parent != None:
           obj.parent = blender_bones[bone.parent.bone_index]
-          obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ bone.parent.transform
-        obj.matrix_world = obj.matrix_world @ Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ bone.transform#Matrix.Translation(bone.floats)
+          obj.matrix_world = Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(bone.parent.transform)
+        obj.matrix_world = obj.matrix_world @ Euler((math.radians(90), 0, 0)).to_matrix().to_4x4() @ to_mathutils(bone.transform)#Matrix.Translation(bone.floats)
     elif key == "CYCL":
       data.seek(block)
       P2SCycles = CyclesEntry(data, name, P2SSkeleton.bone_count)
@@ -114,14 +94,10 @@ def load(operator, context, filepath=""):
   filedata = None
       
   with open(filepath, 'rb') as f:
-    filedata = BytesIO(f.read())
+    filedata = read_data(f) if has_decompress else BinaryReader(f.read())
     magic = try_read_str(filedata, 0, 4)
     filedata.seek(0)
     if magic is not None:
-      if magic.startswith("PK2") and has_decompress:
-        d = Decompressor(BytesIO(filedata.read()))
-        d.decompressed.seek(0)
-        filedata = BytesIO(d.decompressed.read())
       model = load_p2s(filedata, os.path.splitext(os.path.basename(f.name))[0])
   if filedata == None: return {'CANCELLED'}
   return {'FINISHED'}
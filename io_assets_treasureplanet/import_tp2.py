@@ -9,6 +9,8 @@ sys.path.insert(1, os.path.join(current_dir.absolute(), "tp_utils"))
 
 from fs_helpers import *
 from tp2 import read_tp2
+from texture_cache import read_tp2_cached
+from batch import prepare_files
 
 try:
     from decompress import *
@@ -16,26 +18,36 @@ try:
 except ImportError:
     has_decompress = False
 
+import numpy as np
 import bpy
 
-def load_tp2(data, name):
-  width, height, out_pixels = read_tp2(data, name)
-  image_object = bpy.data.images.new(name, width, height)
-  image_object.pixels = out_pixels
+def new_image(name, width, height, pixels, has_alpha):
+  if pixels.dtype == np.uint8: pixels = pixels.astype(np.float32) / 255
+  image_object = bpy.data.images.new(name, width, height, alpha=has_alpha)
+  image_object.pixels.foreach_set(pixels)
   return image_object
 
-def load(operator, context, filepath=""):
+def load_tp2(data, name, use_cache=True):
+  if use_cache: width, height, out_pixels, has_alpha = read_tp2_cached(data, name)
+  else: width, height, out_pixels, has_alpha = read_tp2(data, name)
+  return new_image(name, width, height, out_pixels, has_alpha)
+
+def load_texture_list(texture_list, decoded=None):
+  # decoded holds the images a batch worker already decoded for this texture block
+  if decoded != None: return [new_image(*image) for image in decoded]
+  return [load_tp2(texture.read(), texture.name) for texture in texture_list.textures]
+
+def load(operator, context, filepath="", prepared=None):
   filedata = None
+  if prepared != None:
+    for image in prepared.textures[0]: new_image(*image)
+    return {'FINISHED'}
       
   with open(filepath, 'rb') as f:
-    filedata = BytesIO(f.read())
+    filedata = read_data(f) if has_decompress else BinaryReader(f.read())
     magic = try_read_str(filedata, 0, 4)
     filedata.seek(0)
     if magic is not None:
-      if magic.startswith("PK2") and has_decompress:
-        d = Decompressor(BytesIO(filedata.read()))
-        d.decompressed.seek(0)
-        filedata = BytesIO(d.decompressed.read())
       image = load_tp2(filedata, os.path.basename(f.name))
   if filedata == None: return {'CANCELLED'}
   return {'FINISHED'}
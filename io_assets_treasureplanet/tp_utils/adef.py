@@ -8,26 +8,7 @@ from pathlib import Path
 current_dir = Path(os.path.dirname(__file__))
 
 from fs_helpers import *
-
-def find_blocks(data, blocks, offset=0):
-  magic = try_read_str(data, offset, 4)
-  if magic is not None:
-    if magic == "ADEF":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell())
-    elif magic == "INFO" or magic == "STR " or magic == "ENUM" or magic == "CLAS":
-      block_size = sread_u32(data, data.tell())
-      blocks[magic] = offset + 0x4
-      find_blocks(data, blocks, data.tell() + block_size)
-    elif magic.startswith("END"):
-      current_pos = data.tell()
-      data.seek(0)
-      if data_len(data) - current_pos > 0x4:
-        data.seek(current_pos)
-        find_blocks(data, blocks, data.tell() + 0x4)
-      else:
-        return
+from chunks import ChunkIndex, ADEF_CONTAINERS, ADEF_CHUNKS
 
 class Adef:
   def __init__(self, data):
@@ -37,12 +18,10 @@ class Adef:
     self.enums = None
     self.classes = None
     
-    blocks = {}
-    find_blocks(data, blocks)
-    for key in blocks.keys():
-      block = blocks[key]
+    blocks = ChunkIndex(data, ADEF_CONTAINERS, ADEF_CHUNKS).blocks()
+    for key, block in blocks:
       if key == "INFO":
-        self.version = sread_u32(data, block + 0x4)
+        self.version = data.sread_u32(block + 0x4)
       elif key == "STR ":
         data.seek(block)
         self.strings = ActorStringsEntry(data)
@@ -57,8 +36,8 @@ class ActorClassesEntry:
   def __init__(self, data, string_table):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.count = sread_s32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.count = self.data.sread_s32()
     self.classes = []
     for i in range(self.count):
       actor_class = ActorClassEntry(self.data)
@@ -73,27 +52,15 @@ class ActorClassEntry:
   def __init__(self, data):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.string_index = sread_u16(self.data, self.data.tell())
-    self.par_index = sread_u16(self.data, self.data.tell())
+    self.string_index = self.data.sread_u16()
+    self.par_index = self.data.sread_u16()
     #self.par_index = 0 if self.par_index == 0xffff else self.par_index
     
-    self.properties_count1 = sread_s32(self.data, self.data.tell())
-    self.properties_type1 = []
-    for i in range(self.properties_count1):
-      p_str_index = sread_u16(self.data, self.data.tell())
-      p_type = sread_u16(self.data, self.data.tell())
-      p_class_ref = sread_u32(self.data, self.data.tell())
-      p_value = sread_u32(self.data, self.data.tell())#read_bytes(self.data, self.data.tell(), 0x4)
-      self.properties_type1.append(ActorClassPropertyEntry(p_str_index, p_type, p_class_ref, p_value))
+    self.properties_count1 = self.data.sread_s32()
+    self.properties_type1 = [ActorClassPropertyEntry(*p) for p in self.data.sread_records("HHII", self.properties_count1)]
       
-    self.properties_count2 = sread_s32(self.data, self.data.tell())
-    self.properties_type2 = []
-    for i in range(self.properties_count2):
-      p_str_index = sread_u16(self.data, self.data.tell())
-      p_type = sread_u16(self.data, self.data.tell())
-      p_class_ref = sread_u32(self.data, self.data.tell())
-      p_value = sread_u32(self.data, self.data.tell())
-      self.properties_type2.append(ActorClassPropertyEntry(p_str_index, p_type, p_class_ref, p_value))
+    self.properties_count2 = self.data.sread_s32()
+    self.properties_type2 = [ActorClassPropertyEntry(*p) for p in self.data.sread_records("HHII", self.properties_count2)]
 
 class ActorClassPropertyEntry:
   def __init__(self, string_index, _type, class_ref, _val):
@@ -106,8 +73,8 @@ class ActorEnumsEntry:
   def __init__(self, data, string_table):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.count = sread_s32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.count = self.data.sread_s32()
     self.enums = []
     for i in range(self.count):
       enum = ActorEnumEntry(self.data)
@@ -120,11 +87,9 @@ class ActorEnumEntry:
   def __init__(self, data):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.string_index = sread_u16(self.data, self.data.tell())
-    self.count = sread_u16(self.data, self.data.tell())
-    self.val_string_indexes = []
-    for i in range(self.count):
-      self.val_string_indexes.append(sread_u16(self.data, self.data.tell()))
+    self.string_index = self.data.sread_u16()
+    self.count = self.data.sread_u16()
+    self.val_string_indexes = self.data.sread_u16s(self.count)
 
 class ActorStringsEntry:
   def __init__(self, data=None):
@@ -138,46 +103,34 @@ class ActorStringsEntry:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.string_sect_size = sread_s32(self.data, self.data.tell())
-    string_data = BytesIO(read_bytes(self.data, self.data.tell(), self.string_sect_size))
-    self.count = sread_s32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.string_sect_size = self.data.sread_s32()
+    string_data = BinaryReader(self.data.read(self.string_sect_size))
+    self.count = self.data.sread_s32()
     
-    for i in range(self.count):
-      str_index = sread_s32(self.data, self.data.tell())
-      self.str_indexes.append(str_index)
-      actor_string = read_str_until_null_character(string_data, str_index)
+    self.str_indexes = self.data.sread_array("i", self.count)
+    for str_index in self.str_indexes:
+      actor_string = string_data.read_str_until_null_character(str_index)
       self.table.append(actor_string)
       #print(actor_string)
   
-  def save_changes(self, magic_string="STR "):
-    string_data = BytesIO()
-    index_data = BytesIO()
-    string_index = 0
+  def save_changes(self, magic_string="STR ", final_data=None):
+    if final_data == None: final_data = BinaryWriter()
+    block_offset = final_data.begin_block(magic_string)
+    string_size_offset = final_data.tell()
+    final_data.swrite_u32(0)
+    
+    string_start = final_data.tell()
     self.str_indexes.clear()
-    for i in range(len(self.table)):
-      string = self.table[i]
-      string_index = string_data.tell()
-      write_str_with_null_byte(string_data, string_index, string)
-      write_u32(index_data, i * 0x4, swap32(string_index))
-      self.str_indexes.append(string_index)
-    index_data.seek(0)
+    for string in self.table:
+      self.str_indexes.append(final_data.tell() - string_start)
+      final_data.write_str_with_null_byte(string)
     self.count = len(self.table)
-    string_data.seek(0)
-    align_data_to_nearest(string_data, 0x4)
-    string_data.seek(0)
-    self.string_sect_size = data_len(string_data)
-    string_data.seek(0)
+    final_data.align(0x4, string_start)
+    self.string_sect_size = final_data.tell() - string_start
+    final_data.swrite_u32(self.string_sect_size, string_size_offset)
     
-    final_data = BytesIO()
-    write_magic_str(final_data, 0x0, magic_string, 4)
-    write_u32(final_data, 0x4, 0x0)
-    write_u32(final_data, final_data.tell(), swap32(self.string_sect_size))
-    write_bytes(final_data, final_data.tell(), string_data.read())
-    write_u32(final_data, final_data.tell(), swap32(self.count))
-    write_bytes(final_data, final_data.tell(), index_data.read())
-    final_data.seek(0)
-    self.block_size = data_len(final_data) - 0x8
-    write_u32(final_data, 0x4, swap32(self.block_size))
-    final_data.seek(0)
+    final_data.swrite_u32(self.count)
+    final_data.swrite_u32s(self.str_indexes)
+    self.block_size = final_data.end_block(block_offset)
     return final_data
@@ -0,0 +1,82 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+from fs_helpers import *
+from chunks import ChunkIndex, LP2_CONTAINERS, LP2_CHUNKS, P2M_CONTAINERS, P2M_CHUNKS, P2S_CONTAINERS, P2S_CHUNKS
+from textures import TextureListEntry
+from texture_cache import read_tp2_cached
+from p2m import ModelEntry
+
+try:
+  from decompress import read_data
+  has_decompress = True
+except ImportError:
+  has_decompress = False
+
+# First phase of a multi-file import: everything that doesn't need bpy or mathutils runs in worker
+# processes and comes back as plain picklable data, Blender datablocks are built on the main thread.
+# data is the decompressed file, textures maps a TEX/TEXT block offset to its decoded images
+# (name, width, height, uint8 RGBA pixels, has_alpha), models maps a P2M MODL block offset to the
+# get_model_geometry result of every LOD.
+PreparedFile = namedtuple("PreparedFile", ["path", "name", "data", "textures", "models"])
+
+FILE_CHUNKS = {
+  "lp2": (LP2_CONTAINERS, LP2_CHUNKS),
+  "p2m": (P2M_CONTAINERS, P2M_CHUNKS),
+  "p2s": (P2S_CONTAINERS, P2S_CHUNKS),
+}
+
+def read_file(path):
+  with open(path, "rb") as f:
+    return read_data(f) if has_decompress else BinaryReader(f.read())
+
+def decode_image(data, name):
+  # Decoded channels are always n/255, so sending them back as uint8 is lossless and a quarter of the size
+  width, height, pixels, has_alpha = read_tp2_cached(data, name)
+  return name, width, height, np.round(pixels * 255).astype(np.uint8), has_alpha
+
+def decode_textures(data, name, blocks):
+  textures = {}
+  for key, block in blocks:
+    if not key.startswith("TEX"): continue
+    texture_list = TextureListEntry(block, data, name)
+    textures[block] = [decode_image(texture.read(), texture.name) for texture in texture_list.textures]
+  return textures
+
+def parse_models(data, name, blocks):
+  models = {}
+  for key, block in blocks:
+    if key != "MODL": continue
+    data.seek(block)
+    model = ModelEntry(data, name)
+    models[block] = [model.get_model_geometry(i) for i in range(max(model.lod_counts))]
+  return models
+
+def prepare_file(path, kind):
+  name = os.path.splitext(os.path.basename(path))[0]
+  data = read_file(path)
+  if kind == "tp2":
+    return PreparedFile(path, os.path.basename(path), data.getvalue(), {0: [decode_image(data, os.path.basename(path))]}, {})
+  blocks = ChunkIndex(data, *FILE_CHUNKS[kind]).blocks()
+  textures = decode_textures(data, name, blocks)
+  models = parse_models(data, name, blocks) if kind == "p2m" else {}
+  return PreparedFile(path, name, data.getvalue(), textures, models)
+
+def parallel_map(function, args, jobs=None):
+  # Calls function(*arg) for every tuple in args in worker processes, results come back in the order of args.
+  # A single item, jobs=1 or a pool that can't start runs serially.
+  if jobs == None: jobs = os.cpu_count() or 1
+  jobs = min(jobs, len(args))
+  if jobs > 1:
+    try:
+      with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, *zip(*args)))
+    except (OSError, BrokenProcessPool) as e:
+      print("Process pool unavailable, running serially: " + str(e))
+  return [function(*arg) for arg in args]
+
+def prepare_files(paths, kind, jobs=None):
+  return parallel_map(prepare_file, [(path, kind) for path in paths], jobs)
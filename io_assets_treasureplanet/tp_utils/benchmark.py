@@ -0,0 +1,377 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+import numpy as np
+
+from fs_helpers import *
+from strips import STRIP_RESTART
+from tp2 import reduce_colors
+from textures import TextureListEntry
+from adef import Adef, ActorStringsEntry
+from p2m import ModelEntry
+from lp2 import VERTEX_RECORD, LevelMaterialEntry, GeometrySection, CollisionSection, RenderSection, ActorInfoListEntry, AIMapListEntry, SplineListEntry, LightsEntry
+
+# Headless parse/save benchmark over synthetic payloads, also a regression check for the save paths.
+# Every case parses its payload, saves it again and compares the output with the expected bytes
+# (the payload itself unless the case only saves part of it). The builders write the formats directly
+# so they only need numpy, scale multiplies the element counts.
+
+# parse takes a BinaryReader over payload, save takes the parsed object and returns bytes, None when
+# the format has no save path
+Case = namedtuple("Case", ["name", "payload", "parse", "save", "expected"])
+Result = namedtuple("Result", ["name", "size", "parse_time", "save_time", "peak_memory", "identical"])
+
+LEVEL_VERSION = 4
+
+def block(magic, body):
+  output = BinaryWriter()
+  block_offset = output.begin_block(magic)
+  output.write(body)
+  output.end_block(block_offset)
+  return output.getvalue()
+
+def bounds(rng, count=1):
+  # min, max pairs that stay ordered when read back
+  corners = np.sort(rng.integers(-512, 512, (count, 2, 3)), axis=1).astype(np.float32)
+  return corners.reshape(count, 6)
+
+def translation(rng):
+  matrix = np.identity(4, dtype=np.float32)
+  matrix[3, 0:3] = rng.integers(-1024, 1024, 3)
+  return matrix
+
+def build_materials():
+  # (normals, uv_maps, properties) variations, render sections cycle through them
+  materials = []
+  for normals, uv_maps, properties in ((1, 1, 1), (0, 2, 2), (1, 0, 1)):
+    material = LevelMaterialEntry(0, uv_maps, normals)
+    for p in range(properties): material.add_property(p, 0x20, 0, p + 1)
+    materials.append(material)
+  return materials
+
+def build_render_section(rng, materials, submesh_count, strip_count, strip_length=24, color_maps=2):
+  output = BinaryWriter()
+  output.swrite_u32(color_maps)
+  output.swrite_floats(bounds(rng)[0].tolist())
+  output.swrite_u32(submesh_count)
+  for s in range(submesh_count):
+    material_index = s % len(materials)
+    material = materials[material_index]
+    output.swrite_u16s([material_index, 0])
+    output.swrite_u32(strip_count)
+    for g in range(strip_count):
+      records = np.zeros(strip_length, dtype=VERTEX_RECORD)
+      records["position"] = rng.uniform(-100, 100, (strip_length, 3))
+      records["flags"][0:2] = STRIP_RESTART
+      output.swrite_u32(strip_length)
+      output.write(records.tobytes())
+      if material.normals: output.write(rng.uniform(-1, 1, (strip_length, 3)).astype("<f4").tobytes())
+      output.write(rng.integers(0, 256, material.mat_properties * color_maps * strip_length * 4, dtype=np.uint8).tobytes())
+      output.write(rng.uniform(0, 1, (material.uv_maps, strip_length, 2)).astype("<f4").tobytes())
+  return output.getvalue()
+
+def write_bsp(output, triangle_count, leaf_size=4):
+  # Balanced tree in preorder, every node keeps up to leaf_size triangles and splits the rest between its children
+  pending = [np.arange(triangle_count)]
+  while len(pending) > 0:
+    triangles = pending.pop()
+    rest = triangles[leaf_size:]
+    children = (rest[:len(rest) // 2], rest[len(rest) // 2:])
+    output.swrite_u32(min(len(triangles), leaf_size))
+    output.swrite_u16s(triangles[:leaf_size].tolist())
+    output.swrite_u32(int(len(children[0]) > 0))
+    output.swrite_u32(int(len(children[1]) > 0))
+    for child in reversed(children):
+      if len(child) > 0: pending.append(child)
+
+def build_collision_geometry(rng, output, grid):
+  # grid x grid quads split into two triangles each, vertices on integer heights
+  points = np.stack(np.meshgrid(np.arange(grid + 1), np.arange(grid + 1), indexing="ij"), axis=-1).reshape(-1, 2)
+  vertices = np.column_stack((points[:, 0], rng.integers(-4, 4, len(points)), points[:, 1], np.ones(len(points)))).astype("<f4")
+  output.swrite_u32(int(rng.choice([0x003e00, 0x000200, 0x001000])))
+  output.swrite_u16(len(vertices))
+  output.write(vertices.tobytes())
+  
+  corners = np.arange(len(points)).reshape(grid + 1, grid + 1)[:-1, :-1].reshape(-1)
+  triangles = np.concatenate([
+    np.column_stack((corners, corners + 1, corners + grid + 1)),
+    np.column_stack((corners + 1, corners + grid + 2, corners + grid + 1)),
+  ])
+  edges = np.unique(np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1), axis=0)
+  output.swrite_u16(len(edges))
+  output.write(edges.astype("<u2").tobytes())
+  
+  edge_lookup = {tuple(edge): e for e, edge in enumerate(edges.tolist())}
+  output.swrite_u16(len(triangles))
+  records = []
+  for triangle in triangles.tolist():
+    tri_edges = [edge_lookup[tuple(sorted(pair))] for pair in ((triangle[0], triangle[1]), (triangle[1], triangle[2]), (triangle[2], triangle[0]))]
+    records.append(triangle + tri_edges + [0.0, 1.0, 0.0, float(rng.integers(-4, 4))])
+  output.swrite_records("6H4f", records)
+  write_bsp(output, len(triangles))
+
+def build_collision_section(rng, geometry_count, grid):
+  output = BinaryWriter()
+  output.swrite_floats(bounds(rng)[0].tolist())
+  output.swrite_u32(geometry_count)
+  for g in range(geometry_count): build_collision_geometry(rng, output, grid)
+  return output.getvalue()
+
+def build_instances(rng, output, count, render_sections, collision_sections):
+  output.swrite_u32(count)
+  render_instance_count = 0
+  for i in range(count):
+    output.write(translation(rng).T.astype("<f4").tobytes())
+    output.swrite_u32(i)
+    output.swrite_u32(0)
+    render_count = int(rng.integers(1, 4))
+    output.swrite_u32(render_count)
+    for r in range(render_count):
+      output.swrite_u32(render_instance_count)
+      output.swrite_u32(int(rng.integers(0, render_sections)))
+      output.swrite_floats(bounds(rng)[0].tolist())
+      render_instance_count += 1
+    collision_count = int(rng.integers(0, 3))
+    output.swrite_u32(collision_count)
+    for c in range(collision_count):
+      output.swrite_u32(int(rng.integers(0, collision_sections)))
+      output.swrite_floats(bounds(rng)[0].tolist())
+  return render_instance_count
+
+def build_geometry(rng, materials, scale):
+  render_sections = [build_render_section(rng, materials, 3, 4 * scale) for i in range(16 * scale)]
+  collision_sections = [build_collision_section(rng, 2, 8) for i in range(8 * scale)]
+  instances = BinaryWriter()
+  render_instance_count = build_instances(rng, instances, 64 * scale, len(render_sections), len(collision_sections))
+  build_instances(rng, instances, 16 * scale, len(render_sections), len(collision_sections))
+  
+  output = BinaryWriter()
+  output.swrite_u32(len(render_sections))
+  for section in render_sections: output.write(section)
+  output.swrite_u32(len(collision_sections))
+  for section in collision_sections: output.write(section)
+  output.swrite_u32(render_instance_count)
+  output.write(instances.getvalue())
+  return block("SECT", output.getvalue())
+
+def build_actors(rng, adef, scale):
+  # Actors are created through the same path the exporter uses, so the classes and parameters stay valid
+  actor_list = ActorInfoListEntry(None, adef.classes, adef.enums, adef.strings, ActorStringsEntry(), ActorStringsEntry(), None, None, None)
+  # Classes without a parent have no default parameters to fill in
+  names = [adef.strings.table[actor_class.string_index] for actor_class in adef.classes.classes if actor_class.par_index != 0xffff]
+  with contextlib.redirect_stdout(io.StringIO()):
+    for i in range(100 * scale):
+      actor = actor_list.create_new_actor(translation(rng), names[int(rng.integers(0, len(names)))])
+      for p, param in enumerate(actor.params):
+        if param.parent_param != None or param.type not in (0, 2): continue
+        if actor.add_parameter(p) == None: continue
+        param.loaded_value = float_to_u32(float(rng.integers(-64, 64))) if param.type == 0 else 1
+        param.value = param.loaded_value
+  return save_actors(actor_list)
+
+def save_actors(actor_list):
+  output = BinaryWriter()
+  actor_list.AStringEntry.save_changes("ASTR", output)
+  actor_list.PStringEntry.save_changes("PSTR", output)
+  actor_list.save_changes(output)
+  return output.getvalue()
+
+def parse_actors(data, adef):
+  data.seek(0x4)
+  astrings = ActorStringsEntry(data)
+  data.seek(astrings.entry_offset + astrings.block_size + 0x8)
+  pstrings = ActorStringsEntry(data)
+  data.seek(pstrings.entry_offset + pstrings.block_size + 0x8)
+  return ActorInfoListEntry(data, adef.classes, adef.enums, adef.strings, astrings, pstrings, None, None, None)
+
+def build_ai_maps(rng, scale, grid=12):
+  # Grid maps with integer coordinates, every cell a quad with its four edges, blocked flags and neighbours
+  output = BinaryWriter()
+  output.swrite_u32(2)
+  output.swrite_u32(4 * scale)
+  for m in range(4 * scale):
+    points = np.stack(np.meshgrid(np.arange(grid + 1), np.arange(grid + 1), indexing="ij"), axis=-1).reshape(-1, 2) * 4
+    offset = rng.integers(-256, 256, 3)
+    vertices = np.column_stack((points[:, 0] + offset[0], np.full(len(points), offset[1]), points[:, 1] + offset[2], np.ones(len(points))))
+    output.swrite_u32(len(vertices))
+    output.write(vertices.astype("<f4").tobytes())
+    output.swrite_u32(grid * grid)
+    for x in range(grid):
+      for z in range(grid):
+        corners = [x * (grid + 1) + z, (x + 1) * (grid + 1) + z, (x + 1) * (grid + 1) + z + 1, x * (grid + 1) + z + 1]
+        neighbours = [x * grid + z - 1 if z > 0 else 0xffffffff, (x + 1) * grid + z if x < grid - 1 else 0xffffffff,
+                      x * grid + z + 1 if z < grid - 1 else 0xffffffff, (x - 1) * grid + z if x > 0 else 0xffffffff]
+        output.swrite_u32(int(rng.integers(0, 2)))
+        output.swrite_u32(4)
+        output.swrite_records("3I4fI", [(corners[e], corners[(e + 1) % 4], int(rng.integers(0, 2)), 0.0, 0.0, 1.0, float(rng.integers(-64, 64)), neighbours[e]) for e in range(4)])
+  return block("AIMP", output.getvalue())
+
+def build_splines(rng, scale):
+  # Quarter unit steps keep the recentring around the average point exact
+  output = BinaryWriter()
+  output.swrite_u32(32 * scale)
+  for s in range(32 * scale):
+    point_count = int(rng.integers(2, 64))
+    output.swrite_u32(int(rng.integers(0, 2)))
+    output.swrite_u32(point_count)
+    output.write((rng.integers(-4096, 4096, (point_count, 3)) / 4).astype("<f4").tobytes())
+  return block("SPLN", output.getvalue())
+
+def build_lights(rng, scale):
+  # Saving writes 1.0 for the unused colour component and type 4 back as 3, so the payload uses those
+  output = BinaryWriter()
+  output.swrite_u32(64 * scale)
+  for l in range(64 * scale):
+    flag = 0x03 if l % 8 == 0 else 0x1F
+    output.swrite_u32(flag)
+    output.swrite_u32(int(rng.integers(1, 4)) if flag == 0x1F else 0)
+    output.swrite_floats(rng.uniform(0, 1, 3).astype(np.float32).tolist() + [1.0])
+    if flag == 0x1F:
+      output.write(translation(rng).T.astype("<f4").tobytes())
+      output.swrite_floats(rng.uniform(0, 64, 4).astype(np.float32).tolist())
+  return block("LITE", output.getvalue())
+
+def build_textures(rng, scale, size=64):
+  output = BinaryWriter()
+  output.swrite_u32(4 * scale)
+  for t in range(4 * scale):
+    # Smooth gradients with noise, close to what the quantizer sees for real textures
+    gradient = np.linspace(0, 255, size)
+    pixels = np.stack(np.broadcast_arrays(gradient[:, None], gradient[None, :], np.full((size, size), 128.0)), axis=-1)
+    pixels = np.clip(pixels + rng.normal(0, 8, pixels.shape), 0, 255)
+    output.write(reduce_colors(pixels.reshape(-1, 3), size, size, "bench_%d" % t).getvalue())
+  return block("TEXT", output.getvalue())
+
+def build_models(rng, scale, strip_length=16):
+  output = BinaryWriter()
+  output.swrite_u32(2)
+  for m in range(2):
+    output.swrite_u32(3)
+    for l in range(3):
+      output.swrite_float(16.0 * (l + 1))
+      output.swrite_u32(2)
+      for s in range(2):
+        output.swrite_u32(s)
+        output.swrite_u32(8 * scale)
+        for g in range(8 * scale):
+          records = np.zeros(strip_length, dtype=[("data", "<f4", 8), ("flags", "<u4")])
+          records["data"] = rng.uniform(-1, 1, (strip_length, 8))
+          records["flags"][0:2] = STRIP_RESTART
+          output.swrite_u32(strip_length)
+          output.write(records.tobytes())
+  return block("MODL", output.getvalue())
+
+def seek_to(data, offset):
+  data.seek(offset)
+  return data
+
+def entry_bytes(payload, entry):
+  # The whole block of an entry whose entry_offset points at its size field
+  return payload[entry.entry_offset - 0x4:entry.entry_offset + entry.block_size + 0x4]
+
+def save_section(section):
+  section.save_changes()
+  return section.data.view(section.entry_offset, section.data_size)
+
+def save_adef(adef):
+  return adef.strings.save_changes("STR ").getvalue()
+
+def build_cases(scale=1, seed=0):
+  rng = np.random.default_rng(seed)
+  materials = build_materials()
+  # The shipped actor definitions stand in for a synthetic ADEF file
+  with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "adef.sama"), "rb") as f:
+    adef_payload = f.read()
+  adef = Adef(BinaryReader(adef_payload))
+  
+  render_payload = build_render_section(rng, materials, 6, 64 * scale)
+  collision_payload = build_collision_section(rng, 4, 24)
+  return [
+    Case("GeometrySection", build_geometry(rng, materials, scale), lambda data: GeometrySection(seek_to(data, 0x4), LEVEL_VERSION, materials),
+         lambda geometry: geometry.save_injected_changes(LEVEL_VERSION).getvalue(), None),
+    Case("CollisionSection", collision_payload, CollisionSection, save_section, None),
+    Case("RenderSection", render_payload, lambda data: RenderSection(data, materials), save_section, None),
+    Case("ActorInfoListEntry", build_actors(rng, adef, scale), lambda data: parse_actors(data, adef), save_actors, None),
+    Case("AIMapListEntry", build_ai_maps(rng, scale), lambda data: AIMapListEntry(seek_to(data, 0x4)), lambda maps: maps.save_changes().getvalue(), None),
+    Case("SplineListEntry", build_splines(rng, scale), lambda data: SplineListEntry(seek_to(data, 0x4)), lambda splines: splines.save_changes().getvalue(), None),
+    Case("LightsEntry", build_lights(rng, scale), lambda data: LightsEntry(seek_to(data, 0x4), "bench"), lambda lights: lights.save_changes().getvalue(), None),
+    Case("TextureListEntry", build_textures(rng, scale), lambda data: TextureListEntry(0x4, data, "bench"), lambda textures: textures.save_changes().getvalue(), None),
+    # P2M models are only ever read
+    Case("ModelEntry", build_models(rng, scale), lambda data: ModelEntry(seek_to(data, 0x4), "bench"), None, None),
+    # Only the string table of the actor definitions has a save path
+    Case("Adef", adef_payload, Adef, save_adef, entry_bytes(adef_payload, adef.strings)),
+  ]
+
+def best_time(function, repeat):
+  best = None
+  result = None
+  for i in range(repeat):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    if best == None or elapsed < best: best = elapsed
+  return result, best
+
+def peak_memory(function):
+  tracemalloc.start()
+  try:
+    function()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+def run_case(case, repeat=5):
+  # The parsers print progress, timings are taken without it. Peak memory comes from a separate
+  # parse and save since tracemalloc slows both down.
+  with contextlib.redirect_stdout(io.StringIO()):
+    parsed, parse_time = best_time(lambda: case.parse(BinaryReader(case.payload)), repeat)
+    saved, save_time, identical = None, None, None
+    if case.save != None:
+      saved, save_time = best_time(lambda: bytes(case.save(parsed)), repeat)
+      identical = saved == (case.payload if case.expected == None else case.expected)
+    
+    def cycle():
+      parsed = case.parse(BinaryReader(case.payload))
+      if case.save != None: case.save(parsed)
+    memory = peak_memory(cycle)
+  return Result(case.name, len(case.payload), parse_time, save_time, memory, identical)
+
+def run(scale=1, repeat=5, seed=0):
+  return [run_case(case, repeat) for case in build_cases(scale, seed)]
+
+def print_results(results):
+  print("%-20s %10s %10s %10s %10s  %s" % ("case", "bytes", "parse ms", "save ms", "peak KiB", "round trip"))
+  for result in results:
+    save_time = "-" if result.save_time == None else "%.2f" % (result.save_time * 1000)
+    identical = "no save" if result.identical == None else ("identical" if result.identical else "MISMATCH")
+    print("%-20s %10d %10.2f %10s %10.1f  %s" % (result.name, result.size, result.parse_time * 1000, save_time, result.peak_memory / 1024, identical))
+
+def save_results(results, path):
+  with open(path, "w") as f:
+    json.dump({result.name: result._asdict() for result in results}, f, indent=2)
+
+def compare_results(results, baseline_path, tolerance=0.25):
+  # Messages for every timing or peak memory more than tolerance above the baseline
+  with open(baseline_path, "r") as f:
+    baseline = json.load(f)
+  regressions = []
+  for result in results:
+    if not result.name in baseline: continue
+    previous = baseline[result.name]
+    for field in ("parse_time", "save_time", "peak_memory"):
+      value, old_value = getattr(result, field), previous.get(field)
+      if value == None or old_value == None or old_value <= 0: continue
+      if value > old_value * (1.0 + tolerance):
+        regressions.append("%s %s %.4g -> %.4g (+%.0f%%)" % (result.name, field, old_value, value, (value / old_value - 1.0) * 100))
+  return regressions
+
+if __name__ == '__main__':
+  scale = int(sys.argv[1]) if len(sys.argv) >= 2 else 1
+  results = run(scale)
+  print_results(results)
+  sys.exit(0 if all(result.identical != False for result in results) else 1)
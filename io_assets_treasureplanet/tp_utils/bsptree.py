@@ -1,199 +1,300 @@
 import numpy as np
-import sys
 
-class Triangle:
-    def __init__(self, vertices, index):
-        self.index = index
-        self.vertices = vertices  # List of 3 vertices, each a (x, y, z) tuple
-
-class Plane:
-    def __init__(self, normal, distance):
-        self.normal = normal        # Plane normal vector (unit vector)
-        self.distance = distance    # Distance from the origin along the normal vector
+# Collision BSP builder. The game splits every node on the plane of the node's first triangle
+# (front: dot(n, p) + w >= 0 goes to child A, back to child B) and tests all of the node's triangles
+# when a query crosses that plane, so nodes hold the triangles lying on their splitting plane and
+# triangles straddling it are passed down to both children.
+# The tree is built a level at a time: every open node offers the triangles facing each axis the most
+# from a few centroid bins per axis, and the one with the lowest surface area heuristic cost becomes its
+# splitter. Nodes come out in preorder, the order they are stored in the file:
+#   node_offsets[i]:node_offsets[i + 1] slices node_triangles for node i (the splitting triangle first)
+#   node_children[i] says whether node i has a front and a back child
 
 class BSPTree:
-    def __init__(self, triangles):
-        triangles = [Triangle(verts, ind) for ind, verts in enumerate(triangles)]
-        #tri_list = []
-        self.root = self.build_tree(triangles)#, tri_list)
-        #print(tri_list)
-    
-    def build_tree(self, triangles, tri_list = []):
-        if not triangles:
-            return None
-        
-        # Select a splitting plane (e.g., median plane, random plane, etc.)
-        plane = self.choose_splitting_plane(triangles)
-
-        # Classify triangles based on the plane
-        triangles_on_plane = []
-        triangles_front = []
-        triangles_back = []
-        
-        for triangle in triangles:
-            side = self.classify_triangle(triangle, plane)
-            if side == 0:
-                triangles_on_plane.append(triangle)
-            elif side == 1:
-                triangles_front.append(triangle)
-            else:
-                triangles_back.append(triangle)
-        
-        #if len(triangles_on_plane) > 0:
-        #    tri_list.append([tri.index for tri in triangles_on_plane])
-
-        # Create current node
-        node = {
-            'plane': plane,
-            'triangles_on_plane': triangles_on_plane,
-            'front': self.build_tree(triangles_front, tri_list),
-            'back': self.build_tree(triangles_back, tri_list)
-        }
-        
-        return node
+  def __init__(self, vertices, triangles, leaf_size=8, max_depth=None, bins=4, epsilon=1e-4, batch_size=1 << 21):
+    # vertices (V,3+), triangles (T,3) vertex indices. Subtrees of leaf_size triangles or less split on their
+    # first triangle without scoring. At max_depth (in build levels, a peeled chain takes one) a node keeps
+    # every triangle it was given, which only approximates the game's traversal, so it is off by default.
+    # batch_size caps the triangle/candidate pairs classified at once.
+    self.leaf_size = leaf_size
+    self.max_depth = max_depth
+    self.bins = bins
+    self.epsilon = epsilon
+    self.batch_size = batch_size
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(len(vertices), -1)[:, 0:3]
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    self.corners = vertices[triangles]
+    self.planes = triangle_planes(self.corners)
+    self.degenerate = ~np.any(self.planes[:, 0:3] != 0.0, axis=1)
+    self.bounds_min = self.corners.min(axis=1)
+    self.bounds_max = self.corners.max(axis=1)
+    self.centroids = self.corners.mean(axis=1)
+    self.build_tree()
+  
+  def build_tree(self):
+    # Every node id gets its preorder entries (triangles, has front, has back) and its (front, back) child ids.
+    # Split nodes have one entry and their children are ids, subtrees finished in one go have all their entries.
+    self.entries = []
+    self.children = []
+    elements = np.arange(len(self.corners))
+    sizes = np.array([len(elements)]) if len(elements) > 0 else np.zeros(0, dtype=np.int64)
+    ids = np.array([self.add_node()]) if len(elements) > 0 else np.zeros(0, dtype=np.int64)
+    depth = 1
+    while len(sizes) > 0:
+      starts = np.cumsum(sizes) - sizes
+      final = sizes <= self.leaf_size
+      if self.max_depth != None and depth >= self.max_depth: final[:] = True
+      for start, size, node in zip(starts[final].tolist(), sizes[final].tolist(), ids[final].tolist()):
+        self.entries[node] = self.build_leaves(elements[start:start + size], depth)
+      
+      # Open nodes are split in batches of whole nodes
+      open_nodes = np.flatnonzero(~final)
+      batches = np.cumsum(sizes[open_nodes] * 3 * self.bins) // self.batch_size
+      next_elements, next_sizes, next_ids = [], [], []
+      for batch in np.unique(batches):
+        batch_nodes = open_nodes[batches == batch]
+        batch_elements = elements[np.concatenate([np.arange(starts[n], starts[n] + sizes[n]) for n in batch_nodes])]
+        batch_elements, batch_sizes, batch_ids = self.split_nodes(batch_elements, sizes[batch_nodes], ids[batch_nodes])
+        next_elements.append(batch_elements)
+        next_sizes.append(batch_sizes)
+        next_ids.append(batch_ids)
+      if len(next_sizes) == 0: break
+      elements, sizes, ids = np.concatenate(next_elements), np.concatenate(next_sizes), np.concatenate(next_ids)
+      depth += 1
+    self.flatten()
+  
+  def add_node(self):
+    self.entries.append(None)
+    self.children.append((-1, -1))
+    return len(self.entries) - 1
+  
+  def flatten(self):
+    node_triangles = []
+    node_children = []
+    pending = [0] if len(self.entries) > 0 else []
+    while len(pending) > 0:
+      node = pending.pop()
+      for triangles, has_front, has_back in self.entries[node]:
+        node_triangles.append(triangles)
+        node_children.append((has_front, has_back))
+      front, back = self.children[node]
+      if back != -1: pending.append(back)
+      if front != -1: pending.append(front)
+    counts = [len(triangles) for triangles in node_triangles]
+    self.node_offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+    self.node_triangles = np.concatenate(node_triangles).astype(np.int64) if len(node_triangles) > 0 else np.zeros(0, dtype=np.int64)
+    self.node_children = np.array(node_children, dtype=bool).reshape(-1, 2)
+    self.entries = None
+    self.children = None
+    fronts, backs, depths = preorder_links(self.node_children)
+    self.depth = int(depths.max()) if len(depths) > 0 else 0
+  
+  def split_nodes(self, elements, sizes, ids):
+    # elements holds the triangles of each node in ids back to back. Returns the same layout for their children.
+    starts = np.cumsum(sizes) - sizes
+    segments = np.repeat(np.arange(len(sizes)), sizes)
+    candidates = self.binned_candidates(elements, segments, starts)
+    candidate_segments = segments[candidates]
     
-    def distance_to_plane(self, point, plane):
-        # Calculate the signed distance from a point to a plane
-        #return np.dot(point, plane.normal) + plane.distance
-        return sum([p * n for p, n in zip(point, plane.normal)]) - plane.distance
-
-    def classify_triangle(self, triangle, plane):
-        # Classify triangle relative to the plane
-        on_plane = 0
-        front = 1
-        back = 2
-        
-        # Compute distance from each vertex of triangle to the plane
-        distances = [self.distance_to_plane(vertex, plane) for vertex in triangle.vertices]
-        
-        if all(d == 0 for d in distances):
-            return on_plane
-        elif all(d >= 0 for d in distances):
-            return front
-        elif all(d <= 0 for d in distances):
-            return back
-        else:
-            return on_plane  # Triangle intersects the plane (handle as on-plane)
+    # Nodes made of degenerate triangles only have no plane to split on and can't be hit
+    unsplit = np.bincount(candidate_segments, minlength=len(sizes)) == 0
+    for s in np.flatnonzero(unsplit).tolist():
+      self.entries[ids[s]] = [(elements[starts[s]:starts[s] + sizes[s]], False, False)]
+    if len(candidates) == 0: return elements[0:0], sizes[0:0], ids[0:0]
     
-    def classify_point(self, point, plane):
-        on_plane = 0
-        front = 1
-        back = 2
-        distance = self.distance_to_plane(point, plane)
-
-        if distance == 0: return on_plane
-        elif distance >= 0: return front
-        elif distance <= 0: return back
-        return on_plane
-
-    def choose_splitting_plane(self, triangles):
-        # For simplicity, choose a plane perpendicular to one of the coordinate axes
-        # For example, a plane perpendicular to the x-axis passing through the median x-value
-        # This can be more sophisticated based on scene complexity (e.g., using a heuristic)
-        # Here's a simple example:
-        
-        # Calculate median x-value of triangle centroids
-        centroids = [self.calculate_centroid(triangle) for triangle in triangles]
-        median_x = sorted(centroids, key=lambda x: x[0])[len(centroids) // 2][0]
-        plane = Plane(normal=(1, 0, 0), distance=median_x)
-
-        #plane = self.select_optimal_plane(triangles)
-
-        # Compute centroids of triangles
-        #centroids = np.array([np.mean(triangle.vertices, axis=0) for triangle in triangles])
-        # Fit a plane to centroids using Principal Component Analysis (PCA)
-        #_, _, v = np.linalg.svd(centroids - np.mean(centroids, axis=0))
-        #plane_normal = v[0]  # Use the first principal component as the plane normal
-        # Choose splitting plane parameters
-        #plane_distance = -np.dot(plane_normal, np.mean(centroids, axis=0))
-        #plane = Plane(normal=plane_normal, distance=plane_distance)
-        
-        # Splitting plane perpendicular to x-axis passing through median_x
-        return plane
+    # Every candidate is classified against every triangle of its node
+    pair_counts = sizes[candidate_segments]
+    pair_starts = np.cumsum(pair_counts) - pair_counts
+    pair_candidates = np.repeat(np.arange(len(candidates)), pair_counts)
+    pair_positions = np.arange(len(pair_candidates)) - pair_starts[pair_candidates] + starts[candidate_segments][pair_candidates]
+    on_plane, in_front, behind = self.classify(elements[pair_positions], self.planes[elements[candidates]][pair_candidates])
+    cost = self.split_cost(elements[pair_positions], in_front, behind, pair_starts)
     
-    def calculate_centroid(self, triangle):
-        # Compute the centroid of a triangle
-        return (
-            (triangle.vertices[0][0] + triangle.vertices[1][0] + triangle.vertices[2][0]) / 3,
-            (triangle.vertices[0][1] + triangle.vertices[1][1] + triangle.vertices[2][1]) / 3,
-            (triangle.vertices[0][2] + triangle.vertices[1][2] + triangle.vertices[2][2]) / 3
-        )
+    # Cheapest candidate per node, its pairs line up with the node's triangles
+    order = np.lexsort((cost, candidate_segments))
+    first = np.flatnonzero(np.diff(candidate_segments[order], prepend=-1) != 0)
+    chosen = np.zeros(len(sizes), dtype=np.int64)
+    chosen[candidate_segments[order[first]]] = order[first]
+    splitters = candidates[chosen]
     
-    def select_optimal_plane(self, triangles):
-        best_plane = None
-        best_cost = sys.maxsize
-        
-        # Evaluate cost for each candidate plane
-        for plane in self.generate_candidate_planes(triangles):
-            cost = self.evaluate_split_cost(triangles, plane)
-            if cost < best_cost:
-                best_cost = cost
-                best_plane = plane
-        
-        return best_plane
+    # When even the cheapest plane has everything on one side the node covers a convex patch, where no
+    # triangle plane does better. Every one sided candidate is then peeled off at once as a chain of nodes.
+    front_counts = np.add.reduceat(in_front, pair_starts)
+    back_counts = np.add.reduceat(behind, pair_starts)
+    one_sided = (front_counts == 0) | (back_counts == 0)
+    chained = ~unsplit & one_sided[chosen]
+    candidate_bounds = np.searchsorted(candidate_segments, np.arange(len(sizes) + 1))
+    chain_elements, chain_sizes, chain_ids = [], [], []
+    for s in np.flatnonzero(chained).tolist():
+      remaining = np.ones(sizes[s], dtype=bool)
+      entries = []
+      for c in np.flatnonzero(one_sided[candidate_bounds[s]:candidate_bounds[s + 1]]).tolist():
+        c += candidate_bounds[s]
+        splitter = candidates[c] - starts[s]
+        if not remaining[splitter]: continue
+        node = np.flatnonzero(on_plane[pair_starts[c]:pair_starts[c] + sizes[s]] & remaining)
+        remaining[node] = False
+        node = np.concatenate(([splitter], node[node != splitter]))
+        entries.append([elements[starts[s] + node], front_counts[c] > 0, back_counts[c] > 0 and front_counts[c] == 0])
+        if not remaining.any(): break
+      # Each chain node has the next one as its only child, the last one the rest of the triangles if any are left
+      entries[-1][1] = entries[-1][1] and remaining.any()
+      entries[-1][2] = entries[-1][2] and remaining.any()
+      self.entries[ids[s]] = [tuple(entry) for entry in entries]
+      if remaining.any():
+        chain_ids.append(self.add_node())
+        self.children[ids[s]] = (chain_ids[-1], -1)
+        chain_elements.append(elements[starts[s] + np.flatnonzero(remaining)])
+        chain_sizes.append(len(chain_elements[-1]))
     
-    def generate_candidate_planes(self, triangles):
-        # Example: Generate candidate planes (e.g., axis-aligned planes)
-        # Here, we generate planes parallel to x, y, and z axes
-        
-        min_x = min_y = min_z = sys.maxsize
-        max_x = max_y = max_z = -sys.maxsize - 1
-        for triangle in triangles:
-          for vert in triangle.vertices:
-            min_x = min(vert[0], min_x)
-            max_x = max(vert[0], max_x)
-            min_y = min(vert[1], min_y)
-            max_y = max(vert[1], max_y)
-            min_z = min(vert[2], min_z)
-            max_z = max(vert[2], max_z)
-        
-        mid_x = 0.5 * (min_x + max_x)
-        mid_y = 0.5 * (min_y + max_y)
-        mid_z = 0.5 * (min_z + max_z)
-        
-        # Generate candidate planes (axis-aligned)
-        planes = [
-            Plane(normal=(1, 0, 0), distance=mid_x),  # Split along x-axis
-            Plane(normal=(0, 1, 0), distance=mid_y),  # Split along y-axis
-            Plane(normal=(0, 0, 1), distance=mid_z)   # Split along z-axis
-        ]
-        
-        return planes
+    split = ~unsplit & ~chained
+    positions = np.flatnonzero(split[segments])
+    pairs = positions - starts[segments[positions]] + pair_starts[chosen[segments[positions]]]
     
-    def evaluate_split_cost(self, triangles, plane):
-        # Example: Evaluate split cost using SAH (surface area heuristic)
-        triangles_front = []
-        triangles_back = []
-        
-        for triangle in triangles:
-            side = self.classify_triangle(triangle, plane)
-            if side == 1:
-                triangles_front.append(triangle)
-            elif side == 2:
-                triangles_back.append(triangle)
-        
-        area_front = self.calculate_bounding_volume_area(triangles_front)
-        area_back = self.calculate_bounding_volume_area(triangles_back)
-        
-        # SAH cost (e.g., sum of areas)
-        cost = area_front + area_back
-        return cost
+    # Node triangles with the splitter first
+    node_positions = positions[on_plane[pairs]]
+    node_segments = segments[node_positions]
+    node_order = np.lexsort((node_positions != splitters[node_segments], node_segments))
+    node_positions = node_positions[node_order]
+    node_counts = np.bincount(node_segments, minlength=len(sizes))
+    node_starts = np.cumsum(node_counts) - node_counts
     
-    def calculate_bounding_volume_area(self, triangles):
-        # Example: Calculate bounding volume area (e.g., AABB surface area)
-        # Here, we use the bounding box area as a simple approximation
-        
-        min_x = min_y = min_z = sys.maxsize
-        max_x = max_y = max_z = -sys.maxsize - 1
-        for triangle in triangles:
-          for vert in triangle.vertices:
-            min_x = min(vert[0], min_x)
-            max_x = max(vert[0], max_x)
-            min_y = min(vert[1], min_y)
-            max_y = max(vert[1], max_y)
-            min_z = min(vert[2], min_z)
-            max_z = max(vert[2], max_z)
-        extents = np.array([max_x, max_y, max_z]) - np.array([min_x, min_y, min_z])
+    # Front children are keyed 2 * node, back children 2 * node + 1
+    front, back = positions[in_front[pairs]], positions[behind[pairs]]
+    keys = np.concatenate((segments[front] * 2, segments[back] * 2 + 1))
+    child_order = np.argsort(keys, kind="stable")
+    child_sizes = np.bincount(keys, minlength=len(sizes) * 2)
+    child_ids = np.full(len(sizes) * 2, -1, dtype=np.int64)
+    for s in np.flatnonzero(split).tolist():
+      has_front, has_back = bool(child_sizes[s * 2] > 0), bool(child_sizes[s * 2 + 1] > 0)
+      if has_front: child_ids[s * 2] = self.add_node()
+      if has_back: child_ids[s * 2 + 1] = self.add_node()
+      self.entries[ids[s]] = [(elements[node_positions[node_starts[s]:node_starts[s] + node_counts[s]]], has_front, has_back)]
+      self.children[ids[s]] = (child_ids[s * 2], child_ids[s * 2 + 1])
+    nonempty = child_sizes > 0
+    next_elements = np.concatenate([elements[np.concatenate((front, back))[child_order]]] + chain_elements)
+    return next_elements, np.concatenate((child_sizes[nonempty], chain_sizes)).astype(np.int64), np.concatenate((child_ids[nonempty], chain_ids)).astype(np.int64)
+  
+  def build_leaves(self, triangles, depth):
+    # Small subtrees split on their first triangle without scoring. Every triangle is classified against
+    # every other one up front, the subtree itself is then built from plain lists.
+    count = len(triangles)
+    on_plane, in_front, behind = self.classify(np.repeat(triangles, count), np.tile(self.planes[triangles], (count, 1)))
+    on_plane = on_plane.reshape(count, count).tolist()
+    in_front = in_front.reshape(count, count).tolist()
+    behind = behind.reshape(count, count).tolist()
+    degenerate = self.degenerate[triangles].tolist()
+    entries = []
+    pending = [(list(range(count)), depth)]
+    while len(pending) > 0:
+      subset, depth = pending.pop()
+      splitters = [t for t in subset if not degenerate[t]]
+      if len(splitters) == 0 or (self.max_depth != None and depth >= self.max_depth):
+        node, front, back = splitters[0:1] + [t for t in subset if t not in splitters[0:1]], [], []
+      else:
+        splitter = splitters[0]
+        node = [splitter] + [t for t in subset if on_plane[t][splitter] and t != splitter]
+        front = [t for t in subset if in_front[t][splitter]]
+        back = [t for t in subset if behind[t][splitter]]
+      entries.append((triangles[node], len(front) > 0, len(back) > 0))
+      if len(back) > 0: pending.append((back, depth + 1))
+      if len(front) > 0: pending.append((front, depth + 1))
+    return entries
+  
+  def classify(self, triangles, planes):
+    # Masks over (triangle, plane) pairs: lying on the plane, reaching in front of it and reaching behind it
+    distances = np.einsum("tvc,tc->tv", self.corners[triangles], planes[:, 0:3]) + planes[:, 3:4]
+    in_front = np.any(distances > self.epsilon, axis=1)
+    behind = np.any(distances < -self.epsilon, axis=1)
+    return ~(in_front | behind), in_front, behind
+  
+  def binned_candidates(self, elements, segments, starts):
+    # For every axis each node's centroid range is cut into bins, each bin offers the triangle facing that
+    # axis the most. Returns positions into elements, grouped by node.
+    centroids = self.centroids[elements]
+    low = np.minimum.reduceat(centroids, starts)
+    high = np.maximum.reduceat(centroids, starts)
+    extent = np.where(high > low, high - low, 1.0)
+    bins = np.clip(((centroids - low[segments]) / extent[segments] * self.bins).astype(np.int64), 0, self.bins - 1)
+    keys = ((segments[:, None] * 3 + np.arange(3)) * self.bins + bins).ravel()
+    scores = np.abs(self.planes[elements, 0:3]).ravel()
+    positions = np.repeat(np.arange(len(elements)), 3)
+    usable = np.repeat(~self.degenerate[elements], 3)
+    keys, scores, positions = keys[usable], scores[usable], positions[usable]
+    order = np.lexsort((-scores, keys))
+    first = np.flatnonzero(np.diff(keys[order], prepend=-1) != 0)
+    return np.unique(positions[order[first]])
+  
+  def split_cost(self, triangles, in_front, behind, starts):
+    # Surface area heuristic per candidate: the bounds area of each child weighted by its triangle count,
+    # straddling triangles counting on both sides
+    cost = np.zeros(len(starts))
+    for mask in (in_front, behind):
+      low = np.minimum.reduceat(np.where(mask[:, None], self.bounds_min[triangles], np.inf), starts)
+      high = np.maximum.reduceat(np.where(mask[:, None], self.bounds_max[triangles], -np.inf), starts)
+      extent = np.maximum(high - low, 0.0)
+      cost += np.add.reduceat(mask, starts) * (extent[:, 0] * extent[:, 1] + extent[:, 1] * extent[:, 2] + extent[:, 2] * extent[:, 0])
+    return cost
+
+def preorder_links(node_children):
+  # Front and back child index (-1 when missing) and depth (root at 1) of every node of a preorder tree
+  count = len(node_children)
+  fronts = [-1] * count
+  backs = [-1] * count
+  depths = [0] * count
+  # Open child slots as (parent, side, depth), the front child always comes right after its parent
+  pending = [(-1, 0, 1)] if count > 0 else []
+  for node, (has_front, has_back) in enumerate(np.asarray(node_children, dtype=bool).tolist()):
+    parent, side, depth = pending.pop()
+    if parent != -1: (fronts if side == 0 else backs)[parent] = node
+    depths[node] = depth
+    if has_back: pending.append((node, 1, depth + 1))
+    if has_front: pending.append((node, 0, depth + 1))
+  return np.array(fronts, dtype=np.int64), np.array(backs, dtype=np.int64), np.array(depths, dtype=np.int64)
+
+def pack_bsp(offsets, triangles, children):
+  # File layout of preorder node arrays: per node a u32 triangle count, the u16 triangle indices and two u32
+  # child present flags, built as one u16 array
+  counts = np.diff(offsets)
+  node_sizes = counts + 6
+  node_starts = np.cumsum(node_sizes) - node_sizes
+  words = np.zeros(int(node_sizes.sum()), dtype="<u2")
+  words[node_starts] = counts & 0xffff
+  words[node_starts + 1] = counts >> 16
+  words[np.repeat(node_starts + 2 - offsets[:-1], counts) + np.arange(len(triangles))] = triangles
+  words[node_starts + counts + 2] = children[:, 0]
+  words[node_starts + counts + 4] = children[:, 1]
+  return words.tobytes()
+
+def unpack_bsp(data):
+  # Reads preorder nodes from a BinaryReader in one pass, the u16 triangle runs are gathered in bulk afterwards
+  start = data.tell()
+  counts = []
+  run_starts = []
+  children = []
+  pending = 1
+  while pending > 0:
+    pending -= 1
+    count = data.sread_u32()
+    counts.append(count)
+    run_starts.append(data.tell())
+    data.seek(count * 2, 1)
+    has_front, has_back = data.sread_u32() != 0, data.sread_u32() != 0
+    children.append((has_front, has_back))
+    pending += int(has_front) + int(has_back)
+  counts = np.array(counts, dtype=np.int64)
+  offsets = np.concatenate(([0], np.cumsum(counts)))
+  raw = np.frombuffer(data.view(start, data.tell() - start), dtype=np.uint8)
+  positions = np.repeat(np.array(run_starts, dtype=np.int64) - start - offsets[:-1] * 2, counts) + np.arange(offsets[-1]) * 2
+  triangles = raw[positions].astype(np.int64) | (raw[positions + 1].astype(np.int64) << 8)
+  return offsets, triangles, np.array(children, dtype=bool).reshape(-1, 2)
 
-        surface_area = 2 * (extents[0] * extents[1] + extents[1] * extents[2] + extents[2] * extents[0])
-        return surface_area
\ No newline at end of file
+def triangle_planes(corners):
+  # (T,4) unit normal and w = -dot(normal, v0), winding as in the exporter: cross(v1 - v0, v2 - v0).
+  # Zero area triangles get an all zero plane.
+  normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+  lengths = np.linalg.norm(normals, axis=1)
+  valid = lengths > 1e-12
+  normals[valid] /= lengths[valid][:, None]
+  normals[~valid] = 0.0
+  return np.column_stack((normals, -np.einsum("tc,tc->t", normals, corners[:, 0])))
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from fs_helpers import *
+
+# Tags are matched with startswith, like the old find_blocks copies did ("TEX" covers "TEX " and "TEXT")
+LP2_CONTAINERS = ("LEVL", "GMSH", "ACTR")
+LP2_CHUNKS = ("INFO", "TEX", "ANIM", "MAT ", "SECT", "NODE", "PVS ", "AIMP", "GRID", "SPLN", "LITE", "ASTR", "PSTR", "AINF")
+P2M_CONTAINERS = ("P2M",)
+P2M_CHUNKS = ("INFO", "SETT", "TEXT", "MATL", "MODL")
+P2S_CONTAINERS = ("P2S",)
+P2S_CHUNKS = ("INFO", "SETT", "TEXT", "MATL", "SKEL", "CYCL", "JNTL", "MODL")
+ADEF_CONTAINERS = ("ADEF",)
+ADEF_CHUNKS = ("INFO", "STR ", "ENUM", "CLAS")
+
+# offset is the position of the magic, the size field follows it and the payload starts at offset + 8
+Chunk = namedtuple("Chunk", ["magic", "offset", "size", "depth"])
+
+def scan_chunks(raw, containers, chunk_tags):
+  chunks = []
+  raw_size = len(raw)
+  offset = 0
+  depth = 0
+  while offset + 4 <= raw_size:
+    try:
+      magic = bytes(raw[offset:offset + 4]).decode("shift_jis").rstrip("\0")
+    except UnicodeDecodeError:
+      break
+    if magic.startswith(containers):
+      size = SWAPPED_U32.unpack_from(raw, offset + 4)[0]
+      chunks.append(Chunk(magic, offset, size, depth))
+      depth += 1
+      offset += 8
+    elif magic.startswith(chunk_tags):
+      size = SWAPPED_U32.unpack_from(raw, offset + 4)[0]
+      chunks.append(Chunk(magic, offset, size, depth))
+      offset += 8 + size
+    elif magic.startswith("END") and raw_size - (offset + 4) > 0x4:
+      depth -= 1
+      offset += 8
+    else:
+      break
+  return chunks
+
+class ChunkIndex:
+  def __init__(self, data, containers, chunk_tags):
+    self.data = data
+    if isinstance(data, BinaryReader): raw = data.buffer
+    elif hasattr(data, "getbuffer"): raw = data.getbuffer()
+    else: raw = memoryview(data)
+    self.chunks = scan_chunks(raw, containers, chunk_tags)
+    self.parsed = {}
+  
+  def __iter__(self):
+    return iter(self.chunks)
+  
+  def __len__(self):
+    return len(self.chunks)
+  
+  def __repr__(self):
+    return repr([(chunk.magic, chunk.offset, chunk.size, chunk.depth) for chunk in self.chunks])
+  
+  def blocks(self):
+    # (magic, offset of the size field) pairs in file order, the offsets the entry parsers expect
+    return [(chunk.magic, chunk.offset + 0x4) for chunk in self.chunks]
+  
+  def find(self, magic):
+    for chunk in self.chunks:
+      if chunk.magic == magic: return chunk
+    return None
+  
+  def find_all(self, magic):
+    return [chunk for chunk in self.chunks if chunk.magic == magic]
+  
+  def view(self, chunk):
+    # Raw bytes of the whole chunk, header included
+    return self.data.view(chunk.offset, chunk.size + 0x8)
+  
+  def load(self, chunk, parser):
+    # Parses a chunk on first use with parser(data) positioned at its size field
+    if isinstance(chunk, str): chunk = self.find(chunk)
+    if chunk == None: return None
+    if not chunk.offset in self.parsed:
+      self.data.seek(chunk.offset + 0x4)
+      self.parsed[chunk.offset] = parser(self.data)
+    return self.parsed[chunk.offset]
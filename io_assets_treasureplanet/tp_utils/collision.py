@@ -0,0 +1,489 @@
+import numpy as np
+from bsptree import triangle_planes
+
+# Ray and sphere queries against every collision section a GeometrySection places through its model instances.
+# Each placed CollisionGeometry is a part: its triangles are moved to world space once, and its preorder BSP arrays
+# are merged into one forest so a whole batch of rays walks all parts together, one tree level per step.
+# The BSP walk uses the game's rule: a node's first triangle gives the plane, a segment continues into the front
+# child when one endpoint is in front of it and into the back child when one is behind it, and only nodes that it
+# reaches from both sides have their triangles tested.
+
+class CollisionWorld:
+  def __init__(self, geometry, dynamic=True, epsilon=1e-4, batch_size=1024):
+    self.epsilon = epsilon
+    self.batch_size = batch_size
+    # (dynamic, model instance index, collision instance index, geometry index) per part
+    self.parts = []
+    part_bounds = []
+    part_layers = []
+    part_roots = []
+    local_corners = []
+    corners = []
+    planes = []
+    node_starts = []
+    node_triangles = []
+    node_fronts = []
+    node_backs = []
+    triangle_base = 0
+    node_base = 0
+    reference_base = 0
+    
+    instances = [(False, i, instance) for i, instance in enumerate(geometry.model_instances)]
+    if dynamic: instances += [(True, i, instance) for i, instance in enumerate(geometry.dynamic_model_instances)]
+    for is_dynamic, model_index, instance in instances:
+      transform = np.asarray(instance.transform, dtype=np.float64)
+      # Mirroring transforms turn the winding around, flipping the planes keeps the BSP sides where they were
+      flip = -1.0 if np.linalg.det(transform[0:3, 0:3]) < 0 else 1.0
+      for c, coll_instance in enumerate(instance.collision_instances):
+        section = geometry.collision_sections[coll_instance.sect_index]
+        section.load()
+        for g, geom in enumerate(section.collision_geometry):
+          if geom.triangle_count == 0 or len(geom.bsp_children) == 0: continue
+          local = np.array([vertex[0:3] for vertex in geom.vertices], dtype=np.float64).reshape(-1, 3)
+          local_corners.append(local[np.array(geom.tri_vert_indices, dtype=np.int64).reshape(-1, 3)])
+          part_corners = local_corners[-1] @ transform[0:3, 0:3].T + transform[0:3, 3]
+          corners.append(part_corners)
+          planes.append(triangle_planes(part_corners) * flip)
+          
+          node_count = len(geom.bsp_children)
+          node_starts.append(geom.bsp_offsets[:-1] + reference_base)
+          node_triangles.append(geom.bsp_triangles + triangle_base)
+          node_fronts.append(np.where(geom.bsp_fronts != -1, geom.bsp_fronts + node_base, -1))
+          node_backs.append(np.where(geom.bsp_backs != -1, geom.bsp_backs + node_base, -1))
+          part_roots.append(node_base)
+          part_bounds.append(list(coll_instance.min[0:3]) + list(coll_instance.max[0:3]))
+          part_layers.append(geom.layer_mask)
+          self.parts.append((is_dynamic, model_index, c, g))
+          triangle_base += geom.triangle_count
+          node_base += node_count
+          reference_base += len(geom.bsp_triangles)
+    
+    self.local_corners = np.concatenate(local_corners) if len(local_corners) > 0 else np.zeros((0, 3, 3))
+    self.corners = np.concatenate(corners) if len(corners) > 0 else np.zeros((0, 3, 3))
+    self.planes = np.concatenate(planes) if len(planes) > 0 else np.zeros((0, 4))
+    self.part_bounds = np.array(part_bounds, dtype=np.float64).reshape(-1, 6)
+    self.part_layers = np.array(part_layers, dtype=np.uint32)
+    self.part_roots = np.array(part_roots, dtype=np.int64)
+    self.node_offsets = np.concatenate(node_starts + [[reference_base]]).astype(np.int64)
+    self.node_triangles = np.concatenate(node_triangles).astype(np.int64) if len(node_triangles) > 0 else np.zeros(0, dtype=np.int64)
+    self.node_fronts = np.concatenate(node_fronts).astype(np.int64) if len(node_fronts) > 0 else np.zeros(0, dtype=np.int64)
+    self.node_backs = np.concatenate(node_backs).astype(np.int64) if len(node_backs) > 0 else np.zeros(0, dtype=np.int64)
+    self.part_starts = np.concatenate(([0], np.cumsum([len(c) for c in corners]))).astype(np.int64)
+    self.triangle_parts = np.repeat(np.arange(len(self.parts)), np.diff(self.part_starts)).astype(np.int64)
+    self.triangle_layers = self.part_layers[self.triangle_parts]
+    # World space normal of every triangle, returned hits index into these
+    self.normals = self.planes[:, 0:3]
+  
+  def move_instance(self, is_dynamic, model_index, transform):
+    # Places every part of one model instance with a new transform and returns the indices of those parts. Their
+    # bounds are taken from the moved triangles since the stored instance bounds no longer apply.
+    transform = np.asarray(transform, dtype=np.float64)
+    flip = -1.0 if np.linalg.det(transform[0:3, 0:3]) < 0 else 1.0
+    moved = [p for p, part in enumerate(self.parts) if part[0] == is_dynamic and part[1] == model_index]
+    for p in moved:
+      start, stop = self.part_starts[p], self.part_starts[p + 1]
+      self.corners[start:stop] = self.local_corners[start:stop] @ transform[0:3, 0:3].T + transform[0:3, 3]
+      self.planes[start:stop] = triangle_planes(self.corners[start:stop]) * flip
+      self.part_bounds[p, 0:3] = self.corners[start:stop].min(axis=(0, 1))
+      self.part_bounds[p, 3:6] = self.corners[start:stop].max(axis=(0, 1))
+    return np.array(moved, dtype=np.int64)
+  
+  def layer_parts(self, layer_mask):
+    if layer_mask == None: return np.ones(len(self.parts), dtype=bool)
+    return (self.part_layers & np.uint32(layer_mask)) != 0
+  
+  def instances_at(self, points, layer_mask=None):
+    # (point index, part index) for every point inside a part's stored instance bounds
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    point_indices = []
+    part_indices = []
+    for start in range(0, len(points), self.batch_size):
+      batch = points[start:start + self.batch_size]
+      inside = np.all(batch[:, None, :] >= self.part_bounds[None, :, 0:3], axis=2) & np.all(batch[:, None, :] <= self.part_bounds[None, :, 3:6], axis=2)
+      inside &= self.layer_parts(layer_mask)[None, :]
+      points_in, parts_in = np.nonzero(inside)
+      point_indices.append(points_in + start)
+      part_indices.append(parts_in)
+    if len(point_indices) == 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(point_indices), np.concatenate(part_indices)
+  
+  def raycast(self, origins, directions, max_distance=1000.0, layer_mask=None):
+    # Closest hit per ray: world triangle index (-1 for a miss), distance along the normalised direction and the
+    # layer mask of the geometry that was hit
+    return self.query(origins, directions, max_distance, 0.0, layer_mask)
+  
+  def sweep_sphere(self, origins, directions, radius, max_distance=1000.0, layer_mask=None):
+    # First contact of spheres moving from origins along directions, in the same layout as raycast. A sphere that
+    # already touches something at its origin reports distance 0.
+    return self.query(origins, directions, max_distance, float(radius), layer_mask)
+  
+  def query(self, origins, directions, max_distance, radius, layer_mask):
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    directions = np.broadcast_to(directions, origins.shape)
+    lengths = np.linalg.norm(directions, axis=1)
+    directions = directions / np.where(lengths > 0.0, lengths, 1.0)[:, None]
+    max_distance = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (len(origins),))
+    ends = origins + directions * max_distance[:, None]
+    
+    triangles = np.full(len(origins), -1, dtype=np.int64)
+    distances = np.full(len(origins), np.inf)
+    layers = np.zeros(len(origins), dtype=np.uint32)
+    enabled = self.layer_parts(layer_mask)
+    for start in range(0, len(origins), self.batch_size):
+      stop = min(start + self.batch_size, len(origins))
+      starts = origins[start:stop]
+      segment_ends = ends[start:stop]
+      rays, candidates = self.candidates(starts, segment_ends, radius, enabled)
+      if radius > 0.0: fractions = sweep_triangles(starts[rays], segment_ends[rays], radius, self.corners[candidates])
+      else: fractions = segment_triangles(starts[rays], segment_ends[rays], self.corners[candidates])
+      hit = np.isfinite(fractions)
+      rays, candidates, fractions = rays[hit], candidates[hit], fractions[hit]
+      
+      # Closest candidate per ray
+      order = np.lexsort((fractions, rays))
+      first = np.ones(len(order), dtype=bool)
+      first[1:] = rays[order][1:] != rays[order][:-1]
+      order = order[first]
+      triangles[start + rays[order]] = candidates[order]
+      distances[start + rays[order]] = fractions[order] * max_distance[start + rays[order]]
+      layers[start + rays[order]] = self.triangle_layers[candidates[order]]
+    return triangles, distances, layers
+  
+  def candidates(self, starts, ends, radius, enabled):
+    # (ray, triangle) pairs left after the instance bounds and BSP culling, without duplicates
+    margin = radius + self.epsilon
+    segment_min = np.minimum(starts, ends) - margin
+    segment_max = np.maximum(starts, ends) + margin
+    overlap = np.all(segment_min[:, None, :] <= self.part_bounds[None, :, 3:6], axis=2) & np.all(segment_max[:, None, :] >= self.part_bounds[None, :, 0:3], axis=2)
+    rays, parts = np.nonzero(overlap & enabled[None, :])
+    nodes = self.part_roots[parts]
+    
+    found_rays = []
+    found_nodes = []
+    while len(rays) > 0:
+      plane = self.planes[self.node_triangles[self.node_offsets[nodes]]]
+      start_distance = np.einsum("ij,ij->i", plane[:, 0:3], starts[rays]) + plane[:, 3]
+      end_distance = np.einsum("ij,ij->i", plane[:, 0:3], ends[rays]) + plane[:, 3]
+      in_front = np.maximum(start_distance, end_distance) >= -margin
+      behind = np.minimum(start_distance, end_distance) <= margin
+      both = in_front & behind
+      found_rays.append(rays[both])
+      found_nodes.append(nodes[both])
+      
+      fronts = self.node_fronts[nodes]
+      backs = self.node_backs[nodes]
+      to_front = in_front & (fronts != -1)
+      to_back = behind & (backs != -1)
+      rays = np.concatenate((rays[to_front], rays[to_back]))
+      nodes = np.concatenate((fronts[to_front], backs[to_back]))
+    if len(found_rays) == 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    
+    rays = np.concatenate(found_rays)
+    nodes = np.concatenate(found_nodes)
+    counts = self.node_offsets[nodes + 1] - self.node_offsets[nodes]
+    first = np.cumsum(counts) - counts
+    references = np.repeat(self.node_offsets[nodes] - first, counts) + np.arange(int(counts.sum()))
+    # Triangles split by a plane sit in both subtrees, keep one pair each
+    keys = np.unique(np.repeat(rays, counts) * len(self.corners) + self.node_triangles[references])
+    return keys // len(self.corners), keys % len(self.corners)
+
+# Cell coordinates are biased to keep the packed (x, z) keys positive
+CELL_BIAS = 1 << 30
+CELL_MASK = (1 << 32) - 1
+RAY_CELL_CHUNK = 16
+
+class CollisionGrid:
+  # Uniform grid over the world space triangles of a CollisionWorld. Like the LP2 Grid chunk it splits the level into
+  # columns along x and z, and every cell lists the triangles whose bounds reach into it as (cell key, triangle) pairs
+  # sorted by key. Moving an instance only rebins the triangles of that instance.
+  def __init__(self, world, cell_size=None):
+    self.world = world
+    if cell_size == None or cell_size <= 0.0:
+      # Without a Grid chunk aim for about 64 cells across the level
+      extent = np.ptp(world.corners.reshape(-1, 3)[:, [0, 2]], axis=0).max() if len(world.corners) > 0 else 0.0
+      cell_size = max(extent / 64.0, 1.0)
+    self.cell_size = float(cell_size)
+    # Blender object name of each model instance -> (dynamic, model instance index), filled in by the importer
+    self.objects = {}
+    self.pair_keys = np.zeros(0, dtype=np.int64)
+    self.pair_triangles = np.zeros(0, dtype=np.int64)
+    self.insert(np.arange(len(world.corners)))
+  
+  def cells_of(self, positions):
+    return np.floor(np.asarray(positions, dtype=np.float64)[..., [0, 2]] / self.cell_size).astype(np.int64)
+  
+  @staticmethod
+  def cell_keys(cells):
+    return ((cells[..., 0] + CELL_BIAS) << 32) | (cells[..., 1] + CELL_BIAS)
+  
+  def insert(self, triangles):
+    corners = self.world.corners[triangles]
+    low = self.cells_of(corners.min(axis=1))
+    spans = self.cells_of(corners.max(axis=1)) - low + 1
+    counts = spans[:, 0] * spans[:, 1]
+    within = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    depth = np.repeat(spans[:, 1], counts)
+    cells = np.repeat(low, counts, axis=0) + np.column_stack((within // depth, within % depth))
+    self.pair_keys = np.concatenate((self.pair_keys, self.cell_keys(cells)))
+    self.pair_triangles = np.concatenate((self.pair_triangles, np.repeat(triangles, counts)))
+    
+    order = np.argsort(self.pair_keys, kind="stable")
+    self.pair_keys = self.pair_keys[order]
+    self.pair_triangles = self.pair_triangles[order]
+    self.keys, starts = np.unique(self.pair_keys, return_index=True)
+    self.offsets = np.concatenate((starts, [len(self.pair_keys)])).astype(np.int64)
+    cells = np.column_stack(((self.keys >> 32) - CELL_BIAS, (self.keys & CELL_MASK) - CELL_BIAS))
+    self.cell_min = cells.min(axis=0) if len(cells) > 0 else np.zeros(2, dtype=np.int64)
+    self.cell_max = cells.max(axis=0) if len(cells) > 0 else np.full(2, -1, dtype=np.int64)
+  
+  def move_instance(self, is_dynamic, model_index, transform):
+    moved = self.world.move_instance(is_dynamic, model_index, transform)
+    if len(moved) == 0: return moved
+    keep = ~np.isin(self.world.triangle_parts[self.pair_triangles], moved)
+    self.pair_keys = self.pair_keys[keep]
+    self.pair_triangles = self.pair_triangles[keep]
+    starts = self.world.part_starts[moved]
+    counts = self.world.part_starts[moved + 1] - starts
+    self.insert(np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum())))
+    return moved
+  
+  def cell_triangles(self, keys, layer_mask=None):
+    # Triangles listed in any of the cells, without duplicates
+    slots = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+    slots = slots[self.keys[slots] == keys] if len(self.keys) > 0 else slots[0:0]
+    counts = self.offsets[slots + 1] - self.offsets[slots]
+    references = np.repeat(self.offsets[slots] - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))
+    triangles = np.unique(self.pair_triangles[references])
+    if layer_mask != None: triangles = triangles[(self.world.triangle_layers[triangles] & np.uint32(layer_mask)) != 0]
+    return triangles
+  
+  def triangles_in(self, minimum, maximum, layer_mask=None):
+    # Triangles of every cell the x and z range of a box reaches
+    low = np.maximum(self.cells_of(minimum), self.cell_min)
+    high = np.minimum(self.cells_of(maximum), self.cell_max)
+    if np.any(high < low): return np.zeros(0, dtype=np.int64)
+    xs, zs = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1), indexing="ij")
+    return self.cell_triangles(self.cell_keys(np.stack((xs.reshape(-1), zs.reshape(-1)), axis=1)), layer_mask)
+  
+  def overlap(self, minimum, maximum, layer_mask=None):
+    # Triangles whose bounds overlap the box
+    minimum = np.asarray(minimum, dtype=np.float64)
+    maximum = np.asarray(maximum, dtype=np.float64)
+    triangles = self.triangles_in(minimum, maximum, layer_mask)
+    corners = self.world.corners[triangles]
+    inside = np.all(corners.min(axis=1) <= maximum, axis=1) & np.all(corners.max(axis=1) >= minimum, axis=1)
+    return triangles[inside]
+  
+  def nearest(self, points, max_distance=np.inf, layer_mask=None):
+    # Closest triangle, the closest point on it and its distance for every point, -1 and inf past max_distance.
+    # The search box grows until the best distance found fits inside it.
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    triangles = np.full(len(points), -1, dtype=np.int64)
+    closest = np.full((len(points), 3), np.nan)
+    distances = np.full(len(points), np.inf)
+    grid_min = self.cell_min * self.cell_size
+    grid_max = (self.cell_max + 1) * self.cell_size
+    for i, point in enumerate(points):
+      # Past this radius the box holds every cell
+      limit = np.abs(np.stack((grid_min - point[[0, 2]], grid_max - point[[0, 2]]))).max()
+      radius = self.cell_size
+      while True:
+        candidates = self.triangles_in(point - radius, point + radius, layer_mask)
+        if len(candidates) > 0:
+          candidate_points = closest_points(np.broadcast_to(point, (len(candidates), 3)), self.world.corners[candidates])
+          candidate_distances = np.linalg.norm(candidate_points - point, axis=1)
+          best = np.argmin(candidate_distances)
+          if candidate_distances[best] <= radius or radius >= limit:
+            if candidate_distances[best] <= max_distance:
+              triangles[i] = candidates[best]
+              closest[i] = candidate_points[best]
+              distances[i] = candidate_distances[best]
+            break
+        if radius >= limit or radius >= max_distance: break
+        radius *= 2.0
+    return triangles, closest, distances
+  
+  def ray_cells(self, start, end):
+    # Keys of the cells a segment passes through in order, with the fraction where it leaves each
+    delta = end - start
+    fractions = [[0.0, 1.0]]
+    for axis in (0, 2):
+      if delta[axis] == 0.0: continue
+      lines = np.arange(np.floor(min(start[axis], end[axis]) / self.cell_size) + 1, np.floor(max(start[axis], end[axis]) / self.cell_size) + 1) * self.cell_size
+      fractions.append((lines - start[axis]) / delta[axis])
+    fractions = np.unique(np.clip(np.concatenate(fractions), 0.0, 1.0))
+    middles = (fractions[:-1] + fractions[1:]) * 0.5
+    return self.cell_keys(self.cells_of(start + delta * middles[:, None])), fractions[1:]
+  
+  def raycast(self, origins, directions, max_distance=1000.0, layer_mask=None):
+    # Same results as CollisionWorld.raycast, walking the cells along each ray and stopping at the first hit
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.broadcast_to(np.asarray(directions, dtype=np.float64).reshape(-1, 3), origins.shape)
+    lengths = np.linalg.norm(directions, axis=1)
+    directions = directions / np.where(lengths > 0.0, lengths, 1.0)[:, None]
+    max_distance = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (len(origins),))
+    triangles = np.full(len(origins), -1, dtype=np.int64)
+    distances = np.full(len(origins), np.inf)
+    layers = np.zeros(len(origins), dtype=np.uint32)
+    for i in range(len(origins)):
+      start = origins[i]
+      end = start + directions[i] * max_distance[i]
+      keys, exits = self.ray_cells(start, end)
+      for first in range(0, len(keys), RAY_CELL_CHUNK):
+        candidates = self.cell_triangles(keys[first:first + RAY_CELL_CHUNK], layer_mask)
+        if len(candidates) == 0: continue
+        fractions = segment_triangles(np.broadcast_to(start, (len(candidates), 3)), np.broadcast_to(end, (len(candidates), 3)), self.world.corners[candidates])
+        best = np.argmin(fractions)
+        # A hit beyond these cells may still be beaten by a triangle in the next ones
+        if fractions[best] <= exits[min(first + RAY_CELL_CHUNK, len(keys)) - 1] + 1e-9:
+          triangles[i] = candidates[best]
+          distances[i] = fractions[best] * max_distance[i]
+          layers[i] = self.world.triangle_layers[candidates[best]]
+          break
+    return triangles, distances, layers
+
+def segment_triangles(starts, ends, corners):
+  # Moller-Trumbore on (start, end, triangle) rows, returns the hit fraction along each segment or inf
+  direction = ends - starts
+  edge1 = corners[:, 1] - corners[:, 0]
+  edge2 = corners[:, 2] - corners[:, 0]
+  p = np.cross(direction, edge2)
+  det = np.einsum("ij,ij->i", edge1, p)
+  valid = np.abs(det) > 1e-12
+  inverse = 1.0 / np.where(valid, det, 1.0)
+  s = starts - corners[:, 0]
+  u = np.einsum("ij,ij->i", s, p) * inverse
+  q = np.cross(s, edge1)
+  v = np.einsum("ij,ij->i", direction, q) * inverse
+  t = np.einsum("ij,ij->i", edge2, q) * inverse
+  valid &= (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0) & (t <= 1.0)
+  return np.where(valid, t, np.inf)
+
+def sweep_triangles(starts, ends, radius, corners):
+  # Earliest fraction along each segment where a sphere of radius touches the triangle: the face, the three edge
+  # cylinders and the three corner spheres, or inf
+  direction = ends - starts
+  best = np.full(len(starts), np.inf)
+  
+  # Face, from whichever side the sphere starts on
+  normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+  area = np.linalg.norm(normal, axis=1)
+  valid = area > 1e-12
+  normal = normal / np.where(valid, area, 1.0)[:, None]
+  start_height = np.einsum("ij,ij->i", normal, starts - corners[:, 0])
+  end_height = np.einsum("ij,ij->i", normal, ends - corners[:, 0])
+  side = np.where(start_height < 0.0, -1.0, 1.0)
+  start_height *= side
+  end_height *= side
+  touching = start_height <= radius
+  approaching = ~touching & (end_height < radius)
+  fraction = np.where(touching, 0.0, (start_height - radius) / np.where(approaching, start_height - end_height, 1.0))
+  center = starts + direction * fraction[:, None]
+  point = center - normal * np.einsum("ij,ij->i", normal, center - corners[:, 0])[:, None]
+  inside = valid & (touching | approaching)
+  for i in range(3):
+    edge = corners[:, (i + 1) % 3] - corners[:, i]
+    inside &= np.einsum("ij,ij->i", np.cross(edge, point - corners[:, i]), normal) >= 0.0
+  best = np.where(inside, fraction, best)
+  
+  # Edges, as cylinders clamped to the edge
+  dd = np.einsum("ij,ij->i", direction, direction)
+  for i in range(3):
+    origin = corners[:, i]
+    edge = corners[:, (i + 1) % 3] - origin
+    m = starts - origin
+    ee = np.einsum("ij,ij->i", edge, edge)
+    md = np.einsum("ij,ij->i", m, edge)
+    nd = np.einsum("ij,ij->i", direction, edge)
+    a = ee * dd - nd * nd
+    b = ee * np.einsum("ij,ij->i", m, direction) - nd * md
+    c = ee * (np.einsum("ij,ij->i", m, m) - radius * radius) - md * md
+    discriminant = b * b - a * c
+    moving = (a > 1e-12) & (discriminant >= 0.0)
+    fraction = np.where(c <= 0.0, 0.0, (-b - np.sqrt(np.maximum(discriminant, 0.0))) / np.where(moving, a, 1.0))
+    along = (md + fraction * nd) / np.where(ee > 0.0, ee, 1.0)
+    valid = (ee > 0.0) & ((c <= 0.0) | moving) & (fraction >= 0.0) & (fraction <= 1.0) & (along >= 0.0) & (along <= 1.0)
+    best = np.where(valid, np.minimum(best, fraction), best)
+  
+  # Corners
+  for i in range(3):
+    m = starts - corners[:, i]
+    b = np.einsum("ij,ij->i", m, direction)
+    c = np.einsum("ij,ij->i", m, m) - radius * radius
+    discriminant = b * b - dd * c
+    moving = (dd > 1e-12) & (discriminant >= 0.0)
+    fraction = np.where(c <= 0.0, 0.0, (-b - np.sqrt(np.maximum(discriminant, 0.0))) / np.where(moving, dd, 1.0))
+    valid = ((c <= 0.0) | moving) & (fraction >= 0.0) & (fraction <= 1.0)
+    best = np.where(valid, np.minimum(best, fraction), best)
+  return best
+
+def closest_points(points, corners):
+  # Closest point on each triangle to each point, by the Voronoi region of the triangle the point falls in
+  a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+  ab = b - a
+  ac = c - a
+  ap = points - a
+  bp = points - b
+  cp = points - c
+  d1 = np.einsum("ij,ij->i", ab, ap)
+  d2 = np.einsum("ij,ij->i", ac, ap)
+  d3 = np.einsum("ij,ij->i", ab, bp)
+  d4 = np.einsum("ij,ij->i", ac, bp)
+  d5 = np.einsum("ij,ij->i", ab, cp)
+  d6 = np.einsum("ij,ij->i", ac, cp)
+  va = d3 * d6 - d5 * d4
+  vb = d5 * d2 - d1 * d6
+  vc = d1 * d4 - d3 * d2
+  
+  def ratio(numerator, denominator):
+    return (numerator / np.where(denominator != 0.0, denominator, 1.0))[:, None]
+  
+  total = va + vb + vc
+  conditions = [
+    (d1 <= 0.0) & (d2 <= 0.0),
+    (d3 >= 0.0) & (d4 <= d3),
+    (vc <= 0.0) & (d1 >= 0.0) & (d3 <= 0.0),
+    (d6 >= 0.0) & (d5 <= d6),
+    (vb <= 0.0) & (d2 >= 0.0) & (d6 <= 0.0),
+    (va <= 0.0) & (d4 - d3 >= 0.0) & (d5 - d6 >= 0.0),
+  ]
+  choices = [
+    a,
+    b,
+    a + ab * ratio(d1, d1 - d3),
+    c,
+    a + ac * ratio(d2, d2 - d6),
+    b + (c - b) * ratio(d4 - d3, (d4 - d3) + (d5 - d6)),
+  ]
+  interior = a + ab * ratio(vb, total) + ac * ratio(vc, total)
+  return np.select([condition[:, None] for condition in conditions], choices, interior)
+
+def collision_edges(triangles):
+  # Edge table and triangle to edge map from (T,3) corner indices, with the number of triangles using each edge.
+  # Edge k of a triangle runs from corner k to corner k + 1. Every undirected edge is stored once, in the direction
+  # and order of the first triangle that uses it.
+  triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+  directed = np.stack((triangles, np.roll(triangles, -1, axis=1)), axis=2).reshape(-1, 2)
+  keys = np.sort(directed, axis=1)
+  keys = keys[:, 0] * (int(triangles.max()) + 1 if len(triangles) > 0 else 1) + keys[:, 1]
+  unique_keys, first, inverse, uses = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+  order = np.argsort(first)
+  slots = np.empty(len(order), dtype=np.int64)
+  slots[order] = np.arange(len(order))
+  return directed[first[order]], slots[inverse.reshape(-1)].reshape(-1, 3), uses[order]
+
+def validate_collision(vertices, triangles, tri_edges=None, edge_uses=None, epsilon=1e-10):
+  # Indices of the triangles the game can't use: degenerate ones repeat a corner, zero_area ones have three distinct
+  # but collinear corners and non_manifold ones share an edge with more than one other triangle
+  vertices = np.asarray(vertices, dtype=np.float64)
+  if vertices.ndim != 2: vertices = vertices.reshape(-1, 3)
+  vertices = vertices[:, 0:3]
+  triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+  if tri_edges is None or edge_uses is None: edges, tri_edges, edge_uses = collision_edges(triangles)
+  degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+  corners = vertices[triangles]
+  areas = np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+  zero_area = ~degenerate & (areas <= epsilon)
+  non_manifold = np.any(edge_uses[tri_edges] > 2, axis=1)
+  return {"degenerate": np.nonzero(degenerate)[0], "zero_area": np.nonzero(zero_area)[0], "non_manifold": np.nonzero(non_manifold)[0]}
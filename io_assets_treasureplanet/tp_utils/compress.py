@@ -0,0 +1,143 @@
+import os
+import sys
+
+from fs_helpers import *
+
+PK2_HEADER_SIZE = 0xC
+PK2_GROUP_SIZE = 0x1E
+PK2_MAX_STREAM_SIZE = 0xFFFFFF
+PK2_MIN_MATCH = 3
+
+# Per control word mask: (longest back-reference, farthest distance)
+PK2_MASK_LIMITS = [((1 << (2 + mask)) + 2, 0x4000 >> mask) for mask in range(4)]
+
+# Effort level: (hash chain depth, masks tried for every group of 30 tokens)
+COMPRESSION_LEVELS = {
+  1: (4, (2,)),
+  2: (16, (1, 2, 3)),
+  3: (64, (0, 1, 2, 3)),
+}
+DEFAULT_COMPRESSION_LEVEL = 2
+
+class MatchFinder:
+  def __init__(self, data, chain_depth, masks):
+    self.data = data
+    self.size = len(data)
+    self.chain_depth = chain_depth
+    self.masks = masks
+    self.head = {}
+    self.prev = [-1] * self.size
+    self.inserted = 0
+    self.matches = {}
+  
+  def insert_until(self, pos):
+    data = self.data
+    head = self.head
+    prev = self.prev
+    for p in range(self.inserted, min(pos, self.size - 2)):
+      key = (data[p] << 0x10) | (data[p + 1] << 0x8) | data[p + 2]
+      prev[p] = head.get(key, -1)
+      head[key] = p
+    self.inserted = max(self.inserted, pos)
+  
+  def match_length(self, candidate, pos, max_length):
+    data = self.data
+    if data[candidate:candidate + max_length] == data[pos:pos + max_length]: return max_length
+    length = PK2_MIN_MATCH
+    while length < max_length and data[candidate + length] == data[pos + length]: length += 1
+    return length
+  
+  def find(self, pos):
+    # Best (length, distance) for each mask at pos, shared by every mask tried for a group
+    if pos in self.matches: return self.matches[pos]
+    best = [(0, 0)] * 4
+    self.matches[pos] = best
+    if pos + PK2_MIN_MATCH > self.size: return best
+    self.insert_until(pos)
+    data = self.data
+    key = (data[pos] << 0x10) | (data[pos + 1] << 0x8) | data[pos + 2]
+    candidate = self.head.get(key, -1)
+    max_length = min(max(PK2_MASK_LIMITS[mask][0] for mask in self.masks), self.size - pos)
+    farthest = max(PK2_MASK_LIMITS[mask][1] for mask in self.masks)
+    depth = self.chain_depth
+    while candidate >= 0 and depth > 0:
+      distance = pos - candidate
+      if distance > farthest: break
+      if distance > 0:
+        depth -= 1
+        if data[candidate:candidate + PK2_MIN_MATCH] == data[pos:pos + PK2_MIN_MATCH]:
+          length = self.match_length(candidate, pos, max_length)
+          for mask in self.masks:
+            mask_length, mask_distance = PK2_MASK_LIMITS[mask]
+            if distance > mask_distance: continue
+            length_for_mask = min(length, mask_length)
+            if length_for_mask > best[mask][0]: best[mask] = (length_for_mask, distance)
+          if length == max_length: break
+      candidate = self.prev[candidate]
+    return best
+  
+  def parse_group(self, pos, mask):
+    tokens = []
+    for i in range(PK2_GROUP_SIZE):
+      if pos >= self.size: break
+      length, distance = self.find(pos)[mask]
+      if length >= PK2_MIN_MATCH:
+        tokens.append((length, distance))
+        pos += length
+      else:
+        tokens.append(None)
+        pos += 1
+    return tokens, pos
+  
+  def forget_before(self, pos):
+    self.matches = {p: best for p, best in self.matches.items() if p >= pos}
+
+def compress(data, level=DEFAULT_COMPRESSION_LEVEL):
+  data = bytes(data)
+  stream_size = len(data)
+  if stream_size > PK2_MAX_STREAM_SIZE: raise ValueError("PK2 streams are limited to 0x%X bytes" % PK2_MAX_STREAM_SIZE)
+  chain_depth, masks = COMPRESSION_LEVELS[level]
+  finder = MatchFinder(data, chain_depth, masks)
+  
+  output = BinaryWriter()
+  output.write_magic_str("PK2", 4)
+  output.swrite_u32(stream_size)
+  output.swrite_u32(sum(data) & 0xFFFFFFFF)
+  
+  pos = 0
+  while pos < stream_size:
+    best_group = None
+    for mask in masks:
+      tokens, end = finder.parse_group(pos, mask)
+      emitted = 4 + sum(1 if token == None else 2 for token in tokens)
+      score = (end - pos) / emitted
+      if best_group == None or score > best_group[0]: best_group = (score, mask, tokens, end)
+    score, mask, tokens, end = best_group
+    
+    ctrl = mask
+    group_data = bytearray()
+    count_shift = 0xE - mask
+    for i, token in enumerate(tokens):
+      if token == None:
+        group_data.append(data[pos])
+        pos += 1
+      else:
+        length, distance = token
+        ctrl |= 1 << (31 - i)
+        short = ((length - PK2_MIN_MATCH) << count_shift) | (distance - 1)
+        group_data.append(short >> 0x8)
+        group_data.append(short & 0xFF)
+        pos += length
+    output.write(ctrl.to_bytes(4, "big"))
+    output.write(group_data)
+    finder.forget_before(pos)
+  return output.buffer
+
+if __name__ == '__main__':
+  if len(sys.argv) >= 2:
+    level = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_COMPRESSION_LEVEL
+    with open(sys.argv[1], "rb") as f:
+      data = compress(f.read(), level)
+    output_path = os.path.join(os.path.dirname(sys.argv[1]), "out_" + os.path.basename(sys.argv[1]))
+    with open(output_path, "wb") as wf:
+      wf.write(data)
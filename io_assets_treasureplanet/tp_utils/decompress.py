@@ -1,88 +1,175 @@
-import os
-import sys
-import math
-from io import BytesIO
-from enum import Enum
-
-from fs_helpers import *
-
-class ModularInt(object):
-    def __init__(self, bits, signed=True):
-        self._value_range = pow(2, bits)
-        if(signed):
-            self._lower = -pow(2, bits -1)
-            self._upper = pow(2, bits -1) -1
-        else:
-            self._lower = 0
-            self._upper = pow(2, bits) -1
-    
-    @property
-    def value(self):
-        return self._value
-    
-    @value.setter
-    def value(self,value):
-        while value > self._upper:
-            value = value - self._value_range
-        while value < self._lower:
-            value = value + self._value_range
-        self._value = value
-
-class Decompressor:
-  def __init__(self, original_data):
-    decompressed = BytesIO()
-    self.decompressed = decompressed
-    #stream_size = read_u24(original_data, 0x4)
-    stream_size = (read_u8(original_data, 0x6) << 0x10) + (read_u8(original_data, 0x5) << 0x8) + read_u8(original_data, 0x4)
-    #print("Stream size: %x" % stream_size)
-    check_sum = sread_u32(original_data, 0x8)
-    #print("Check-sum: %x" % check_sum)
-    
-    shift_index = ModularInt(32, False)
-    signed_index = ModularInt(32, True)
-    while True:
-      nested_index = 0
-      #shift_index.value = (((read_u8(original_data, original_data.tell()) * 0x100) + read_u8(original_data, original_data.tell())) * 0x100 + read_u8(original_data, original_data.tell())) * 0x100 + read_u8(original_data, original_data.tell())
-      shift_index.value = read_u32(original_data, original_data.tell())
-      signed_index.value = shift_index.value
-      mask = shift_index.value & 3
-      while True:
-        if signed_index.value < 0:
-          #short = ((read_u8(original_data, original_data.tell()) << 0x8) | read_u8(original_data, original_data.tell()))
-          short = read_u16(original_data, original_data.tell())
-          bytes_to_decompress = ((short >> 0xE - mask & 0x1F)) + 2
-          while bytes_to_decompress != -1:
-            bytes_to_decompress -= 1
-            decompressed_index = decompressed.tell()
-            decompressed_byte = read_u8(decompressed, decompressed_index - ((short & (0x3FFF >> mask)) + 1))
-            write_u8(decompressed, decompressed_index, decompressed_byte)
-        else:
-          byte = read_u8(original_data, original_data.tell())
-          write_u8(decompressed, decompressed.tell(), byte)
-        if stream_size <= decompressed.tell():
-          nested_index = 0
-          decompressed.seek(0)
-          #print("Decompressed size: %x" % data_len(decompressed))
-          while stream_size != 0:
-            stream_size -= 1
-            byte = read_u8(decompressed, stream_size)
-            nested_index += byte
-          if nested_index != check_sum:
-            print("ERROR! %x" % nested_index)
-          return
-        nested_index += 1
-        shift_index.value <<= 1
-        signed_index.value = shift_index.value
-        if (nested_index >= 0x1E):
-          break
-
-if __name__ == '__main__':
-  if len(sys.argv) == 2:
-    with open(sys.argv[1], "rb") as f:
-      #print("x" % sum(f.read()))
-      file = Decompressor(BytesIO(f.read()))
-      if file != None:
-        output_path = os.path.join(os.path.dirname(sys.argv[1]), "out_" + os.path.basename(sys.argv[1]))
-        with open(output_path, "wb") as wf:
-          file.decompressed.seek(0)
-          wf.write(file.decompressed.read())
+import os
+import sys
+import math
+import io
+from io import BytesIO
+from enum import Enum
+
+from fs_helpers import *
+
+try:
+  import ctypes
+  pk2_lib = None
+  for lib_name in ("pk2.so", "pk2.dylib", "pk2.dll"):
+    lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), lib_name)
+    if not os.path.exists(lib_path): continue
+    pk2_lib = ctypes.CDLL(lib_path)
+    pk2_lib.pk2_decompress.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_void_p, ctypes.c_size_t]
+    pk2_lib.pk2_decompress.restype = ctypes.c_long
+    break
+  has_native = pk2_lib != None
+except (ImportError, OSError, AttributeError):
+  has_native = False
+
+PK2_HEADER_SIZE = 0xC
+PK2_WINDOW_SIZE = 0x4000
+PK2_MAX_GROUP_SIZE = 4 + 0x1E * 2
+PK2_INPUT_READ_SIZE = 0x10000
+DEFAULT_CHUNK_SIZE = 0x10000
+
+def read_header(data):
+  stream_size = data[0x4] | (data[0x5] << 0x8) | (data[0x6] << 0x10)
+  check_sum = SWAPPED_U32.unpack_from(data, 0x8)[0]
+  return stream_size, check_sum
+
+class PK2Stream(io.RawIOBase):
+  # Incremental decoder that only keeps the back-reference window and the chunk being filled
+  def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+    if not hasattr(source, "read"): source = BinaryReader(source)
+    self.source = source
+    self.stream_size, self.check_sum = read_header(bytes(source.read(PK2_HEADER_SIZE)))
+    self.chunk_size = chunk_size
+    self.chunk_iter = None
+    self.current = b""
+    self.current_offset = 0
+  
+  def readable(self):
+    return True
+  
+  def readinto(self, b):
+    if self.chunk_iter == None: self.chunk_iter = self.chunks()
+    while self.current_offset >= len(self.current):
+      self.current = next(self.chunk_iter, None)
+      self.current_offset = 0
+      if self.current == None:
+        self.current = b""
+        return 0
+    length = min(len(b), len(self.current) - self.current_offset)
+    b[:length] = self.current[self.current_offset:self.current_offset + length]
+    self.current_offset += length
+    return length
+  
+  def chunks(self):
+    read = self.source.read
+    stream_size = self.stream_size
+    chunk_size = self.chunk_size
+    data = bytes(read(PK2_INPUT_READ_SIZE))
+    data_size = len(data)
+    src = 0
+    out = bytearray()
+    emitted = 0
+    dropped = 0
+    check_sum = 0
+    limit = stream_size
+    while len(out) < limit:
+      if data_size - src < PK2_MAX_GROUP_SIZE:
+        more = read(PK2_INPUT_READ_SIZE)
+        if more:
+          data = data[src:] + bytes(more)
+          data_size = len(data)
+          src = 0
+      if src + 4 > data_size: raise ValueError("PK2 stream ended early")
+      ctrl = (data[src] << 0x18) | (data[src + 1] << 0x10) | (data[src + 2] << 0x8) | data[src + 3]
+      src += 4
+      mask = ctrl & 3
+      count_shift = 0xE - mask
+      distance_mask = 0x3FFF >> mask
+      bit = 31
+      while bit > 1 and len(out) < limit:
+        if (ctrl >> bit) & 1:
+          if src + 2 > data_size: raise ValueError("PK2 stream ended early")
+          short = (data[src] << 0x8) | data[src + 1]
+          src += 2
+          count = ((short >> count_shift) & 0x1F) + 3
+          distance = (short & distance_mask) + 1
+          start = len(out) - distance
+          if start < 0: raise ValueError("PK2 back-reference before start of stream")
+          if count <= distance:
+            out += out[start:start + count]
+          else:
+            out += (out[start:] * (count // distance + 1))[:count]
+          bit -= 1
+        else:
+          # Copy the whole run of literal flags below this bit in one slice
+          next_match = (ctrl & ((2 << bit) - 1) & ~3).bit_length()
+          run = min(bit + 1 - max(next_match, 2), limit - len(out))
+          if src + run > data_size: raise ValueError("PK2 stream ended early")
+          out += data[src:src + run]
+          src += run
+          bit -= run
+      if len(out) - emitted >= chunk_size and len(out) < limit:
+        chunk = bytes(out[emitted:])
+        check_sum += sum(chunk)
+        yield chunk
+        drop = len(out) - PK2_WINDOW_SIZE
+        if drop > 0:
+          del out[:drop]
+          dropped += drop
+          limit -= drop
+        emitted = len(out)
+    del out[limit:]
+    chunk = bytes(out[emitted:])
+    check_sum += sum(chunk)
+    if check_sum != self.check_sum:
+      print("ERROR! %x" % check_sum)
+    if chunk: yield chunk
+
+def decompress_python(source):
+  stream = PK2Stream(source)
+  out = bytearray(stream.stream_size)
+  offset = 0
+  for chunk in stream.chunks():
+    out[offset:offset + len(chunk)] = chunk
+    offset += len(chunk)
+  return out
+
+def decompress_native(data):
+  stream_size, check_sum = read_header(data)
+  out = bytearray(stream_size)
+  out_buffer = (ctypes.c_ubyte * stream_size).from_buffer(out)
+  result = pk2_lib.pk2_decompress(data, len(data), out_buffer, stream_size)
+  del out_buffer
+  if result < 0: raise ValueError("PK2 stream is corrupt")
+  computed_sum = sum(out)
+  if computed_sum != check_sum:
+    print("ERROR! %x" % computed_sum)
+  return out
+
+def decompress(source, use_native=True):
+  # source is either the compressed bytes or a file object positioned at the PK2 header
+  if use_native and has_native:
+    data = source.read() if hasattr(source, "read") else source
+    if not isinstance(data, bytes): data = bytes(data)
+    return decompress_native(data)
+  return decompress_python(source)
+
+def read_data(f):
+  # Returns a BinaryReader over the file contents, decompressing PK2 streams straight into the reader's buffer
+  start = f.tell()
+  magic = f.read(3)
+  f.seek(start)
+  if magic == b"PK2": return BinaryReader(decompress(f))
+  return BinaryReader(f.read())
+
+class Decompressor:
+  def __init__(self, original_data):
+    if isinstance(original_data, BytesIO): original_data = original_data.getbuffer()
+    self.decompressed = BytesIO(decompress(original_data))
+
+if __name__ == '__main__':
+  if len(sys.argv) == 2:
+    with open(sys.argv[1], "rb") as f:
+      data = decompress(f)
+    output_path = os.path.join(os.path.dirname(sys.argv[1]), "out_" + os.path.basename(sys.argv[1]))
+    with open(output_path, "wb") as wf:
+      wf.write(data)
@@ -217,3 +217,206 @@ def align_data_to_nearest(data, size):
   padding_needed = next_offset - current_end
   data.seek(current_end)
   data.write(b"\0"*padding_needed)
+
+
+SWAPPED_U16 = struct.Struct("<H")
+SWAPPED_S16 = struct.Struct("<h")
+SWAPPED_U32 = struct.Struct("<I")
+SWAPPED_S32 = struct.Struct("<i")
+SWAPPED_FLOAT = struct.Struct("<f")
+U8 = struct.Struct(">B")
+
+class BinaryReader:
+  # Cursor over an in-memory buffer. The sread_* methods decode the same values as the
+  # module level sread_* functions, but unpack directly from a memoryview instead of
+  # seeking and copying every field out of a BytesIO.
+  # seek/tell/read are kept so it can be passed anywhere a file object was used before.
+  def __init__(self, data, offset=0):
+    if isinstance(data, BinaryReader):
+      data = data.raw
+    elif not isinstance(data, (bytes, bytearray)):
+      data = bytes(data)
+    self.raw = data
+    self.buffer = memoryview(data)
+    self.size = len(data)
+    self.offset = offset
+  
+  def tell(self):
+    return self.offset
+  
+  def seek(self, offset, whence=0):
+    if whence == 1:
+      offset += self.offset
+    elif whence == 2:
+      offset += self.size
+    self.offset = offset
+    return self.offset
+  
+  def read(self, length=-1):
+    start = self.offset
+    if length is None or length < 0:
+      end = self.size
+    else:
+      end = min(start + length, self.size)
+    self.offset = max(end, start)
+    return self.raw[start:end]
+  
+  def getvalue(self):
+    return self.raw
+  
+  def view(self, offset, length):
+    return self.buffer[offset:offset+length]
+  
+  def unpack(self, unpacker, offset=None):
+    if offset is not None:
+      self.offset = offset
+    values = unpacker.unpack_from(self.buffer, self.offset)
+    self.offset += unpacker.size
+    return values
+  
+  def read_u8(self, offset=None):
+    return self.unpack(U8, offset)[0]
+  
+  def sread_u16(self, offset=None):
+    return self.unpack(SWAPPED_U16, offset)[0]
+  
+  def sread_s16(self, offset=None):
+    return self.unpack(SWAPPED_S16, offset)[0]
+  
+  def sread_u32(self, offset=None):
+    return self.unpack(SWAPPED_U32, offset)[0]
+  
+  def sread_s32(self, offset=None):
+    return self.unpack(SWAPPED_S32, offset)[0]
+  
+  def sread_float(self, offset=None):
+    return self.unpack(SWAPPED_FLOAT, offset)[0]
+  
+  def sread_array(self, format_char, count, offset=None):
+    return list(self.unpack(get_struct("<%d%s" % (count, format_char)), offset))
+  
+  def read_u8s(self, count, offset=None):
+    return self.sread_array("B", count, offset)
+  
+  def sread_u16s(self, count, offset=None):
+    return self.sread_array("H", count, offset)
+  
+  def sread_u32s(self, count, offset=None):
+    return self.sread_array("I", count, offset)
+  
+  def sread_floats(self, count, offset=None):
+    return self.sread_array("f", count, offset)
+  
+  def sread_records(self, format_string, count, offset=None):
+    # Reads count consecutive records laid out as format_string (little-endian) in one pass.
+    if offset is not None:
+      self.offset = offset
+    unpacker = get_struct("<" + format_string)
+    end = self.offset + unpacker.size * count
+    if end > self.size:
+      raise struct.error("unpack requires a buffer of %d bytes" % (end - self.offset))
+    records = list(unpacker.iter_unpack(self.buffer[self.offset:end]))
+    self.offset = end
+    return records
+  
+  def read_str_until_null_character(self, offset):
+    if offset > self.size:
+      raise InvalidOffsetError("Offset %X is past the end of the data (length %X)." % (offset, self.size))
+    end = self.raw.find(b"\0", offset)
+    if end < 0:
+      end = self.size
+    self.offset = end
+    return self.raw[offset:end].decode("shift_jis")
+
+structs = {}
+def get_struct(format_string):
+  unpacker = structs.get(format_string)
+  if unpacker is None:
+    unpacker = structs[format_string] = struct.Struct(format_string)
+  return unpacker
+
+class BinaryWriter:
+  # Append-only output buffer for the save_changes paths. The swrite_* methods produce the same
+  # bytes as write_*(data, data.tell(), swap*(value)), packed straight into one bytearray.
+  # Passing an offset overwrites bytes that were already written, e.g. to back-patch a block size.
+  def __init__(self):
+    self.buffer = bytearray()
+  
+  def tell(self):
+    return len(self.buffer)
+  
+  def getvalue(self):
+    return bytes(self.buffer)
+  
+  def write(self, raw_bytes):
+    self.buffer += raw_bytes
+  
+  def pack(self, packer, value, offset=None):
+    if offset is None:
+      self.buffer += packer.pack(value)
+    else:
+      packer.pack_into(self.buffer, offset, value)
+  
+  def write_u8(self, value, offset=None):
+    self.pack(U8, value, offset)
+  
+  def swrite_u16(self, value, offset=None):
+    self.pack(SWAPPED_U16, value, offset)
+  
+  def swrite_s16(self, value, offset=None):
+    self.pack(SWAPPED_S16, value, offset)
+  
+  def swrite_u32(self, value, offset=None):
+    self.pack(SWAPPED_U32, value, offset)
+  
+  def swrite_s32(self, value, offset=None):
+    self.pack(SWAPPED_S32, value, offset)
+  
+  def swrite_float(self, value, offset=None):
+    self.pack(SWAPPED_FLOAT, value, offset)
+  
+  def swrite_array(self, format_char, values):
+    self.buffer += get_struct("<%d%s" % (len(values), format_char)).pack(*values)
+  
+  def write_u8s(self, values):
+    self.buffer += bytes(values)
+  
+  def swrite_u16s(self, values):
+    self.swrite_array("H", values)
+  
+  def swrite_u32s(self, values):
+    self.swrite_array("I", values)
+  
+  def swrite_floats(self, values):
+    self.swrite_array("f", values)
+  
+  def swrite_records(self, format_string, records):
+    packer = get_struct("<" + format_string)
+    self.buffer += b"".join([packer.pack(*record) for record in records])
+  
+  def write_str(self, new_string, max_length):
+    str_len = len(new_string)
+    if str_len > max_length:
+      raise Exception("String %s is too long (max length %X)" % (new_string, max_length))
+    self.buffer += new_string.encode("shift_jis") + b"\x00"*(max_length - str_len)
+  
+  def write_str_with_null_byte(self, new_string):
+    self.write_str(new_string, len(new_string)+1)
+  
+  def write_magic_str(self, new_string, max_length):
+    self.write_str(new_string, max_length)
+  
+  def align(self, size, origin=0):
+    self.buffer += b"\0"*((size - (len(self.buffer) - origin) % size) % size)
+  
+  def begin_block(self, magic):
+    # Writes the magic and a placeholder size, returns the offset for end_block.
+    block_offset = len(self.buffer)
+    self.write_magic_str(magic, 4)
+    self.swrite_u32(0)
+    return block_offset
+  
+  def end_block(self, block_offset):
+    block_size = len(self.buffer) - block_offset - 0x8
+    self.swrite_u32(block_size, block_offset + 0x4)
+    return block_size
@@ -0,0 +1,63 @@
+import numpy as np
+
+# NumPy backed stand-ins for the part of mathutils the format readers use, so they also run outside Blender.
+# Matrices are row major like mathutils and Matrix @ 3D Vector treats the vector as a point (w = 1) and drops w again.
+# to_mathutils and from_mathutils convert at the Blender boundary.
+
+class Vector(np.ndarray):
+  def __new__(cls, values=(0.0, 0.0, 0.0)):
+    return np.array(values, dtype=np.float64).reshape(-1).view(cls)
+  
+  @property
+  def x(self): return float(self[0])
+  @x.setter
+  def x(self, value): self[0] = value
+  
+  @property
+  def y(self): return float(self[1])
+  @y.setter
+  def y(self, value): self[1] = value
+  
+  @property
+  def z(self): return float(self[2])
+  @z.setter
+  def z(self, value): self[2] = value
+  
+  @property
+  def w(self): return float(self[3])
+  @w.setter
+  def w(self, value): self[3] = value
+
+class Matrix(np.ndarray):
+  def __new__(cls, rows=None):
+    if rows is None: return np.identity(4).view(cls)
+    return np.array([list(row) for row in rows], dtype=np.float64).view(cls)
+  
+  def transposed(self):
+    return Matrix(np.asarray(self).T)
+  
+  def inverted_safe(self):
+    # Singular matrices fall back to the pseudo inverse instead of raising
+    try: return Matrix(np.linalg.inv(np.asarray(self)))
+    except np.linalg.LinAlgError: return Matrix(np.linalg.pinv(np.asarray(self)))
+  
+  def __matmul__(self, other):
+    matrix = np.asarray(self)
+    other = np.asarray(other, dtype=np.float64)
+    if other.ndim == 1 and len(other) == len(matrix) - 1:
+      return Vector((matrix @ np.append(other, 1.0))[:-1])
+    result = matrix @ other
+    return Vector(result) if result.ndim == 1 else Matrix(result)
+
+def to_mathutils(value):
+  import mathutils
+  if isinstance(value, np.ndarray):
+    if value.ndim == 2: return mathutils.Matrix(value.tolist())
+    return mathutils.Vector(value.tolist())
+  return value
+
+def from_mathutils(value):
+  import mathutils
+  if isinstance(value, mathutils.Matrix): return Matrix(value)
+  if isinstance(value, mathutils.Vector): return Vector(value)
+  return value
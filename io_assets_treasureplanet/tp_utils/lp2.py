@@ -2,17 +2,29 @@ from io import BytesIO
 import os
 from fs_helpers import *
 from adef import Adef, ActorStringsEntry
-from bsptree import BSPTree
+from bsptree import BSPTree, preorder_links, pack_bsp, unpack_bsp
 import math
-from mathutils import Vector, Matrix, Euler
-from vector4 import Vector4
+import numpy as np
+from linalg import Vector, Matrix
+from strips import strip_triangles
+
+# Render strip vertex: position and strip flags (0x8000 restarts the strip)
+VERTEX_RECORD = np.dtype([("position", "<f4", 3), ("flags", "<u4")])
+
+def read_array(data, dtype, count):
+  array = np.frombuffer(data.buffer, dtype=dtype, count=count, offset=data.tell()).copy()
+  data.seek(array.nbytes, 1)
+  return array
+
+def concat_rows(parts, width, dtype):
+  if len(parts) == 0: return np.zeros((0, width), dtype=dtype)
+  return np.concatenate(parts).astype(dtype, copy=False)
 
 def load_adef(path):
   adef_data = None
   adef_path = os.path.join(path, "adef.sama")
   with open (adef_path, "rb") as f:
-    adef_data = BytesIO(f.read())
-    adef_data.seek(0)
+    adef_data = BinaryReader(f.read())
   adef = Adef(adef_data)
   return adef
 
@@ -24,26 +36,23 @@ class LevelMaterialsEntry:
     self.count = 0
     self.materials = []
     if self.data == None: return
-
+    
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.count = self.data.sread_u32()
     #print("Mat section beginning: %08x" % self.entry_offset)
     for i in range(self.count):
       self.materials.append(LevelMaterialEntry(mat_data=self.data))
     
     self.data.seek(self.block_size + 0x4 + self.entry_offset)
   
-  def save_changes(self):
-    output = BytesIO()
-    write_magic_str(output, output.tell(), "MAT ", 4)
-    write_u32(output, output.tell(), 0)
-    write_u32(output, output.tell(), swap32(len(self.materials)))
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    block_offset = output.begin_block("MAT ")
+    output.swrite_u32(len(self.materials))
     for material in self.materials:
-      output.write(material.save_changes().read())
-    self.block_size = data_len(output) - 0x8
-    write_u32(output, 0x4, swap32(self.block_size))
-    output.seek(0)
+      material.save_changes(output)
+    self.block_size = output.end_block(block_offset)
     return output
 
 class LevelMaterialEntry:
@@ -86,8 +95,8 @@ class LevelMaterialEntry:
     self.normals = normals
     self.properties = []
     if self.data == None: return
-
-    self.lod_flags = sread_u32(self.data, self.data.tell())
+    
+    self.lod_flags = self.data.sread_u32()
     #0: Render
     #1: Render when mid?
     #3: Render when close?
@@ -98,13 +107,13 @@ class LevelMaterialEntry:
       #self.lod_flags = 0
     #self.lod_flags = self.lod_flags & 0x7fffffff
     
-    self.mat_properties = sread_u16(self.data, self.data.tell())
-    self.uv_maps = sread_u16(self.data, self.data.tell())
-    self.normals = sread_u16(self.data, self.data.tell())
+    self.mat_properties = self.data.sread_u16()
+    self.uv_maps = self.data.sread_u16()
+    self.normals = self.data.sread_u16()
     #print("Mat properties len: " + str(self.mat_properties))
     for i in range(self.mat_properties):
       #print("Mat property entry: %08x" % self.data.tell())
-      prop_data = self.LevelMaterialDataEntry(sread_u16(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()))
+      prop_data = self.LevelMaterialDataEntry(self.data.sread_u16(), self.data.read_u8(), self.data.read_u8(), self.data.read_u8())
       #print("Material Property - Texture: " + textures[prop_data.texture_index].name + " Prop Bytes: " + hex(prop_data.flags) + " " + hex(prop_data.type) + " " + hex(prop_data.uv))
       self.properties.append(prop_data)
     if self.mat_properties != 0:
@@ -117,20 +126,13 @@ class LevelMaterialEntry:
     self.properties.append(prop)
     self.mat_properties = len(self.properties)
   
-  def save_changes(self):
-    output = BytesIO()
-    write_u32(output, output.tell(), swap32(self.lod_flags))
-    write_u16(output, output.tell(), swap16(self.mat_properties))
-    write_u16(output, output.tell(), swap16(self.uv_maps))
-    write_u16(output, output.tell(), swap16(self.normals))
-    for prop in self.properties:
-      write_u16(output, output.tell(), swap16(prop.texture_index))
-      write_u8(output, output.tell(), prop.flags)
-      write_u8(output, output.tell(), prop.type)
-      write_u8(output, output.tell(), prop.uv)
-    output.seek(0)
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    output.swrite_u32(self.lod_flags)
+    output.swrite_u16s([self.mat_properties, self.uv_maps, self.normals])
+    output.swrite_records("H3B", [(prop.texture_index, prop.flags, prop.type, prop.uv) for prop in self.properties])
     return output
-
+  
   def printInfo(self, textures):
     print("Material properties: %d UV Maps: %d Normals: %d" % (self.mat_properties, self.uv_maps, self.normals))
     for i in range(self.mat_properties):
@@ -141,130 +143,171 @@ class LevelMaterialEntry:
       print("Material Property - Texture: " + textureName + " Prop Bytes: " + hex(prop_data.flags) + " " + hex(prop_data.type) + " " + hex(prop_data.uv))
 
 class GeometrySection:
-  def __init__(self, data, versionNo, materials):
+  def __init__(self, data, versionNo, materials, lazy=False):
+    # lazy only walks the size fields, sections and instances are decoded on first use
     self.data = data
+    self.versionNo = versionNo
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
     
     self.render_section_start = self.data.tell()
-    self.render_section_count = sread_u32(self.data, self.data.tell())
+    self.render_section_count = self.data.sread_u32()
     print("Render Section Count: " + str(self.render_section_count))
     self.render_sections = []
     for i in range(self.render_section_count):
-      self.render_sections.append(RenderSection(self.data, materials))
+      self.render_sections.append(RenderSection(self.data, materials, lazy))
     
     self.collision_section_start = self.data.tell()
-    self.collision_section_count = sread_u32(self.data, self.data.tell())
+    self.collision_section_count = self.data.sread_u32()
     print("Collision Section Count: " + str(self.collision_section_count))
     self.collision_sections = []
     for i in range(self.collision_section_count):
-      self.collision_sections.append(CollisionSection(self.data))
+      self.collision_sections.append(CollisionSection(self.data, lazy))
     
     
     self.render_section_instance_count = -1
-    if versionNo > 3: self.render_section_instance_count = sread_u32(self.data, self.data.tell())
+    if versionNo > 3: self.render_section_instance_count = self.data.sread_u32()
     
     self.static_section_start = self.data.tell()
     print("Instance Section Start: " + hex(self.static_section_start))
     
-    render_instance_count = 0
-    collision_instance_count = 0
-    
-    self.model_instance_count = sread_u32(self.data, self.data.tell())
+    self.static_instances = None
+    self.dynamic_instances = None
+    if lazy:
+      self.model_instance_count, render_instance_count = self.skip_instances()
+    else:
+      self.static_instances = self.read_instances()
+      self.model_instance_count = len(self.static_instances)
+      render_instance_count = sum(instance.rend_inst_count for instance in self.static_instances)
     print("Model Instance Count: " + str(self.model_instance_count))
-    self.model_instances = []
-    for i in range(self.model_instance_count):
-      self.model_instances.append(LevelModelInstance(self.data, versionNo, render_instance_count, collision_instance_count))
-      render_instance_count += self.model_instances[-1].rend_inst_count
-      collision_instance_count += self.model_instances[-1].coll_inst_count
     
     print("Stored Render Section Instance Count: " + str(self.render_section_instance_count))
     if versionNo > 3: self.render_section_instance_count = render_instance_count
     print("Static Render Section Instance Count: " + str(render_instance_count))
-    print("Static Collision Section Instance Count: " + str(collision_instance_count))
-    
-    render_instance_count = 0
-    collision_instance_count = 0
     
     self.dynamic_section_start = self.data.tell()
     print("Dynamic Instance Section Start: " + hex(self.dynamic_section_start))
-    self.dynamic_model_instance_count = sread_u32(self.data, self.data.tell())
+    if lazy:
+      self.dynamic_model_instance_count, render_instance_count = self.skip_instances()
+    else:
+      self.dynamic_instances = self.read_instances()
+      self.dynamic_model_instance_count = len(self.dynamic_instances)
     print("Dynamic Model Instance Count: " + str(self.dynamic_model_instance_count))
-    self.dynamic_model_instances = []
-    for i in range(self.dynamic_model_instance_count):
-      self.dynamic_model_instances.append(LevelModelInstance(self.data, versionNo, render_instance_count, collision_instance_count))
-      render_instance_count += self.dynamic_model_instances[-1].rend_inst_count
-      collision_instance_count += self.dynamic_model_instances[-1].coll_inst_count
-    
-    print("Dynamic Render Section Instance Count: " + str(render_instance_count))
-    print("Dynamic Collision Section Instance Count: " + str(collision_instance_count))
+    self.dynamic_section_end = self.data.tell()
     
     self.data.seek(self.block_size + 0x4 + self.entry_offset) # Shouldn't be needed anymore
   
-  def save_injected_changes(self, versionNo):
-    out_data = BytesIO()
-    write_magic_str(out_data, 0x0, "SECT", 4)
-    write_u32(out_data, 0x4, 0)
-    
-    #self.data.seek(self.render_section_start)
-    #write_bytes(out_data, out_data.tell(), self.data.read(self.collision_section_start - self.render_section_start))
-    write_u32(out_data, out_data.tell(), swap32(len(self.render_sections)))
+  def read_instances(self):
+    instance_count = self.data.sread_u32()
+    instances = []
+    render_instance_count = 0
+    collision_instance_count = 0
+    for i in range(instance_count):
+      instances.append(LevelModelInstance(self.data, self.versionNo, render_instance_count, collision_instance_count))
+      render_instance_count += instances[-1].rend_inst_count
+      collision_instance_count += instances[-1].coll_inst_count
+    return instances
+  
+  def skip_instances(self):
+    instance_count = self.data.sread_u32()
+    render_instance_count = 0
+    for i in range(instance_count):
+      render_instance_count += LevelModelInstance.skip(self.data, self.versionNo)
+    return instance_count, render_instance_count
+  
+  def load_instances(self):
+    position = self.data.tell()
+    self.data.seek(self.static_section_start)
+    static_instances = self.read_instances()
+    dynamic_instances = self.read_instances()
+    if self.static_instances == None: self.static_instances = static_instances
+    if self.dynamic_instances == None: self.dynamic_instances = dynamic_instances
+    self.data.seek(position)
+  
+  @property
+  def model_instances(self):
+    if self.static_instances == None: self.load_instances()
+    return self.static_instances
+  
+  @property
+  def dynamic_model_instances(self):
+    if self.dynamic_instances == None: self.load_instances()
+    return self.dynamic_instances
+  
+  @dynamic_model_instances.setter
+  def dynamic_model_instances(self, instances):
+    self.dynamic_instances = instances
+  
+  def save_injected_changes(self, versionNo, out_data=None):
+    if out_data == None: out_data = BinaryWriter()
+    block_offset = out_data.begin_block("SECT")
+    
+    # Sections that were never decoded or changed still point at their source bytes
+    out_data.swrite_u32(len(self.render_sections))
     for rend_sect in self.render_sections:
-      rend_sect.data.seek(rend_sect.entry_offset)
-      write_bytes(out_data, out_data.tell(), rend_sect.data.read(rend_sect.data_size))
+      out_data.write(rend_sect.data.view(rend_sect.entry_offset, rend_sect.data_size))
     
-    #self.data.seek(self.collision_section_start)
-    #write_bytes(out_data, out_data.tell(), self.data.read(self.static_section_start - self.collision_section_start))
-    write_u32(out_data, out_data.tell(), swap32(len(self.collision_sections)))
+    out_data.swrite_u32(len(self.collision_sections))
     for coll_sect in self.collision_sections:
-      coll_sect.data.seek(coll_sect.entry_offset)
-      write_bytes(out_data, out_data.tell(), coll_sect.data.read(coll_sect.data_size))
+      out_data.write(coll_sect.data.view(coll_sect.entry_offset, coll_sect.data_size))
     
     
-    if versionNo > 3: write_u32(out_data, out_data.tell(), swap32(self.render_section_instance_count))
-    #self.data.seek(self.static_section_start)
-    #write_bytes(out_data, out_data.tell(), self.data.read(self.dynamic_section_start - self.static_section_start))
-    write_u32(out_data, out_data.tell(), swap32(len(self.model_instances)))
-    for instance in self.model_instances:
-      instance.data.seek(instance.entry_offset)
-      write_bytes(out_data, out_data.tell(), instance.data.read(instance.data_size))
-    
-    #self.data.seek(self.dynamic_section_start)
-    #write_bytes(out_data, out_data.tell(), self.data.read((self.block_size + 0x4 + self.entry_offset) - self.dynamic_section_start))
+    if versionNo > 3: out_data.swrite_u32(self.render_section_instance_count)
+    if self.static_instances == None:
+      out_data.write(self.data.view(self.static_section_start, self.dynamic_section_start - self.static_section_start))
+    else:
+      out_data.swrite_u32(len(self.static_instances))
+      for instance in self.static_instances:
+        out_data.write(instance.data.view(instance.entry_offset, instance.data_size))
     
-    write_u32(out_data, out_data.tell(), swap32(len(self.dynamic_model_instances)))
-    for instance in self.dynamic_model_instances:
-      write_bytes(out_data, out_data.tell(), instance.save_changes(versionNo).read())
+    if self.dynamic_instances == None:
+      out_data.write(self.data.view(self.dynamic_section_start, self.dynamic_section_end - self.dynamic_section_start))
+    else:
+      out_data.swrite_u32(len(self.dynamic_instances))
+      for instance in self.dynamic_instances:
+        instance.save_changes(versionNo, out_data)
     
-    out_data.seek(0)
-    self.block_size = data_len(out_data) - 0x8
-    write_u32(out_data, 0x4, swap32(self.block_size))
-    out_data.seek(0)
+    self.block_size = out_data.end_block(block_offset)
     return out_data
 
 class CollisionSection:
-  def __init__(self, data = None):
+  def __init__(self, data = None, lazy = False):
     self.data = data
     self.entry_offset = 0
     self.data_size = 0
+    self.loaded = True
     self.bounding_floats = [0.0]*6
     self.coll_geom_count = 0
     self.collision_geometry = []
     if self.data == None: return
-
+    
     self.entry_offset = self.data.tell()
     #Local space section bounds: x,x y,y z,z
-    self.bounding_floats = [sread_float(self.data, self.data.tell()) for _ in range(6)]
+    self.bounding_floats = self.data.sread_floats(6)
     #print(self.bounding_floats)
-    #for i in range(6): self.bounding_floats = self.bounding_floats + [sread_float(self.data, self.data.tell())]
+    #for i in range(6): self.bounding_floats = self.bounding_floats + [self.data.sread_float()]
     
     #print("")
-    self.coll_geom_count = sread_u32(self.data, self.data.tell())
-    for i in range(self.coll_geom_count):
-      self.collision_geometry.append(CollisionGeometry(self.data))
+    self.coll_geom_count = self.data.sread_u32()
+    if lazy:
+      self.loaded = False
+      for i in range(self.coll_geom_count):
+        CollisionGeometry.skip(self.data)
+    else:
+      for i in range(self.coll_geom_count):
+        self.collision_geometry.append(CollisionGeometry(self.data))
     self.data_size = self.data.tell() - self.entry_offset
   
+  def load(self):
+    if self.loaded: return
+    position = self.data.tell()
+    self.data.seek(self.entry_offset + 0x1C)
+    self.collision_geometry = [CollisionGeometry(self.data) for i in range(self.coll_geom_count)]
+    self.data.seek(position)
+    self.loaded = True
+  
   def inject_changes(self, mesh_data, minVec, maxVec):
+    self.loaded = True
     self.bounding_floats = list(minVec[:]) + list(maxVec[:])
     original_geometry = self.collision_geometry
     self.collision_geometry = []
@@ -274,24 +317,25 @@ class CollisionSection:
       #mesh_data[groupIndex]["verts"] = og.vertices
       #mesh_data[groupIndex]["edges"] = og.edges
       #mesh_data[groupIndex]["faces"] = [(og.tri_vert_indices[i], og.tri_edge_indices[i], og.tri_normals[i]) for i in range(len(og.tri_vert_indices))]
-
+      
       group = CollisionGeometry()
       group.inject_changes(mesh_data[groupIndex])
       self.collision_geometry.append(group)
     self.coll_geom_count = len(self.collision_geometry)
-
+  
   def save_changes(self):
-    output = BytesIO()
-    for f in range(6): write_float(output, output.tell(), swapfloat(self.bounding_floats[f]))
-    write_u32(output, output.tell(), swap32(self.coll_geom_count))
+    self.load()
+    output = BinaryWriter()
+    output.swrite_floats(self.bounding_floats[0:6])
+    output.swrite_u32(self.coll_geom_count)
     for geom in self.collision_geometry:
-      output.write(geom.save_changes().read())
+      geom.save_changes(output)
     self.entry_offset = 0
-    self.data = output
-    self.data_size = data_len(self.data)
-    self.data.seek(0)
-
+    self.data = BinaryReader(output.buffer)
+    self.data_size = self.data.size
+  
   def get_geometry_per_section(self):
+    self.load()
     added_offset = 0
     vertex_groups = []
     for i in range(self.coll_geom_count):
@@ -330,161 +374,79 @@ class CollisionGeometry:
     self.tri_edge_indices = []
     self.tri_normals = []
     self.bsp_count = 0
-    self.bsp_root = None
+    # Preorder BSP nodes: triangle list offsets, triangle indices and front/back child present flags
+    self.bsp_offsets = np.zeros(1, dtype=np.int64)
+    self.bsp_triangles = np.zeros(0, dtype=np.int64)
+    self.bsp_children = np.zeros((0, 2), dtype=bool)
+    self.bsp_fronts = np.zeros(0, dtype=np.int64)
+    self.bsp_backs = np.zeros(0, dtype=np.int64)
     if self.data == None: return
-
+    
     self.entry_offset = self.data.tell()
     
-    self.layer_mask = sread_u32(self.data, self.data.tell())
+    self.layer_mask = self.data.sread_u32()
     #breakpoint at 00224654 and check s3+0x1C
     #print(f"%08x" % self.layer_mask)
     
     #Vertex Section
-    self.vertex_count = sread_u16(self.data, self.data.tell())
-    _v = []
-    for v in range(self.vertex_count):
-      for vf in range(4):
-        _v.append(sread_float(self.data, self.data.tell()))
+    self.vertex_count = self.data.sread_u16()
+    _v = self.data.sread_floats(self.vertex_count * 4)
     self.vertices = [_v[i:i+4] for i in range(0, len(_v), 4)]
     
     #Edge Section
-    self.edge_count = sread_u16(self.data, self.data.tell())
-    _edges = []
-    for e in range(self.edge_count * 2):
-      _edges.append(sread_u16(self.data, self.data.tell()))
+    self.edge_count = self.data.sread_u16()
+    _edges = self.data.sread_u16s(self.edge_count * 2)
     self.edges = [_edges[i:i+2] for i in range(0, len(_edges), 2)]
     
     #Triangle Section
-    self.triangle_count = sread_u16(self.data, self.data.tell())
-    _tri_vert_indices = []
-    _tri_edge_indices = []
-    _tri_normals = []
-    for t in range(self.triangle_count):
-      for tv in range(3):
-        _tri_vert_indices.append(sread_u16(self.data, self.data.tell()))
-      for te in range(3):
-        _tri_edge_indices.append(sread_u16(self.data, self.data.tell()))
-      for tn in range(4):
-        _tri_normals.append(sread_float(self.data, self.data.tell()))
-    self.tri_vert_indices = [_tri_vert_indices[i:i+3] for i in range(0, len(_tri_vert_indices), 3)]
-    self.tri_edge_indices = [_tri_edge_indices[i:i+3] for i in range(0, len(_tri_edge_indices), 3)]
-    self.tri_normals = [_tri_normals[i:i+4] for i in range(0, len(_tri_normals), 4)]
+    self.triangle_count = self.data.sread_u16()
+    _triangles = self.data.sread_records("6H4f", self.triangle_count)
+    self.tri_vert_indices = [list(t[0:3]) for t in _triangles]
+    self.tri_edge_indices = [list(t[3:6]) for t in _triangles]
+    self.tri_normals = [list(t[6:10]) for t in _triangles]
     
     
     #BSP Section
-    #print("--LOADED--")
-    tri_list = []
-    self.bsp_root = self.load_collision_bsp(1, tri_list)
-    #print(tri_list)
+    self.load_bsp()
     #print("Collision Section: " + str(s) + " Part: " + str(g) + " Vertex Count: " + str(self.vertex_count) + " Triangle Count: " + str(self.triangle_count) + " Edge Count: " + str(self.edge_count) + " BSP Count: " + str(self.bsp_count))
   
-  class CollisionBSPNode:
-    def __init__(self, bsp_tri_count, bsp_tris, nodeA=None, nodeB=None):
-      self.triangle_count = bsp_tri_count
-      self.triangles = bsp_tris
-      self.nodeA = nodeA
-      self.nodeB = nodeB
-  
-  def load_collision_bsp(self, count=1, tri_list = []):
-    if self.bsp_count < count:
-      self.bsp_count = count
-    nodeA = None
-    nodeB = None
-    
-    bsp_triangle_count = sread_u32(self.data, self.data.tell())
-    _bsp_tris = []
-    for i in range(bsp_triangle_count):
-      _bsp_tris.append(sread_u16(self.data, self.data.tell()))
-    bsp_tris = _bsp_tris
-    
-    tri_list.append(bsp_tris)
-    
-    unk_1_cond = sread_u32(self.data, self.data.tell())
-    unk_2_cond = sread_u32(self.data, self.data.tell())
-    if unk_1_cond != 0:
-      nodeA = self.load_collision_bsp(count + 1, tri_list)
-    if unk_2_cond != 0:
-      nodeB = self.load_collision_bsp(count + 1, tri_list)
-    return self.CollisionBSPNode(bsp_triangle_count, bsp_tris, nodeA, nodeB)
-  
-  def bsp_raytrace_flag_tris(self, node, ray_dist, ray_pos, ray_dir, tri_normals, tri_flags):
-    dist_flag1 = False
-    dist_flag2 = False
-    ctn = tri_normals[node.triangles[0]]
-    coll_tri_normal = Vector4(ctn[0], ctn[1], ctn[2], ctn[3])
-
-    in_vec = Vector4(0.0, 0.0, 0.0, 1.0)
-    in_vec = in_vec.xyz + in_vec.w
-    v_mul = ray_pos.xyz * coll_tri_normal
-    tri_dist = (v_mul.x + coll_tri_normal.w) + (in_vec.x * v_mul.y) + (in_vec.x * v_mul.z)
-    v_mul = coll_tri_normal.xyz * ray_dir
-    tri_dist2 = (v_mul.x + coll_tri_normal.w) + (in_vec.x * v_mul.y) + (in_vec.x * v_mul.z)
-
-    if ray_dist < tri_dist: dist_flag1 = True
-    else: dist_flag1 = -ray_dist <= tri_dist
-    dist_flag2 = ray_dist >= tri_dist
-    if ray_dist < tri_dist2: dist_flag1 = True
-    else:
-      if -ray_dist <= tri_dist2: dist_flag1 = True
-      dist_flag2 = True
-    
-    if dist_flag1 and dist_flag2:
-      for bsp_tri in node.triangles: tri_flags[bsp_tri >> 3] |= 1 << (bsp_tri & 0x1f)
-    
-    if dist_flag1 and node.nodeA:
-      self.bsp_raytrace_flag_tris(node.nodeA, ray_dist, ray_pos, ray_dir, tri_normals, tri_flags)
-    if dist_flag2 and node.nodeB:
-      self.bsp_raytrace_flag_tris(node.nodeB, ray_dist, ray_pos, ray_dir, tri_normals, tri_flags)
-  
-  def construct_collision_bsp(self, node, count=1, tri_list = []):
-    if not node: return None
-    if (not node['front']) and (not node['back']) and (not node['triangles_on_plane']): return None
-    if self.bsp_count < count: self.bsp_count = count
-    bsp_tris = []
-    if node['triangles_on_plane']:
-      bsp_tris = [tri.index for tri in node['triangles_on_plane']]
-    tri_list.append(bsp_tris)
-    bsp_triangle_count = len(bsp_tris)
-    nodeA = None
-    nodeB = None
-    if node['front']:
-      nodeA = self.construct_collision_bsp(node['front'], count + 1, tri_list)
-    if node['back']:
-      nodeB = self.construct_collision_bsp(node['back'], count + 1, tri_list)
-    return self.CollisionBSPNode(bsp_triangle_count, bsp_tris, nodeA, nodeB)
-  
-  def save_bsp(self, node, output):
-    write_u32(output, output.tell(), swap32(node.triangle_count))
-    for index in node.triangles: write_u16(output, output.tell(), swap16(index))
-    write_u32(output, output.tell(), swap32(int(node.nodeA != None)))
-    write_u32(output, output.tell(), swap32(int(node.nodeB != None)))
-    if node.nodeA != None:
-      self.save_bsp(node.nodeA, output)
-    if node.nodeB != None:
-      self.save_bsp(node.nodeB, output)
-  
-  def save_changes(self):
-    output = BytesIO()
-    write_u32(output, output.tell(), swap32(self.layer_mask))
-
-    write_u16(output, output.tell(), swap16(self.vertex_count))
-    for vert in self.vertices:
-      for vf in range(4): write_float(output, output.tell(), swapfloat(vert[vf]))
-    
-    write_u16(output, output.tell(), swap16(self.edge_count))
-    for edge in self.edges:
-      for index in edge: write_u16(output, output.tell(), swap16(index))
-    
-    write_u16(output, output.tell(), swap16(self.triangle_count))
-    for t in range(self.triangle_count):
-      for index in self.tri_vert_indices[t]: write_u16(output, output.tell(), swap16(index))
-      for index in self.tri_edge_indices[t]: write_u16(output, output.tell(), swap16(index))
-      for vf in range(4): write_float(output, output.tell(), swapfloat(self.tri_normals[t][vf]))
-    
-    self.save_bsp(self.bsp_root, output)
-    output.seek(0)
+  @staticmethod
+  def skip(data):
+    data.seek(0x4, 1)
+    data.seek(data.sread_u16() * 0x10, 1)
+    data.seek(data.sread_u16() * 0x4, 1)
+    data.seek(data.sread_u16() * 0x1C, 1)
+    pending = 1
+    while pending > 0:
+      pending -= 1
+      data.seek(data.sread_u32() * 0x2, 1)
+      pending += int(data.sread_u32() != 0) + int(data.sread_u32() != 0)
+  
+  def load_bsp(self):
+    self.bsp_offsets, self.bsp_triangles, self.bsp_children = unpack_bsp(self.data)
+    self.link_bsp()
+  
+  def link_bsp(self):
+    # Child indices per node for walking the preorder arrays without recursion
+    self.bsp_fronts, self.bsp_backs, depths = preorder_links(self.bsp_children)
+    self.bsp_count = int(depths.max()) if len(depths) > 0 else 0
+  
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    output.swrite_u32(self.layer_mask)
+    
+    output.swrite_u16(self.vertex_count)
+    output.swrite_records("4f", [vert[0:4] for vert in self.vertices])
+    
+    output.swrite_u16(self.edge_count)
+    output.swrite_records("2H", self.edges)
+    
+    output.swrite_u16(self.triangle_count)
+    output.swrite_records("6H4f", [list(self.tri_vert_indices[t]) + list(self.tri_edge_indices[t]) + list(self.tri_normals[t][0:4]) for t in range(self.triangle_count)])
+    
+    output.write(pack_bsp(self.bsp_offsets, self.bsp_triangles, self.bsp_children))
     return output
-
+  
   def inject_changes(self, mesh_data):
     self.layer_mask = mesh_data["layer"]
     self.vertices = mesh_data["verts"]
@@ -496,18 +458,16 @@ class CollisionGeometry:
       self.tri_edge_indices.append(edge_indices)
       self.tri_normals.append(tri_norm)
     self.triangle_count = len(self.tri_vert_indices)
-
-    tris = [[list(self.vertices[ind][0:3]) for ind in ind_tri] for ind_tri in self.tri_vert_indices]
-    #tris = [tris[i:i+3] for i in range(0, len(tris), 3)]
-    self.bsp_count = 0
-    print("--CONSTRUCTED--")
-    tri_list = []
-    self.bsp_root = self.construct_collision_bsp(BSPTree(tris).root, 1, tri_list)
-    print(tri_list)
+    
+    tree = BSPTree([vertex[0:3] for vertex in self.vertices], self.tri_vert_indices)
+    self.bsp_offsets, self.bsp_triangles, self.bsp_children = tree.node_offsets, tree.node_triangles, tree.node_children
+    self.link_bsp()
 
 class RenderSection:
-  def __init__(self, data=None, materials=None):
+  def __init__(self, data=None, materials=None, lazy=False):
     self.data = data
+    self.materials = materials
+    self.loaded = True
     self.color_maps = 0
     self.bounding_floats = [0.0]*6
     self.sub_mesh_count = 0
@@ -517,18 +477,29 @@ class RenderSection:
     
     self.entry_offset = self.data.tell()
     
-    self.color_maps = sread_u32(self.data, self.data.tell())
+    self.color_maps = self.data.sread_u32()
     #Local space section bounds: x,x y,y z,z
-    self.bounding_floats = [sread_float(self.data, self.data.tell()) for _ in range(6)]
-    #for i in range(6): self.bounding_floats = self.bounding_floats + [sread_float(self.data, self.data.tell())]
-    self.sub_mesh_count = sread_u32(self.data, self.data.tell())
-    self.submeshes = []
-    for i in range(self.sub_mesh_count):
-      geom = RenderedGeometry(materials, self.color_maps, self.data)
-      self.submeshes.append(geom)
+    self.bounding_floats = self.data.sread_floats(6)
+    #for i in range(6): self.bounding_floats = self.bounding_floats + [self.data.sread_float()]
+    self.sub_mesh_count = self.data.sread_u32()
+    if lazy:
+      self.loaded = False
+      for i in range(self.sub_mesh_count):
+        RenderedGeometry.skip(self.data, materials, self.color_maps)
+    else:
+      self.submeshes = [RenderedGeometry(materials, self.color_maps, self.data) for i in range(self.sub_mesh_count)]
     self.data_size = self.data.tell() - self.entry_offset
   
+  def load(self):
+    if self.loaded: return
+    position = self.data.tell()
+    self.data.seek(self.entry_offset + 0x20)
+    self.submeshes = [RenderedGeometry(self.materials, self.color_maps, self.data) for i in range(self.sub_mesh_count)]
+    self.data.seek(position)
+    self.loaded = True
+  
   def inject_changes(self, mesh_data, color_channels, minVec, maxVec, materials):
+    self.loaded = True
     self.color_maps = color_channels
     self.bounding_floats = list(minVec[:]) + list(maxVec[:])
     self.sub_mesh_count = len(mesh_data)
@@ -539,52 +510,46 @@ class RenderSection:
       self.submeshes.append(geom)
   
   def save_changes(self):
-    output = BytesIO()
-    write_u32(output, output.tell(), swap32(self.color_maps))
-    for f in range(6): write_float(output, output.tell(), swapfloat(self.bounding_floats[f]))
-    write_u32(output, output.tell(), swap32(self.sub_mesh_count))
-    for submesh in self.submeshes: output.write(submesh.save_changes().read())
+    self.load()
+    output = BinaryWriter()
+    output.swrite_u32(self.color_maps)
+    output.swrite_floats(self.bounding_floats[0:6])
+    output.swrite_u32(self.sub_mesh_count)
+    for submesh in self.submeshes: submesh.save_changes(output)
     self.entry_offset = 0
-    self.data = output
-    self.data_size = data_len(self.data)
-    self.data.seek(0)
+    self.data = BinaryReader(output.buffer)
+    self.data_size = self.data.size
   
   def get_section_geometry(self):
-    material_uvs = {}
+    material_ranges = []
     section_colors = None
-    if self.color_maps > 0:
-      section_colors = [] #[[] for _ in range(self.color_maps)]
+    color_parts = []
     added_offset = 0
-    uv_offset = 0
     face_offset = 0
     vertex_groups = []
+    vertex_parts = []
+    normal_parts = []
+    face_parts = []
     for submesh_vertices, submesh_normals, submesh_uvs, submesh_colors, submesh_faces, submesh_material_index, submesh_groups in self.get_submesh_geometry():
-      if not submesh_material_index in material_uvs: material_uvs[submesh_material_index] = (face_offset, uv_offset, len(submesh_faces), submesh_uvs)
-      adjusted_indices_flat = [ind + added_offset for face in submesh_faces for ind in face]
-      submesh_groups = [[ind + added_offset for ind in group] for group in submesh_groups]
-      vertex_groups.extend(submesh_groups)
-      adjusted_indices = [adjusted_indices_flat[f:f+3] for f in range(0, len(adjusted_indices_flat), 3)]
-      if added_offset == 0:
-        section_vertices = submesh_vertices.copy()
-        section_normals = submesh_normals.copy()
-        section_faces = adjusted_indices
-        for sc, submesh_color in enumerate(submesh_colors):
-          while sc >= len(section_colors): section_colors.append([])
-          section_colors[sc].extend(submesh_color)
-      else:
-        section_vertices.extend(submesh_vertices)
-        section_normals.extend(submesh_normals)
-        section_faces.extend(adjusted_indices)
-        for sc, submesh_color in enumerate(submesh_colors):
-          while sc >= len(section_colors): section_colors.append([])
-          section_colors[sc].extend(submesh_color)
-      #vertex_groups.append(adjusted_indices_flat)
+      material_ranges.append((submesh_material_index, face_offset, len(submesh_faces), submesh_uvs))
+      vertex_groups.extend([[ind + added_offset for ind in group] for group in submesh_groups])
+      vertex_parts.append(submesh_vertices)
+      normal_parts.append(submesh_normals)
+      face_parts.append(submesh_faces + added_offset)
+      for sc, submesh_color in enumerate(submesh_colors):
+        while sc >= len(color_parts): color_parts.append([])
+        color_parts[sc].append(submesh_color)
       added_offset += len(submesh_vertices)
       face_offset += len(submesh_faces)
-      if len(submesh_uvs) > 0: uv_offset += len(submesh_uvs[0])
-    return section_vertices, section_normals, section_faces, section_colors, material_uvs, vertex_groups
+    if self.color_maps > 0:
+      section_colors = [concat_rows(parts, 4, np.float32) for parts in color_parts]
+    section_vertices = concat_rows(vertex_parts, 3, np.float32)
+    section_normals = concat_rows(normal_parts, 3, np.float32)
+    section_faces = concat_rows(face_parts, 3, np.int64)
+    return section_vertices, section_normals, section_faces, section_colors, material_ranges, vertex_groups
   
   def get_submesh_geometry(self):
+    self.load()
     output = []
     for i, submesh in enumerate(self.submeshes):
       submesh_vertices, submesh_normals, submesh_uvs, submesh_colors, submesh_faces, vertex_groups, submesh_offset = submesh.get_geometry_per_submesh()
@@ -593,164 +558,96 @@ class RenderSection:
 
 class RenderedGeometry:
   class GeomEntry:
+    # Per strip arrays: vertices (N,3), face_data (N,) strip flags, normals (N,3), colors (mat_properties, color_maps, N, 4) uint8,
+    # uvs (uv_maps, N, 2). color_maps and uv_maps hold the same colours (0-1) and uvs expanded per face corner.
     def __init__(self, data=None, material=None, color_maps=0):
       self.data = data
       self.vertex_count = 0
-      self.vertices = []
-      self.faces = []
-      self.normals = None
+      self.vertices = np.zeros((0, 3), dtype=np.float32)
+      self.faces = np.zeros((0, 3), dtype=np.int64)
+      self.has_normals = False
+      self.normals = np.zeros((0, 3), dtype=np.float32)
       self.uvs = None
       self.uv_maps = None
-      self.colors = []
-      self.color_maps = []
-      self.face_data = []
+      self.colors = np.zeros((0, color_maps, 0, 4), dtype=np.uint8)
+      self.color_maps = np.zeros((color_maps, 0, 4), dtype=np.float32)
+      self.face_data = np.zeros(0, dtype=np.uint32)
       if data == None: return
       
-      self.vertex_count = sread_u32(self.data, self.data.tell())
+      self.vertex_count = self.data.sread_u32()
       #if self.vertex_count == 0: print("Vertex count ERROR AT: " + hex(self.data.tell()))
+      vertex_count = self.vertex_count
       
-      _v = []
-      for v in range(self.vertex_count):
-        for vf in range(3): _v.append(sread_float(self.data, self.data.tell()))
-        self.face_data.append(sread_u32(self.data, self.data.tell()))
-      self.vertices = [_v[i:i+3] for i in range(0, len(_v), 3)]
+      _records = read_array(self.data, VERTEX_RECORD, vertex_count)
+      self.vertices = _records["position"]
+      self.face_data = _records["flags"]
+      self.faces = strip_triangles(self.face_data)
       
-      flip = True
-      for f in range(2, len(self.face_data)):
-        flip = self.add_face(self.faces, f, self.face_data[f], flip)
-        #flip = self.reset_winding(self.face_data[f], flip)
-      
-      _n = None
-      if material.normals:
-        _n = []
-        for v in range(self.vertex_count):
-          for vf in range(3):
-            _n.append(sread_float(self.data, self.data.tell()))
-      if _n != None:
-        self.normals = [_n[i:i+3] for i in range(0, len(_n), 3)]
+      self.has_normals = bool(material.normals)
+      if self.has_normals:
+        self.normals = read_array(self.data, "<f4", vertex_count * 3).reshape(-1, 3)
       else:
-        self.normals = [0,1,0]*self.vertex_count
-        self.normals = [self.normals[i:i+3] for i in range(0, len(self.normals), 3)]
+        self.normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (vertex_count, 1))
       
-      self.colors = [[] for _ in range(color_maps)]
-      self.color_maps = [[] for _ in range(color_maps)]
-      for m in range(material.mat_properties):
-        for vc in range(color_maps):
-          for v in range(self.vertex_count):
-            self.colors[vc].append([read_u8(self.data, self.data.tell()) for c in range(3)] +
-                                   [read_u8(self.data, self.data.tell())])# << 1])
-      for c, colors in enumerate(self.colors):
-        if len(colors) < 1: break
-        self.color_maps[c] = []
-        for face in self.faces: self.color_maps[c].extend([list((Vector(colors[face[0]]) / 255.0)[:]),
-                                                           list((Vector(colors[face[1]]) / 255.0)[:]),
-                                                           list((Vector(colors[face[2]]) / 255.0)[:])])
+      self.colors = read_array(self.data, np.uint8, material.mat_properties * color_maps * vertex_count * 4).reshape(material.mat_properties, color_maps, vertex_count, 4)
+      self.expand_colors()
       
       self.uv_maps = None
       if material.uv_maps > 0:
-        self.uv_maps = []
-        self.uvs = []
-        for m in range(material.uv_maps):
-          _uv_map = []
-          for v in range(self.vertex_count):
-            _uv_map.append([sread_float(self.data, self.data.tell()), sread_float(self.data, self.data.tell())])
-          self.uvs.append(_uv_map)
-          uv_map = []
-          for face in self.faces:
-            uv_map.append(_uv_map[face[0]])
-            uv_map.append(_uv_map[face[1]])
-            uv_map.append(_uv_map[face[2]])
-          self.uv_maps.append(uv_map)
+        self.uvs = read_array(self.data, "<f4", material.uv_maps * vertex_count * 2).reshape(material.uv_maps, vertex_count, 2)
+        self.uv_maps = self.uvs[:, self.faces.reshape(-1)]
     
     def inject_changes(self, mesh_data, material):
       v_data, n_data, uv_data, col_data = mesh_data
       
       self.vertex_count = len(v_data)
-      self.face_data = []
-      self.vertices = []
-      for v in range(self.vertex_count):
-        self.vertices.extend(list(v_data[v][0][:]))
-        self.face_data.append(v_data[v][1])
-      self.vertices = [self.vertices[i:i+3] for i in range(0, len(self.vertices), 3)]
-      
-      flip = True
-      self.faces = []
-      for f in range(2, len(self.face_data)):
-        flip = self.add_face(self.faces, f, self.face_data[f], flip)
+      self.vertices = np.array([v[0][:] for v in v_data], dtype=np.float32).reshape(-1, 3)
+      self.face_data = np.array([v[1] for v in v_data], dtype=np.uint32)
+      self.faces = strip_triangles(self.face_data)
       
-      if material.normals:
-        _n = []
-        for v in range(self.vertex_count):
-          _n.extend(list(n_data[v][:]))
-        self.normals = [_n[i:i+3] for i in range(0, len(_n), 3)]
+      self.has_normals = bool(material.normals)
+      if self.has_normals:
+        self.normals = np.array([n[:] for n in n_data], dtype=np.float32).reshape(-1, 3)
+      else:
+        self.normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (self.vertex_count, 1))
       
-      self.colors = [[] for _ in range(len(col_data))]
-      self.color_maps = [[] for _ in range(len(col_data))]
-      for m in range(material.mat_properties):
-        for vc, col_chan in enumerate(col_data):
-          for v in range(self.vertex_count):
-            self.colors[vc].append([int(c * 255) for c in col_chan[v]])
-      for c, colors in enumerate(self.colors):
-        if len(colors) < 1: break
-        self.color_maps[c] = []
-        for face in self.faces: self.color_maps[c].extend([list((Vector(colors[face[0]]) / 255.0)[:]),
-                                                           list((Vector(colors[face[1]]) / 255.0)[:]),
-                                                           list((Vector(colors[face[2]]) / 255.0)[:])])
+      # Every material property stores its own copy of each colour channel
+      colors = np.array([[c[:] for c in col_chan] for col_chan in col_data], dtype=np.float32).reshape(len(col_data), self.vertex_count, 4)
+      colors = (colors * 255).astype(np.uint8)
+      self.colors = np.ascontiguousarray(np.broadcast_to(colors, (material.mat_properties,) + colors.shape))
+      self.expand_colors()
       
+      self.uvs = None
       self.uv_maps = None
       if material.uv_maps > 0:
-        self.uv_maps = []
-        self.uvs = []
-        for m in range(material.uv_maps):
-          _uv_map = []
-          for v in range(self.vertex_count):
-            _uv_map.append(list(uv_data[m][v][:]))
-          self.uvs.append(_uv_map)
-          uv_map = []
-          for face in self.faces:
-            uv_map.append(_uv_map[face[0]])
-            uv_map.append(_uv_map[face[1]])
-            uv_map.append(_uv_map[face[2]])
-          self.uv_maps.append(uv_map)
-    
-    def save_changes(self):
-      output = BytesIO()
+        self.uvs = np.array([[uv[:] for uv in uv_data[m]] for m in range(material.uv_maps)], dtype=np.float32).reshape(material.uv_maps, self.vertex_count, 2)
+        self.uv_maps = self.uvs[:, self.faces.reshape(-1)]
+    
+    def save_changes(self, output=None):
+      if output == None: output = BinaryWriter()
       
-      write_u32(output, output.tell(), swap32(self.vertex_count))
-      for v in range(self.vertex_count):
-        for vf in range(3): write_float(output, output.tell(), swapfloat(self.vertices[v][vf]))
-        write_u32(output, output.tell(), swap32(self.face_data[v]))
+      output.swrite_u32(self.vertex_count)
+      _records = np.zeros(self.vertex_count, dtype=VERTEX_RECORD)
+      _records["position"] = self.vertices
+      _records["flags"] = self.face_data
+      output.write(_records.tobytes())
       
-      if self.normals != None:
-        for norm in self.normals:
-          for nf in range(3): write_float(output, output.tell(), swapfloat(norm[nf]))
+      if self.has_normals:
+        output.write(self.normals.astype("<f4").tobytes())
       
-      for color_map in self.colors:
-        for color in color_map:
-          for c8 in color[0:3]: write_u8(output, output.tell(), c8)
-          write_u8(output, output.tell(), color[3])# >> 1)
+      output.write(self.colors.tobytes())
       
-      if self.uvs != None:
-        for uv_map in self.uvs:
-          for uv in uv_map:
-            for uf in range(2): write_float(output, output.tell(), swapfloat(uv[uf]))
+      if self.uvs is not None:
+        output.write(self.uvs.astype("<f4").tobytes())
       
-      output.seek(0)
       return output
     
-    def add_face(self, faces, fc, face_data, flip):
-      if (face_data & 0x8000): return True#flip
-      fa = max(0, fc - 2)
-      fb = max(0, fc - 1)
-      flip = (fc % 2) != 0
-      if fc >= 2:
-        if not flip: faces.append([fa, fb, fc])
-        else: faces.append([fb, fa, fc])#([fa, fc, fb])
-      return not flip
-    
-    def reset_winding(self, face_data, flip):
-      if (face_data & 0x8000): return True
-      return flip
+    def expand_colors(self):
+      # Only the first material property's colours are shown
+      if len(self.colors) < 1:
+        self.color_maps = np.zeros((self.colors.shape[1], 0, 4), dtype=np.float32)
+        return
+      self.color_maps = self.colors[0][:, self.faces.reshape(-1)].astype(np.float32) / 255.0
   
   def __init__(self, materials=None, color_maps=None, data=None):
     self.data = data
@@ -762,26 +659,36 @@ class RenderedGeometry:
     self.geometry = []
     if data == None: return
     
-    self.material_index = sread_u16(self.data, self.data.tell())
+    self.material_index = self.data.sread_u16()
     material = materials[self.material_index]
     self.material = material
-    self.unk_1 = sread_u16(self.data, self.data.tell())
+    self.unk_1 = self.data.sread_u16()
     if self.unk_1 != 0:
       #print("Weird LOD related section at: " + hex(self.data.tell()))
       if (material.lod_flags & 0x80000000) != 0:
-        unk_vals = [sread_float(self.data, self.data.tell()) for c in range(8)]
+        unk_vals = self.data.sread_floats(8)
         #self.data.seek(self.data.tell() + (0x8 * 0x4)) #TODO: Actually read data here
       else:
-        unk_vals = [sread_float(self.data, self.data.tell()) for c in range(8)]
+        unk_vals = self.data.sread_floats(8)
         #self.data.seek(self.data.tell() + 0x20) # But apparently don't read data here
       print(unk_vals)
     
-    self.geom_count = sread_u32(self.data, self.data.tell())
+    self.geom_count = self.data.sread_u32()
     self.geometry = []
     for g in range(self.geom_count):
       geom = self.GeomEntry(self.data, material, color_maps)
       self.geometry.append(geom)
   
+  @staticmethod
+  def skip(data, materials, color_maps):
+    material = materials[data.sread_u16()]
+    if data.sread_u16() != 0: data.seek(0x20, 1)
+    # Vertex records, then normals, colours and UVs, all sized by the vertex count
+    vertex_size = 0x10 + material.mat_properties * color_maps * 0x4 + material.uv_maps * 0x8
+    if material.normals: vertex_size += 0xC
+    for g in range(data.sread_u32()):
+      data.seek(data.sread_u32() * vertex_size, 1)
+  
   def inject_changes(self, mat_index, mesh_data, materials=None, color_maps=0):
     self.color_maps = color_maps
     self.material_index = mat_index
@@ -820,55 +727,42 @@ class RenderedGeometry:
       self.geometry.append(geom)
     self.geom_count = len(self.geometry)
   
-  def save_changes(self):
-    output = BytesIO()
-    write_u16(output, output.tell(), swap16(self.material_index))
-    write_u16(output, output.tell(), 0)
-    write_u32(output, output.tell(), swap32(self.geom_count))
-    for geom in self.geometry: output.write(geom.save_changes().read())
-    output.seek(0)
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    output.swrite_u16(self.material_index)
+    output.swrite_u16(0)
+    output.swrite_u32(self.geom_count)
+    for geom in self.geometry: geom.save_changes(output)
     return output
   
   def get_geometry_per_submesh(self, index_offset = 0):
     added_offset = 0
-    submesh_uvs = []
-    if self.color_maps > 0:
-      #submesh_colors = [[] for _ in range(self.color_maps)]
-      submesh_colors = []
-    else: submesh_colors = []
+    uv_indices = None
+    uv_parts = []
+    color_parts = []
     vertex_groups = []
-    for i, geom in enumerate(self.geometry):
-      adjusted_indices_flat = [ind + index_offset + added_offset for face in geom.faces for ind in face]
-      vertex_groups.append(adjusted_indices_flat)
-      adjusted_indices = [adjusted_indices_flat[f:f+3] for f in range(0, len(adjusted_indices_flat), 3)]
+    face_parts = []
+    for geom in self.geometry:
+      faces = geom.faces + (index_offset + added_offset)
+      face_parts.append(faces)
+      vertex_groups.append(faces.reshape(-1).tolist())
       added_offset += geom.vertex_count
-      if i == 0:
-        submesh_vertices = geom.vertices.copy()
-        submesh_normals = geom.normals.copy()
-        submesh_indices = adjusted_indices
-        for c, col in enumerate(geom.color_maps):
-          while c >= len(submesh_colors): submesh_colors.append([])
-          submesh_colors[c].extend(col)
-        if geom.uv_maps != None:
-          for m in range(len(geom.uv_maps)):#self.material.mat_properties):
-            uv_index = m
-            uv_index = self.material.properties[m].uv - 1 # These could be wrong
-            if uv_index < 0: continue
-            submesh_uvs.append(geom.uv_maps[uv_index].copy())
-      else:
-        submesh_vertices.extend(geom.vertices)
-        submesh_normals.extend(geom.normals)
-        submesh_indices.extend(adjusted_indices)
-        for c, col in enumerate(geom.color_maps):
-          while c >= len(submesh_colors): submesh_colors.append([])
-          submesh_colors[c].extend(col)
-        if geom.uv_maps != None:
-          for m in range(len(geom.uv_maps)):#self.material.mat_properties):
-            uv_index = m
-            uv_index = self.material.properties[m].uv - 1 # These could be wrong
-            if uv_index < 0: continue
-            submesh_uvs[m].extend(geom.uv_maps[uv_index]) # TODO: Make sure indexing via material property byte 3 is correct
-    
+      for c, col in enumerate(geom.color_maps):
+        while c >= len(color_parts): color_parts.append([])
+        color_parts[c].append(col)
+      if geom.uv_maps is not None:
+        if uv_indices == None:
+          # TODO: Make sure indexing via material property byte 3 is correct
+          uv_indices = [self.material.properties[m].uv - 1 for m in range(len(geom.uv_maps))] # These could be wrong
+          uv_indices = [uv_index for uv_index in uv_indices if uv_index >= 0]
+          uv_parts = [[] for _ in uv_indices]
+        for m, uv_index in enumerate(uv_indices): uv_parts[m].append(geom.uv_maps[uv_index])
+    
+    submesh_vertices = concat_rows([geom.vertices for geom in self.geometry], 3, np.float32)
+    submesh_normals = concat_rows([geom.normals for geom in self.geometry], 3, np.float32)
+    submesh_indices = concat_rows(face_parts, 3, np.int64)
+    submesh_colors = [concat_rows(parts, 4, np.float32) for parts in color_parts]
+    submesh_uvs = [concat_rows(parts, 2, np.float32) for parts in uv_parts]
     return submesh_vertices, submesh_normals, submesh_uvs, submesh_colors, submesh_indices, vertex_groups, added_offset
 
 class LevelModelInstance:
@@ -893,41 +787,39 @@ class LevelModelInstance:
     if data == None: return
     
     self.entry_offset = self.data.tell()
-    _m = [sread_float(self.data, self.data.tell()) for _ in range(4 * 4)]
+    _m = self.data.sread_floats(4 * 4)
     _m = [_m[i:i+4] for i in range(0, len(_m), 4)]
     self.transform = Matrix(_m).transposed()
     self.inv_transform = self.transform.inverted_safe()
     
-    self.vertex_color_index = sread_u32(self.data, self.data.tell())
+    self.vertex_color_index = self.data.sread_u32()
     if versionNo >= 3:
-      self.effects = sread_u32(self.data, self.data.tell()) # So far only zero
+      self.effects = self.data.sread_u32() # So far only zero
       #if self.effects != 0: print("Model Instance Effects " + hex(self.effects))
     
-    self.rend_inst_count = sread_u32(self.data, self.data.tell())
+    self.rend_inst_count = self.data.sread_u32()
     for i in range(self.rend_inst_count):
       if versionNo < 4: rend_inst_index = render_instance_count + i
-      else: rend_inst_index = sread_u32(self.data, self.data.tell()) # Apparently not used for dynamic instances?
-      rend_sect_index = sread_u32(self.data, self.data.tell())
-      vec1 = Vector([sread_float(self.data, self.data.tell()) for _ in range(3)])
-      vec2 = Vector([sread_float(self.data, self.data.tell()) for _ in range(3)])
+      else: rend_inst_index = self.data.sread_u32() # Apparently not used for dynamic instances?
+      rend_sect_index = self.data.sread_u32()
+      vec1 = Vector(self.data.sread_floats(3))
+      vec2 = Vector(self.data.sread_floats(3))
       #vec1 = self.inv_transform @ vec1
       #vec2 = self.inv_transform @ vec2
-      vlist = vec1[:] + vec2[:]
-      minVec = Vector([min([vlist[e], vlist[e+3]]) for e in range(3)])#vec1
-      maxVec = Vector([max([vlist[e], vlist[e+3]]) for e in range(3)])#vec2
+      minVec = Vector(np.minimum(vec1, vec2))#vec1
+      maxVec = Vector(np.maximum(vec1, vec2))#vec2
       self.render_instances.append(self.GeometryInstance(rend_inst_index, rend_sect_index, minVec, maxVec))
     
-    self.coll_inst_count = sread_u32(self.data, self.data.tell())
+    self.coll_inst_count = self.data.sread_u32()
     for i in range(self.coll_inst_count):
       coll_inst_index = collision_instance_count + i
-      coll_sect_index = sread_u32(self.data, self.data.tell())
-      vec1 = Vector([sread_float(self.data, self.data.tell()) for _ in range(3)])
-      vec2 = Vector([sread_float(self.data, self.data.tell()) for _ in range(3)])
+      coll_sect_index = self.data.sread_u32()
+      vec1 = Vector(self.data.sread_floats(3))
+      vec2 = Vector(self.data.sread_floats(3))
       #vec1 = self.inv_transform @ vec1
       #vec2 = self.inv_transform @ vec2
-      vlist = vec1[:] + vec2[:]
-      minVec = Vector([min([vlist[e], vlist[e+3]]) for e in range(3)])#vec1
-      maxVec = Vector([max([vlist[e], vlist[e+3]]) for e in range(3)])#vec2
+      minVec = Vector(np.minimum(vec1, vec2))#vec1
+      maxVec = Vector(np.maximum(vec1, vec2))#vec2
       
       #minVec = np.minimum(vec1, vec2)
       #maxVec = np.maximum(vec1, vec2)
@@ -944,29 +836,35 @@ class LevelModelInstance:
     
     self.data_size = self.data.tell() - self.entry_offset
   
-  def save_changes(self, versionNo):
-    inst_data = BytesIO()
+  @staticmethod
+  def skip(data, versionNo):
+    # Walks one instance without decoding it and returns its render instance count
+    data.seek(0x48 if versionNo >= 3 else 0x44, 1)
+    rend_inst_count = data.sread_u32()
+    data.seek(rend_inst_count * (0x20 if versionNo >= 4 else 0x1C), 1)
+    data.seek(data.sread_u32() * 0x1C, 1)
+    return rend_inst_count
+  
+  def save_changes(self, versionNo, inst_data=None):
+    if inst_data == None: inst_data = BinaryWriter()
     
     transform = self.transform.transposed()
     _m = [transform[i][j] for i in range(4) for j in range(4)]
-    for f in _m: write_float(inst_data, inst_data.tell(), swapfloat(f))
+    inst_data.swrite_floats(_m)
     
-    write_u32(inst_data, inst_data.tell(), swap32(self.vertex_color_index))
-    if versionNo >= 3: write_u32(inst_data, inst_data.tell(), swap32(self.effects))
+    inst_data.swrite_u32(self.vertex_color_index)
+    if versionNo >= 3: inst_data.swrite_u32(self.effects)
     
-    write_u32(inst_data, inst_data.tell(), swap32(len(self.render_instances)))
+    inst_data.swrite_u32(len(self.render_instances))
     for render_instance in self.render_instances:
-      if versionNo >= 4: write_u32(inst_data, inst_data.tell(), swap32(render_instance.index))
-      write_u32(inst_data, inst_data.tell(), swap32(render_instance.sect_index))
-      for f in render_instance.min[:]: write_float(inst_data, inst_data.tell(), swapfloat(f))
-      for f in render_instance.max[:]: write_float(inst_data, inst_data.tell(), swapfloat(f))
-    write_u32(inst_data, inst_data.tell(), swap32(len(self.collision_instances)))
+      if versionNo >= 4: inst_data.swrite_u32(render_instance.index)
+      inst_data.swrite_u32(render_instance.sect_index)
+      inst_data.swrite_floats(list(render_instance.min) + list(render_instance.max))
+    inst_data.swrite_u32(len(self.collision_instances))
     for collision_instance in self.collision_instances:
-      write_u32(inst_data, inst_data.tell(), swap32(collision_instance.sect_index))
-      for f in collision_instance.min[:]: write_float(inst_data, inst_data.tell(), swapfloat(f))
-      for f in collision_instance.max[:]: write_float(inst_data, inst_data.tell(), swapfloat(f))
+      inst_data.swrite_u32(collision_instance.sect_index)
+      inst_data.swrite_floats(list(collision_instance.min) + list(collision_instance.max))
     
-    inst_data.seek(0)
     return inst_data
 
 class PVS:
@@ -982,17 +880,16 @@ class PVS:
     if data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
     
-    self.vertex_count = sread_u32(self.data, self.data.tell())
-    for i in range(self.vertex_count * 4):
-      self.vertices.append(sread_float(self.data, self.data.tell()))
+    self.vertex_count = self.data.sread_u32()
+    self.vertices = self.data.sread_floats(self.vertex_count * 4)
     self.vertices = [self.vertices[i:i+4] for i in range(0, len(self.vertices), 4)]
     
     if len(self.vertices) > 0:
       self.setup_transform()
     
-    self.portal_cells_count = sread_u32(self.data, self.data.tell())
+    self.portal_cells_count = self.data.sread_u32()
     for i in range(self.portal_cells_count):
       self.portal_cells.append(PortalCell(geometrySection, versionNo, self.data))
   
@@ -1004,23 +901,18 @@ class PVS:
     self.transform = self.transform.transposed()
     invtransform = self.transform.inverted_safe()
     
-    self.vertices = [list((invtransform @ Vector(vertex[0:3]))[:]) for vertex in self.vertices]
+    self.vertices = [(invtransform @ Vector(vertex[0:3])).tolist() for vertex in self.vertices]
   
-  def save_changes(self):
-    pvs_data = BytesIO()
-    write_u32(pvs_data, 0x0, swap32(len(self.vertices)))
-    saved_vertices = [list((self.transform @ Vector(vertex))[:]) for vertex in self.vertices]
-    for vertex in saved_vertices:
-      for j in range(4): write_float(pvs_data, pvs_data.tell(), swapfloat(vertex[j]))
-    write_u32(pvs_data, pvs_data.tell(), swap32(len(self.portal_cells)))
+  def save_changes(self, pvs_data=None):
+    if pvs_data == None: pvs_data = BinaryWriter()
+    pvs_data.swrite_u32(len(self.vertices))
+    saved_vertices = [(self.transform @ Vector(vertex)).tolist() for vertex in self.vertices]
+    pvs_data.swrite_records("4f", [vertex[0:4] for vertex in saved_vertices])
+    pvs_data.swrite_u32(len(self.portal_cells))
     for cell in self.portal_cells:
-      write_u32(pvs_data, pvs_data.tell(), swap32(cell.flags))
-      write_u32(pvs_data, pvs_data.tell(), swap32(cell.edge_count))
-      for e in range(cell.edge_count):
-        for j in range(2): write_u32(pvs_data, pvs_data.tell(), swap32(cell.edge_indices[e][j]))
-        for j in range(4): write_float(pvs_data, pvs_data.tell(), swapfloat(cell.edge_planes[e][j]))
-        write_u32(pvs_data, pvs_data.tell(), swap32(cell.edge_neighbors[e]))
-    pvs_data.seek(0)
+      pvs_data.swrite_u32(cell.flags)
+      pvs_data.swrite_u32(cell.edge_count)
+      pvs_data.swrite_records("2I4fI", [list(cell.edge_indices[e][0:2]) + list(cell.edge_planes[e][0:4]) + [cell.edge_neighbors[e]] for e in range(cell.edge_count)])
     return pvs_data
   
   def validate(self):
@@ -1102,30 +994,25 @@ class PortalCell:
     self.grid_cell_ids = []
     if self.data == None: return
     
-    self.flags = sread_u32(self.data, self.data.tell())
+    self.flags = self.data.sread_u32()
     if 0xff < self.flags:
       print("portal cell 'flags' out of range!")
     
-    self.edge_count = sread_u32(self.data, self.data.tell())
+    self.edge_count = self.data.sread_u32()
     if 0xff < self.edge_count:
       print("portal cell 'no_edges' out of range!")
     
-    for i in range(self.edge_count):
-      for j in range(2):
-        self.edge_indices.append(sread_u32(self.data, self.data.tell())) # Edge vertex indices
-      for j in range(4):
-        self.edge_planes.append(sread_float(self.data, self.data.tell())) # Edge plane (tangent direction xyz and world placement w)
-      self.edge_neighbors.append(sread_u32(self.data, self.data.tell())) # Cell neighbor along edge
-    self.edge_planes = [self.edge_planes[i:i+4] for i in range(0, len(self.edge_planes), 4)]
-    self.edge_indices = [self.edge_indices[i:i+2] for i in range(0, len(self.edge_indices), 2)]
+    # Edge vertex indices, edge plane (tangent direction xyz and world placement w), cell neighbor along edge
+    for edge in self.data.sread_records("2I4fI", self.edge_count):
+      self.edge_indices.append(list(edge[0:2]))
+      self.edge_planes.append(list(edge[2:6]))
+      self.edge_neighbors.append(edge[6])
     
-    self.sections_count = sread_u32(self.data, self.data.tell())
+    self.sections_count = self.data.sread_u32()
     if 0xffff < self.sections_count:
       print("portal cell 'no_sections' out of range!")
     
-    for i in range(self.sections_count):
-      rend_model_index = sread_u16(self.data, self.data.tell())
-      rend_inst_index = sread_u16(self.data, self.data.tell())
+    for rend_model_index, rend_inst_index in self.data.sread_records("HH", self.sections_count):
       global_inst_index = geometrySection.model_instances[rend_model_index].render_instances[rend_inst_index].index
       self.sections = self.sections + [rend_model_index, rend_inst_index, global_inst_index]
     self.sections = [self.sections[i:i+3] for i in range(0, len(self.sections), 3)]
@@ -1134,22 +1021,18 @@ class PortalCell:
       self.node_id_count = 0
       #TODO: BuildNodeList
     else:
-      self.node_id_count = sread_u32(self.data, self.data.tell())
+      self.node_id_count = self.data.sread_u32()
       if 0xffff < self.node_id_count:
         print("portal cell 'node_id_count' out of range!")
       if self.node_id_count != 0:
-        self.node_ids = []
-        for i in range(self.node_id_count):
-          self.node_ids.append(sread_u16(self.data, self.data.tell()))
-       
+        self.node_ids = self.data.sread_u16s(self.node_id_count)
+    
     if versionNo < 4:
       self.grid_cell_id_count = 0
     else:
-      self.grid_cell_id_count = sread_u32(self.data, self.data.tell())
+      self.grid_cell_id_count = self.data.sread_u32()
       if self.grid_cell_id_count != 0:
-        self.grid_cell_ids = []
-        for i in range(self.grid_cell_id_count):
-          self.grid_cell_ids.append(sread_u16(self.data, self.data.tell()))
+        self.grid_cell_ids = self.data.sread_u16s(self.grid_cell_id_count)
   
   def add_nodes(self, node_buffer, node_count):
     self.node_id_count = node_count
@@ -1232,26 +1115,26 @@ class NodeTree:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
     if versionNo > 3:
-      self.node_count = sread_u32(self.data, self.data.tell())
+      self.node_count = self.data.sread_u32()
     self.root_node = self.load_nodes(versionNo, geometrySection)
   
   def load_nodes(self, versionNo, geometrySection):
     node = None
-    valid_node = sread_u32(self.data, self.data.tell())
+    valid_node = self.data.sread_u32()
     if valid_node == 0: return node
     
     if versionNo < 4:
       node_index = self.node_count
       self.node_count += 1
     else:
-      node_index = sread_u16(self.data, self.data.tell())
+      node_index = self.data.sread_u16()
     
-    vector = [sread_float(self.data, self.data.tell()) for i in range(4)]
+    vector = self.data.sread_floats(4)
     #print(vector)
-    rend_model_index = sread_u32(self.data, self.data.tell())
-    rend_inst_index = sread_u32(self.data, self.data.tell())
+    rend_model_index = self.data.sread_u32()
+    rend_inst_index = self.data.sread_u32()
     
     if rend_model_index == 0xffffffff or rend_inst_index == 0xffffffff:
       self.branch_count += 1
@@ -1279,28 +1162,22 @@ class Grid:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.width = sread_u32(self.data, self.data.tell())
-    self.depth = sread_u32(self.data, self.data.tell())
-    self.scale = sread_float(self.data, self.data.tell())
-    self.unk_f1 = sread_float(self.data, self.data.tell())
-    self.unk_f2 = sread_float(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.width = self.data.sread_u32()
+    self.depth = self.data.sread_u32()
+    self.scale = self.data.sread_float()
+    self.unk_f1 = self.data.sread_float()
+    self.unk_f2 = self.data.sread_float()
     
     for i in range(self.depth):
       row = []
       for j in range(self.width):
-        collision_instance_count = sread_u32(self.data, self.data.tell())
-        collision_instances = []
-        for c in range(collision_instance_count):
-          geometry_instance_index = sread_u16(self.data, self.data.tell())
-          collision_instance_index = sread_u16(self.data, self.data.tell())
-          collision_instances.append((geometry_instance_index, collision_instance_index))
+        collision_instance_count = self.data.sread_u32()
+        # (geometry_instance_index, collision_instance_index)
+        collision_instances = self.data.sread_records("HH", collision_instance_count)
         
-        portal_cell_count = sread_u32(self.data, self.data.tell())
-        portal_cells = []
-        for c in range(portal_cell_count):
-          portal_cell_index = sread_u32(self.data, self.data.tell())
-          portal_cells.append(portal_cell_index)
+        portal_cell_count = self.data.sread_u32()
+        portal_cells = self.data.sread_u32s(portal_cell_count)
         row.append((collision_instances, portal_cells))
       self.cells.append(row)
     self.cells = [cell for row in reversed(self.cells) for cell in row]
@@ -1391,29 +1268,25 @@ class ActorInfoListEntry:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.count = sread_s32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.count = self.data.sread_s32()
     if self.count > 0:
       for i in range(self.count):
         self.actors.append(ActorInfoEntry(self, self.data))
       for i in range(self.count): self.actors[i].populateParamValues(self.enums) # Separated from actor creation on purpose
     self.data.seek(self.entry_offset + 0x4 + self.block_size)
   
-  def save_changes(self):
-    out_data = BytesIO()
-    write_magic_str(out_data, 0x0, "AINF", 4)
-    write_u32(out_data, 0x4, 0)
-    write_u32(out_data, 0x8, swap32(len(self.actors)))
-    for actor in self.actors: write_bytes(out_data, out_data.tell(), actor.save_changes())
-    out_data.seek(0)
-    self.block_size = data_len(out_data) - 0x8
-    write_u32(out_data, 0x4, swap32(self.block_size))
-    out_data.seek(0)
+  def save_changes(self, out_data=None):
+    if out_data == None: out_data = BinaryWriter()
+    block_offset = out_data.begin_block("AINF")
+    out_data.swrite_u32(len(self.actors))
+    for actor in self.actors: actor.save_changes(out_data)
+    self.block_size = out_data.end_block(block_offset)
     return out_data
   
   def create_new_actor(self, transform, class_name):
     actor = ActorInfoEntry(self)
-    actor.transform = transform
+    actor.transform = Matrix(transform)
     actor.change_class(class_name)
     self.actors.append(actor)
     return actor
@@ -1501,7 +1374,7 @@ class ActorInfoListEntry:
           cost = 0
           if (param.overwritten or param.added): cost = param.loaded_param_count
           current_funcbox[param.string] = (cost, param.type)
-          
+      
       if param.type == 6 and (param.overwritten or param.added):# or force_func_params):
         current_parent = param
         #preserve old param
@@ -1548,17 +1421,17 @@ class ActorInfoEntry:
       return
     
     self.entry_offset = self.data.tell()
-    self.a_string_index = sread_u16(self.data, self.data.tell())
+    self.a_string_index = self.data.sread_u16()
     self.name = self.actorList.AStringEntry.table[self.a_string_index]
     self.class_index = self.getPropertyIndex(self.actorList.ClassesEntry.classes, self.name)
     if self.class_index == 0xffff:
       self.class_index = self.getPropertyIndex(self.actorList.ClassesEntry.classes, self.name + "Actor")
     
-    _m = [sread_float(self.data, self.data.tell()) for _ in range(4 * 4)]
+    _m = self.data.sread_floats(4 * 4)
     _m = [_m[i:i+4] for i in range(0, len(_m), 4)]
     self.transform = Matrix(_m).transposed()
     
-    self.param_count = sread_u16(self.data, self.data.tell())
+    self.param_count = self.data.sread_u16()
     self.params = []
     # END OF CLASS SECTION: The first 68(0x44) bytes of each Actor's info
     
@@ -1568,22 +1441,17 @@ class ActorInfoEntry:
       self.params = self.defaultParams(self.class_index)
       self.loadParams(self.params != None, self.params != None, self.param_count, self.class_index)
   
-  def save_changes(self):
-    out_data = BytesIO()
-    write_u16(out_data, out_data.tell(), swap16(self.a_string_index))
+  def save_changes(self, out_data=None):
+    if out_data == None: out_data = BinaryWriter()
+    out_data.swrite_u16(self.a_string_index)
     transform = self.transform.transposed()
     _m = [transform[i][j] for i in range(4) for j in range(4)]
-    for f in _m: write_float(out_data, out_data.tell(), swapfloat(f))
-    write_u16(out_data, out_data.tell(), swap16(self.param_count))
+    out_data.swrite_floats(_m)
+    out_data.swrite_u16(self.param_count)
     if len(self.params) > 0:
       saved_params, full_count = self.save_params(0, self.param_count)
-      for saved_param in saved_params:
-        write_u16(out_data, out_data.tell(), swap16(saved_param[0]))
-        write_u8(out_data, out_data.tell(), saved_param[1])
-        write_u8(out_data, out_data.tell(), saved_param[2])
-        write_u32(out_data, out_data.tell(), swap32(saved_param[3]))
-    out_data.seek(0)
-    return out_data.read()
+      out_data.swrite_records("H2BI", saved_params)
+    return out_data
   
   def change_class(self, newClassName):
     self.name = newClassName
@@ -1708,10 +1576,10 @@ class ActorInfoEntry:
       return
     
     for i in range(param_count):
-      param_string_index = sread_u16(self.data, self.data.tell())
-      param_type = read_u8(self.data, self.data.tell())
-      next_param_count = read_u8(self.data, self.data.tell())
-      param_value = sread_u32(self.data, self.data.tell())
+      param_string_index = self.data.sread_u16()
+      param_type = self.data.read_u8()
+      next_param_count = self.data.read_u8()
+      param_value = self.data.sread_u32()
       
       param = ActorParameterEntry(self, self.actorList.AStringEntry, class_index, param_string_index, param_type, next_param_count, param_value, parent_param)
       param.a_string_index = param_string_index
@@ -1900,7 +1768,7 @@ class ActorInfoEntry:
       #  if param_val_string == enum_val_string:
       #    r_enum_index = e
       #    break
-      
+    
     elif param_type == 5:
       if param_value < 0xffff:
         result = self.actorList.actors[param_value].name + " (" + str(param_value) + ")"
@@ -2010,23 +1878,19 @@ class AIMapListEntry:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.type = sread_u32(self.data, self.data.tell()) # Probably don't have to store, since the existence of any blocked edges would imply what type it is
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.type = self.data.sread_u32() # Probably don't have to store, since the existence of any blocked edges would imply what type it is
+    self.count = self.data.sread_u32()
     for i in range(self.count): self.maps.append(AIMapEntry(self.data, self.type))
     self.data.seek(self.entry_offset + 0x4 + self.block_size)
   
-  def save_changes(self):
-    out_data = BytesIO()
-    write_magic_str(out_data, 0x0, "AIMP", 4)
-    write_u32(out_data, 0x4, 0x0)
-    write_u32(out_data, 0x8, swap32(self.type))
-    write_u32(out_data, 0xC, swap32(len(self.maps)))
-    for _map in self.maps: write_bytes(out_data, out_data.tell(), _map.save_changes())
-    out_data.seek(0)
-    self.block_size = data_len(out_data) - 0x8
-    write_u32(out_data, 0x4, swap32(self.block_size))
-    out_data.seek(0)
+  def save_changes(self, out_data=None):
+    if out_data == None: out_data = BinaryWriter()
+    block_offset = out_data.begin_block("AIMP")
+    out_data.swrite_u32(self.type)
+    out_data.swrite_u32(len(self.maps))
+    for _map in self.maps: _map.save_changes(out_data)
+    self.block_size = out_data.end_block(block_offset)
     return out_data
   
   def add_map(self, vertices, faces):
@@ -2062,19 +1926,19 @@ class AIMapEntry: #TODO Potentially make it possible to create AIMaps based on t
       self.edge_flags = []
       if self.data == None: return
       
-      self.cell_flags = sread_u32(self.data, self.data.tell()) # Cell blocked flag (Store as face attribute)
-      self.edge_count = sread_u32(self.data, self.data.tell())
-      for i in range(self.edge_count):
-        # Edge vertex indices
-        for j in range(2): self.edge_indices.append(sread_u32(self.data, self.data.tell())) 
-        # Edge blocked flag (Store as 2 separate edge attributes to account for cell sharedness)
-        if (self.type & 2) != 0: self.edge_flags.append(sread_u32(self.data, self.data.tell()))
+      self.cell_flags = self.data.sread_u32() # Cell blocked flag (Store as face attribute)
+      self.edge_count = self.data.sread_u32()
+      # Edge vertex indices
+      # Edge blocked flag (Store as 2 separate edge attributes to account for cell sharedness)
+      # Edge plane (tangent direction xyz and world placement w)
+      # Cell neighbor along edge
+      has_edge_flags = (self.type & 2) != 0
+      for edge in self.data.sread_records("3I4fI" if has_edge_flags else "2I4fI", self.edge_count):
+        self.edge_indices.append(list(edge[0:2]))
+        if has_edge_flags: self.edge_flags.append(edge[2])
         #if self.edge_flags[-1] != 0: print("Edge flag: " + str(self.edge_flags[-1]))
-        # Edge plane (tangent direction xyz and world placement w)
-        for j in range(4): self.edge_planes.append(sread_float(self.data, self.data.tell()))
-        self.edge_neighbors.append(sread_u32(self.data, self.data.tell())) # Cell neighbor along edge
-      self.edge_planes = [self.edge_planes[i:i+4] for i in range(0, len(self.edge_planes), 4)]
-      self.edge_indices = [self.edge_indices[i:i+2] for i in range(0, len(self.edge_indices), 2)]
+        self.edge_planes.append(list(edge[-5:-1]))
+        self.edge_neighbors.append(edge[-1])
     
     def from_py(self, face):
       flags, edges = face
@@ -2092,18 +1956,19 @@ class AIMapEntry: #TODO Potentially make it possible to create AIMaps based on t
     self.data = data
     self.vertex_count = 0
     self.vertices = []
+    self.vertex_w = []
     self.cell_count = 0
     self.map_cells = []
     self.transform = Matrix()
     if self.data == None: return
     
-    self.vertex_count = sread_u32(self.data, self.data.tell())
-    vertex_array = [sread_float(self.data, self.data.tell()) for _ in range(self.vertex_count * 4)]
+    self.vertex_count = self.data.sread_u32()
+    vertex_array = self.data.sread_floats(self.vertex_count * 4)
     self.vertices = [vertex_array[i:i+4] for i in range(0, len(vertex_array), 4)]
     
     self.setup_transform()
     
-    self.cell_count = sread_u32(self.data, self.data.tell())
+    self.cell_count = self.data.sread_u32()
     for i in range(self.cell_count): self.map_cells.append(self.AIMapCell(self.data, self.type))
     #print(str([cell.edge_count for cell in self.map_cells]))
   
@@ -2115,29 +1980,28 @@ class AIMapEntry: #TODO Potentially make it possible to create AIMaps based on t
     self.transform = self.transform.transposed()
     invtransform = self.transform.inverted_safe()
     
-    self.vertices = [list((invtransform @ Vector(vertex[0:3]))[:]) for vertex in self.vertices]
-  
-  def save_changes(self):
-    map_data = BytesIO()
-    write_u32(map_data, 0x0, swap32(len(self.vertices)))
-    saved_vertices = [list((self.transform @ Vector(vertex))[:]) for vertex in self.vertices]
-    for vertex in saved_vertices:
-      for j in range(4): write_float(map_data, map_data.tell(), swapfloat(vertex[j]))
-    write_u32(map_data, map_data.tell(), swap32(len(self.map_cells)))
+    # The vertices are handed to Blender as points, their stored w is only kept for saving
+    self.vertex_w = [vertex[3] for vertex in self.vertices]
+    self.vertices = [(invtransform @ Vector(vertex[0:3])).tolist() for vertex in self.vertices]
+  
+  def save_changes(self, map_data=None):
+    if map_data == None: map_data = BinaryWriter()
+    map_data.swrite_u32(len(self.vertices))
+    saved_vertices = [(self.transform @ Vector(vertex[0:3])).tolist() + [w] for vertex, w in zip(self.vertices, self.vertex_w)]
+    map_data.swrite_records("4f", saved_vertices)
+    map_data.swrite_u32(len(self.map_cells))
+    has_edge_flags = (self.type & 2) != 0
     for cell in self.map_cells:
-      write_u32(map_data, map_data.tell(), swap32(cell.cell_flags))
-      write_u32(map_data, map_data.tell(), swap32(cell.edge_count))
-      for e in range(cell.edge_count):
-        for j in range(2): write_u32(map_data, map_data.tell(), swap32(cell.edge_indices[e][j]))
-        write_u32(map_data, map_data.tell(), swap32(cell.edge_flags[e]))
-        for j in range(4): write_float(map_data, map_data.tell(), swapfloat(cell.edge_planes[e][j]))
-        write_u32(map_data, map_data.tell(), swap32(cell.edge_neighbors[e]))
-    map_data.seek(0)
-    return map_data.read()
+      map_data.swrite_u32(cell.cell_flags)
+      map_data.swrite_u32(cell.edge_count)
+      if has_edge_flags: map_data.swrite_records("3I4fI", [list(cell.edge_indices[e][0:2]) + [cell.edge_flags[e]] + list(cell.edge_planes[e][0:4]) + [cell.edge_neighbors[e]] for e in range(cell.edge_count)])
+      else: map_data.swrite_records("2I4fI", [list(cell.edge_indices[e][0:2]) + list(cell.edge_planes[e][0:4]) + [cell.edge_neighbors[e]] for e in range(cell.edge_count)])
+    return map_data
   
   def from_py(self, vertices, faces):
     self.vertex_count = len(vertices)
-    self.vertices = vertices
+    self.vertices = [vertex[0:3] for vertex in vertices]
+    self.vertex_w = [vertex[3] if len(vertex) > 3 else 1.0 for vertex in vertices]
     #self.setup_transform()
     self.cell_count = len(faces)
     for face in faces:
@@ -2146,6 +2010,8 @@ class AIMapEntry: #TODO Potentially make it possible to create AIMaps based on t
       self.map_cells.append(cell)
   
   def get_edgeplanes(self):
+    # Builds Blender object matrices, so this one needs mathutils
+    from mathutils import Vector, Matrix, Euler
     output = []
     #vertices = [self.transform @ Vector(vertex) for vertex in self.vertices]
     vertices = [Vector(vertex) for vertex in self.vertices]
@@ -2232,27 +2098,23 @@ class SplineListEntry:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_s32(self.data, self.data.tell())
-    self.spline_count = sread_s32(self.data, self.data.tell())
+    self.block_size = self.data.sread_s32()
+    self.spline_count = self.data.sread_s32()
     for i in range(self.spline_count): self.splines.append(SplineEntry(self.data))
     self.data.seek(self.entry_offset + 0x4 + self.block_size)
   
-  def save_changes(self):
-    out_data = BytesIO()
-    write_magic_str(out_data, 0x0, "SPLN", 4)
-    write_u32(out_data, 0x4, 0x0)
-    write_u32(out_data, 0x8, swap32(len(self.splines)))
-    for spline in self.splines: write_bytes(out_data, out_data.tell(), spline.save_changes())
-    out_data.seek(0)
-    self.block_size = data_len(out_data) - 0x8
-    write_u32(out_data, 0x4, swap32(self.block_size))
-    out_data.seek(0)
+  def save_changes(self, out_data=None):
+    if out_data == None: out_data = BinaryWriter()
+    block_offset = out_data.begin_block("SPLN")
+    out_data.swrite_u32(len(self.splines))
+    for spline in self.splines: spline.save_changes(out_data)
+    self.block_size = out_data.end_block(block_offset)
     return out_data
   
   def add_spline(self, points, transform, cyclic=False):
     spline = SplineEntry()
     spline.loop_flag = cyclic
-    spline.transform = transform
+    spline.transform = Matrix(transform)
     spline.point_count = len(points)
     spline.points = points
     self.splines.append(spline)
@@ -2271,11 +2133,10 @@ class SplineEntry:
     self.transform = Matrix()
     if self.data == None: return
     
-    self.loop_flag = sread_s32(self.data, self.data.tell()) != 0 #Something to do with count during spline creation
-    self.point_count = sread_s32(self.data, self.data.tell())
+    self.loop_flag = self.data.sread_s32() != 0 #Something to do with count during spline creation
+    self.point_count = self.data.sread_s32()
     
-    for i in range(self.point_count):
-      for j in range(3): self.points.append(sread_float(self.data, self.data.tell()))
+    self.points = self.data.sread_floats(self.point_count * 3)
     self.points = [self.points[i:i+3] for i in range(0, len(self.points), 3)]
     
     avgVertex = Vector([0.0, 0.0, 0.0])
@@ -2285,17 +2146,15 @@ class SplineEntry:
     self.transform = self.transform.transposed()
     
     invtransform = self.transform.inverted_safe()
-    self.points = [list((invtransform @ Vector(vertex))[:]) for vertex in self.points]
+    self.points = [(invtransform @ Vector(vertex)).tolist() for vertex in self.points]
   
-  def save_changes(self):
-    spline_data = BytesIO()
-    write_u32(spline_data, 0x0, swap32(int(self.loop_flag)))
-    write_u32(spline_data, 0x4, swap32(len(self.points)))
-    saved_points = [list((self.transform @ Vector(vertex))[:]) for vertex in self.points]
-    for point in saved_points:
-      for j in range(3): write_float(spline_data, spline_data.tell(), swapfloat(point[j]))
-    spline_data.seek(0)
-    return spline_data.read()
+  def save_changes(self, spline_data=None):
+    if spline_data == None: spline_data = BinaryWriter()
+    spline_data.swrite_u32(int(self.loop_flag))
+    spline_data.swrite_u32(len(self.points))
+    saved_points = [(self.transform @ Vector(vertex)).tolist() for vertex in self.points]
+    spline_data.swrite_records("3f", [point[0:3] for point in saved_points])
+    return spline_data
   
   def get_bpypath(self):
     return self.loop_flag, self.points, self.transform
@@ -2310,23 +2169,20 @@ class LightsEntry:
     self.lights = []
     if self.data == None: return
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.count = self.data.sread_u32()
     print(self.name + " has " + str(self.count) + " lights")
     for i in range(self.count):
       self.lights.append(LightEntry(self.data))
     self.data.seek(self.entry_offset + 0x4 + self.block_size)
   
-  def save_changes(self):
-    output = BytesIO()
-    write_magic_str(output, output.tell(), "LITE", 4)
-    write_u32(output, output.tell(), 0)
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    block_offset = output.begin_block("LITE")
     self.count = len(self.lights)
-    write_u32(output, output.tell(), swap32(self.count))
-    for light in self.lights: write_bytes(output, output.tell(), light.save_changes().read())
-    self.block_size = data_len(output) - 0x8
-    write_u32(output, 0x4, swap32(self.block_size))
-    output.seek(0)
+    output.swrite_u32(self.count)
+    for light in self.lights: light.save_changes(output)
+    self.block_size = output.end_block(block_offset)
     return output
 
 class LightEntry: #GetMeshLights__10LIGHT_LISTR11MESH_LIGHTSP5CVec4
@@ -2343,17 +2199,17 @@ class LightEntry: #GetMeshLights__10LIGHT_LISTR11MESH_LIGHTSP5CVec4
     if self.data == None: return
     self.object_type = "Light"
     
-    self.flag = sread_u32(self.data, self.data.tell())
+    self.flag = self.data.sread_u32()
     if (self.flag & 0x1) != 0:
-      self.type = sread_u32(self.data, self.data.tell())
+      self.type = self.data.sread_u32()
       if self.type == 4: self.type = 3
     
     if (self.flag & 0x2) != 0:
-      _v = [sread_float(self.data, self.data.tell()) for _ in range(4)]
+      _v = self.data.sread_floats(4)
       self.color = tuple(reversed(_v[0:3]))
     
     if (self.flag & 0x4) != 0:
-      _m = [sread_float(self.data, self.data.tell()) for _ in range(4 * 4)]
+      _m = self.data.sread_floats(4 * 4)
       _m = [_m[i:i+4] for i in range(0, len(_m), 4)]
       self.transform = Matrix(_m).transposed()
       #R = self.transform.to_3x3().normalized().to_4x4()
@@ -2363,37 +2219,36 @@ class LightEntry: #GetMeshLights__10LIGHT_LISTR11MESH_LIGHTSP5CVec4
     
     if (self.flag & 0x8) != 0:
       # Radius, Falloff
-      self.radfall = tuple([sread_float(self.data, self.data.tell()), sread_float(self.data, self.data.tell())])
+      self.radfall = tuple([self.data.sread_float(), self.data.sread_float()])
     if (self.flag & 0x10) != 0:
-      self.spot = tuple([sread_float(self.data, self.data.tell()), sread_float(self.data, self.data.tell())])
+      self.spot = tuple([self.data.sread_float(), self.data.sread_float()])
   
   def get_bpylight(self):
     return self.TYPES[self.type], self.color, self.radfall, self.spot, self.transform
   
-  def save_changes(self):
-    output = BytesIO()
-    write_u32(output, output.tell(), swap32(self.flag))
-    if (self.flag & 0x1) != 0: write_u32(output, output.tell(), swap32(self.type))
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    output.swrite_u32(self.flag)
+    if (self.flag & 0x1) != 0: output.swrite_u32(self.type)
     if (self.flag & 0x2) != 0:
       _c = list(reversed(self.color)) + [1.0]
-      for i in range(4): write_float(output, output.tell(), swapfloat(_c[i]))
+      output.swrite_floats(_c[0:4])
     if (self.flag & 0x4) != 0:
       transform = self.transform.transposed()
       _m = [transform[i][j] for i in range(4) for j in range(4)]
-      for f in _m: write_float(output, output.tell(), swapfloat(f))
+      output.swrite_floats(_m)
     if (self.flag & 0x8) != 0:
-      for val in list(self.radfall): write_float(output, output.tell(), swapfloat(val))
+      output.swrite_floats(list(self.radfall))
     if (self.flag & 0x10) != 0:
-      for val in list(self.spot): write_float(output, output.tell(), swapfloat(val))
-    output.seek(0)
+      output.swrite_floats(list(self.spot))
     return output
-
-  def inject_changes(self, color, type=0, transform=Matrix(), energy=0, soft_radius=0, spot_size=0, spot_blend=0):
+  
+  def inject_changes(self, color, type=0, transform=None, energy=0, soft_radius=0, spot_size=0, spot_blend=0):
     self.flag = 0x1F
     self.type = type
     self.color = tuple(color)
-    self.transform = transform
-
+    self.transform = Matrix(transform)
+    
     self.radfall = (soft_radius, (energy * 2) - soft_radius)
     if (self.radfall[0] + self.radfall[1]) == 0 or spot_size == 0: return
     spot_val = spot_size * spot_size
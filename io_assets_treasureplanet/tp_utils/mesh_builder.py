@@ -0,0 +1,55 @@
+import numpy as np
+
+# Fills Blender meshes from flat arrays with add()/foreach_set. Everything here works on the mesh that is
+# passed in, so the module itself doesn't need bpy.
+# Material ranges are (material_index, face_offset, face_count, uv_layers) tuples, one per submesh in face order.
+
+def build_mesh(mesh, vertices, faces):
+  vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+  faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)
+  mesh.vertices.add(len(vertices))
+  mesh.loops.add(faces.size)
+  mesh.polygons.add(len(faces))
+  mesh.vertices.foreach_set("co", vertices.reshape(-1))
+  mesh.loops.foreach_set("vertex_index", faces.reshape(-1))
+  mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, 3, dtype=np.int32))
+  # loop_total is derived from loop_start and read-only in newer Blender versions
+  if len(faces) > 0 and not type(mesh.polygons[0]).bl_rna.properties["loop_total"].is_readonly:
+    mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+  mesh.update(calc_edges=True)
+  return mesh
+
+def material_slots(material_ranges, face_count):
+  # Materials in order of first use and the slot of every face
+  materials = []
+  slots = {}
+  face_slots = np.zeros(face_count, dtype=np.int32)
+  for material_index, face_offset, range_face_count, uv_layers in material_ranges:
+    if not material_index in slots:
+      slots[material_index] = len(materials)
+      materials.append(material_index)
+    face_slots[face_offset:face_offset + range_face_count] = slots[material_index]
+  return materials, face_slots
+
+def range_loop_uvs(material_ranges, face_count):
+  # One (face_count * 3, 2) array per uv layer, corners of ranges without that layer stay at (0, 0)
+  layer_count = max([len(uv_layers) for material_index, face_offset, range_face_count, uv_layers in material_ranges] + [0])
+  loop_uvs = np.zeros((layer_count, face_count * 3, 2), dtype=np.float32)
+  for material_index, face_offset, range_face_count, uv_layers in material_ranges:
+    for layer, uvs in enumerate(uv_layers):
+      if len(uvs) == 0: continue
+      loop_uvs[layer, face_offset * 3:(face_offset + range_face_count) * 3] = np.asarray(uvs, dtype=np.float32).reshape(-1, 2)
+  return loop_uvs
+
+def set_material_indices(mesh, face_slots):
+  mesh.polygons.foreach_set("material_index", np.ascontiguousarray(face_slots, dtype=np.int32))
+
+def add_uv_layer(mesh, loop_uvs):
+  uv_layer = mesh.uv_layers.new()
+  uv_layer.data.foreach_set("uv", np.ascontiguousarray(loop_uvs, dtype=np.float32).reshape(-1))
+  return uv_layer
+
+def add_color_layer(mesh, loop_colors):
+  color_layer = mesh.vertex_colors.new()
+  color_layer.data.foreach_set("color", np.ascontiguousarray(loop_colors, dtype=np.float32).reshape(-1))
+  return color_layer
@@ -1,5 +1,6 @@
 import os
 import sys
+import numpy as np
 try:
   from PIL import Image
   has_pillow = True
@@ -21,221 +22,195 @@ class Color(object):
         self.alpha = alpha
 
 
-class OctreeNode(object):
+def get_color_indices_for_level(colors, level):
     """
-    Octree Node class for color quantization
+    Get child index of every row of `colors` for next `level`
     """
+    #mask = 0x80 >> level
+    mask = 0x100 >> level
+    bits = (colors & mask) != 0
+    return (bits[:, 0] * 8) | (bits[:, 1] * 4) | (bits[:, 2] * 2) | bits[:, 3]#4, 2, 1
 
-    def __init__(self, level, parent):
-        """
-        Init new Octree Node
-        """
-        self.color = Color(0, 0, 0, 0)
-        self.pixel_count = 0
-        self.palette_index = 0
-        self.children = [None for _ in range(16)]#8)]
-        # add node to current level
-        if level < OctreeQuantizer.MAX_DEPTH - 1:
-            parent.add_level_node(level, self)
-
-    def is_leaf(self):
-        """
-        Check that node is leaf
-        """
-        return self.pixel_count > 0
-
-    def get_leaf_nodes(self):
-        """
-        Get all leaf nodes
-        """
-        leaf_nodes = []
-        for i in range(16):#8):
-            node = self.children[i]
-            if node:
-                if node.is_leaf():
-                    leaf_nodes.append(node)
-                else:
-                    leaf_nodes.extend(node.get_leaf_nodes())
-        return leaf_nodes
-
-    def get_nodes_pixel_count(self):
-        """
-        Get a sum of pixel count for node and its children
-        """
-        sum_count = self.pixel_count
-        for i in range(16):#8):
-            node = self.children[i]
-            if node:
-                sum_count += node.pixel_count
-        return sum_count
-
-    def add_color(self, color, level, parent):
-        """
-        Add `color` to the tree
-        """
-        if level >= OctreeQuantizer.MAX_DEPTH:
-            self.color.red += color.red
-            self.color.green += color.green
-            self.color.blue += color.blue
-            self.color.alpha += color.alpha
-            self.pixel_count += 1
-            return
-        index = self.get_color_index_for_level(color, level)
-        if not self.children[index]:
-            self.children[index] = OctreeNode(level, parent)
-        self.children[index].add_color(color, level + 1, parent)
-
-    def get_palette_index(self, color, level):
-        """
-        Get palette index for `color`
-        Uses `level` to go one level deeper if the node is not a leaf
-        """
-        if self.is_leaf():
-            return self.palette_index
-        index = self.get_color_index_for_level(color, level)
-        if self.children[index]:
-            return self.children[index].get_palette_index(color, level + 1)
-        else:
-            # get palette index for a first found child node
-            for i in range(16):#8):
-                if self.children[i]:
-                    return self.children[i].get_palette_index(color, level + 1)
-
-    def remove_leaves(self):
-        """
-        Add all children pixels count and color channels to parent node 
-        Return the number of removed leaves
-        """
-        result = 0
-        for i in range(16):#8):
-            node = self.children[i]
-            if node:
-                self.color.red += node.color.red
-                self.color.green += node.color.green
-                self.color.blue += node.color.blue
-                self.color.alpha += node.color.alpha
-                self.pixel_count += node.pixel_count
-                result += 1
-        return result - 1
 
-    def get_color_index_for_level(self, color, level):
-        """
-        Get index of `color` for next `level`
-        """
-        index = 0
-        #mask = 0x80 >> level
-        mask = 0x100 >> level
-        if color.red & mask:
-            index |= 8#4
-        if color.green & mask:
-            index |= 4#2
-        if color.blue & mask:
-            index |= 2#1
-        if color.alpha & mask:
-          index |= 1
-        return index
-
-    def get_color(self):
-        """
-        Get average color
-        """
-        return Color(
-            int(self.color.red / self.pixel_count),
-            int(self.color.green / self.pixel_count),
-            int(self.color.blue / self.pixel_count),
-            int(self.color.alpha / self.pixel_count))
+def get_node_keys_for_depth(colors, depth):
+    """
+    Get the key of the node at `depth` that every row of `colors` passes through
+    """
+    prefix = colors >> (9 - depth)
+    return (prefix[:, 0] << 24) | (prefix[:, 1] << 16) | (prefix[:, 2] << 8) | prefix[:, 3]
 
 
 class OctreeQuantizer(object):
     """
     Octree Quantizer class for image color quantization
     Use MAX_DEPTH to limit a number of levels
+    Nodes are stored as parallel arrays indexed by node id, the root is node 0
     """
 
     MAX_DEPTH = 8
+    CHILD_COUNT = 16#8
 
     def __init__(self):
         """
         Init Octree Quantizer
         """
-        self.levels = {i: [] for i in range(OctreeQuantizer.MAX_DEPTH)}
-        self.root = OctreeNode(0, self)
+        self.children = np.full((1, OctreeQuantizer.CHILD_COUNT), -1, dtype=np.int64)
+        self.parents = np.full(1, -1, dtype=np.int64)
+        self.depths = np.zeros(1, dtype=np.int64)
+        self.paths = np.zeros(1, dtype=np.int64)
+        self.pixel_counts = np.zeros(1, dtype=np.int64)
+        self.color_sums = np.zeros((1, 4), dtype=np.int64)
+        self.palette_indices = np.zeros(1, dtype=np.int64)
+        # Sorted node keys and ids for every depth, used to find existing nodes
+        self.node_keys = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)) for _ in range(OctreeQuantizer.MAX_DEPTH + 1)]
+        self.reduced_levels = set()
+        self.leaf_count = 0
+
+    def get_level_nodes(self, level):
+        """
+        Get ids of the nodes registered at `level`, in creation order
+        Nodes are registered at the level of their parent, the root at level 0
+        """
+        if level >= OctreeQuantizer.MAX_DEPTH - 1: return np.zeros(0, dtype=np.int64)
+        nodes = np.nonzero(self.depths == level + 1)[0]
+        if level == 0: nodes = np.concatenate(([0], nodes))
+        return nodes
+
+    def add_nodes(self, depth, keys, parents, child_indices):
+        """
+        Get ids of the nodes at `depth` for `keys`, creating the missing ones in order of first appearance
+        """
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        sorted_keys, sorted_ids = self.node_keys[depth]
+        positions = np.minimum(np.searchsorted(sorted_keys, unique_keys), max(len(sorted_keys) - 1, 0))
+        found = (sorted_keys[positions] == unique_keys) if len(sorted_keys) else np.zeros(len(unique_keys), dtype=bool)
+        ids = np.zeros(len(unique_keys), dtype=np.int64)
+        ids[found] = sorted_ids[positions[found]]
+
+        new = np.nonzero(~found)[0]
+        if len(new):
+            new = new[np.argsort(first[new], kind='stable')]
+            new_ids = np.arange(len(self.parents), len(self.parents) + len(new))
+            ids[new] = new_ids
+            new_parents = parents[first[new]]
+            new_child_indices = child_indices[first[new]]
+            self.children = np.concatenate((self.children, np.full((len(new), OctreeQuantizer.CHILD_COUNT), -1, dtype=np.int64)))
+            self.children[new_parents, new_child_indices] = new_ids
+            self.parents = np.concatenate((self.parents, new_parents))
+            self.depths = np.concatenate((self.depths, np.full(len(new), depth, dtype=np.int64)))
+            self.paths = np.concatenate((self.paths, self.paths[new_parents] | (new_child_indices << (4 * (OctreeQuantizer.MAX_DEPTH - depth)))))
+            self.pixel_counts = np.concatenate((self.pixel_counts, np.zeros(len(new), dtype=np.int64)))
+            self.color_sums = np.concatenate((self.color_sums, np.zeros((len(new), 4), dtype=np.int64)))
+            self.palette_indices = np.concatenate((self.palette_indices, np.zeros(len(new), dtype=np.int64)))
+            merged_keys = np.concatenate((sorted_keys, unique_keys[new]))
+            merged_ids = np.concatenate((sorted_ids, new_ids))
+            order = np.argsort(merged_keys, kind='stable')
+            self.node_keys[depth] = (merged_keys[order], merged_ids[order])
+            if depth == OctreeQuantizer.MAX_DEPTH: self.leaf_count += len(new)
+        return ids[inverse.reshape(-1)]
+
+    def add_colors(self, colors, counts=None):
+        """
+        Add every row of `colors` to the Octree, `counts` times each
+        """
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 4)
+        if counts is None: counts = np.ones(len(colors), dtype=np.int64)
+        else: counts = np.asarray(counts, dtype=np.int64)
+        nodes = np.zeros(len(colors), dtype=np.int64)
+        for depth in range(1, OctreeQuantizer.MAX_DEPTH + 1):
+            child_indices = get_color_indices_for_level(colors, depth - 1)
+            nodes = self.add_nodes(depth, get_node_keys_for_depth(colors, depth), nodes, child_indices)
+        np.add.at(self.pixel_counts, nodes, counts)
+        np.add.at(self.color_sums, nodes, colors * counts[:, None])
+
+    def add_color(self, red=0, green=0, blue=0, alpha=0, count=1):
+        self.add_colors([(red, green, blue, alpha)], [count])
 
     def get_leaves(self):
         """
-        Get all leaves
-        """
-        return [node for node in self.root.get_leaf_nodes()]
-
-    def add_level_node(self, level, node):
-        """
-        Add `node` to the nodes at `level`
-        """
-        self.levels[level].append(node)
-
-    def add_color(self, color):
-        """
-        Add `color` to the Octree
-        """
-        # passes self value as `parent` to save nodes to levels dict
-        self.root.add_color(color, 0, self)
-    
-    def add_color(self, red=0, green=0, blue=0, alpha=0):
-      self.root.add_color(Color(red, green, blue, alpha), 0, self)
+        Get ids of all leaves in depth-first order
+        """
+        is_leaf = self.pixel_counts > 0
+        hidden = np.zeros(len(self.parents), dtype=bool)
+        for depth in range(1, OctreeQuantizer.MAX_DEPTH + 1):
+            nodes = np.nonzero(self.depths == depth)[0]
+            parents = self.parents[nodes]
+            hidden[nodes] = hidden[parents] | is_leaf[parents]
+        leaves = np.nonzero(is_leaf & ~hidden)[0]
+        return leaves[np.argsort(self.paths[leaves], kind='stable')]
+
+    def reduce_level(self, level, color_count):
+        """
+        Merge children into the nodes registered at `level` until at most `color_count` leaves remain
+        Return True once the leaf count is low enough
+        """
+        nodes = self.get_level_nodes(level)
+        if not len(nodes): return False
+        children = self.children[nodes]
+        exists = children >= 0
+        remaining = self.leaf_count - np.cumsum(exists.sum(axis=1) - 1)
+        done = np.nonzero(remaining <= color_count)[0]
+        if len(done):
+            nodes, children, exists = nodes[:done[0] + 1], children[:done[0] + 1], exists[:done[0] + 1]
+        # Every node reads its children as they were before this level, like the sequential merge did
+        children = np.where(exists, children, 0)
+        child_counts = self.pixel_counts[children] * exists
+        child_sums = self.color_sums[children] * exists[:, :, None]
+        self.pixel_counts[nodes] += child_counts.sum(axis=1)
+        self.color_sums[nodes] += child_sums.sum(axis=1)
+        self.leaf_count = int(remaining[len(nodes) - 1])
+        return len(done) > 0
 
     def make_palette(self, color_count):
         """
         Make color palette with `color_count` colors maximum
         """
-        palette = []
-        palette_index = 0
-        leaf_count = len(self.get_leaves())
         # reduce nodes
         # up to 8 leaves can be reduced here and the palette will have
         # only 248 colors (in worst case) instead of expected 256 colors
         for level in range(OctreeQuantizer.MAX_DEPTH - 1, -1, -1):
-            if self.levels[level]:
-                for node in self.levels[level]:
-                    leaf_count -= node.remove_leaves()
-                    if leaf_count <= color_count:
-                        break
-                if leaf_count <= color_count:
-                    break
-                self.levels[level] = []
-        # build palette
-        for node in self.get_leaves():
-            if palette_index >= color_count:
+            if level in self.reduced_levels: continue
+            if self.reduce_level(level, color_count):
                 break
-            if node.is_leaf():
-                palette.append(node.get_color())
-            node.palette_index = palette_index
-            palette_index += 1
-        return palette
+            self.reduced_levels.add(level)
+        # build palette
+        leaves = self.get_leaves()[:color_count]
+        self.palette_indices[leaves] = np.arange(len(leaves))
+        colors = self.color_sums[leaves] // self.pixel_counts[leaves][:, None]
+        return [Color(*color) for color in colors.tolist()]
+
+    def get_palette_indices(self, colors):
+        """
+        Get palette index for every row of `colors`
+        Colors without a matching child follow the first existing child
+        """
+        colors = np.asarray(colors, dtype=np.int64).reshape(-1, 4)
+        nodes = np.zeros(len(colors), dtype=np.int64)
+        first_children = self.children[np.arange(len(self.children)), np.argmax(self.children >= 0, axis=1)]
+        for level in range(OctreeQuantizer.MAX_DEPTH):
+            active = self.pixel_counts[nodes] == 0
+            if not active.any(): break
+            next_nodes = self.children[nodes, get_color_indices_for_level(colors, level)]
+            next_nodes = np.where(next_nodes >= 0, next_nodes, first_children[nodes])
+            nodes = np.where(active, next_nodes, nodes)
+        return self.palette_indices[nodes]
 
-    def get_palette_index(self, color):
-        """
-        Get palette index for `color`
-        """
-        return self.root.get_palette_index(color, 0)
-    
     def get_palette_index(self, red=0, green=0, blue=0, alpha=0):
         """
         Get palette index for `color`
         """
-        return self.root.get_palette_index(Color(red, green, blue, alpha), 0)
+        return int(self.get_palette_indices([(red, green, blue, alpha)])[0])
 
 def main(path):
-    image = Image.open(path)
+    image = Image.open(path).convert('RGBA')
     no_ext = os.path.splitext(path)[0]
-    pixels = image.load()
     width, height = image.size
+    pixels = np.asarray(image).reshape(-1, 4)
 
     octree = OctreeQuantizer()
 
     # add colors to the octree
-    for j in range(height):
-        for i in range(width):
-            octree.add_color(Color(*pixels[i, j]))
+    octree.add_colors(pixels)
 
     # 256 colors for 8 bits per pixel output image
     palette = octree.make_palette(256)
@@ -248,14 +223,9 @@ def main(path):
     palette_image.save(no_ext + '_palette.png')
 
     # save output image
-    out_image = Image.new('RGBA', (width, height))
-    out_pixels = out_image.load()
-    for j in range(height):
-        for i in range(width):
-            index = octree.get_palette_index(Color(*pixels[i, j]))
-            color = palette[index]
-            out_pixels[i, j] = (color.red, color.green, color.blue, color.alpha)
-    out_image.save(no_ext + '_out.png')
+    palette = np.array([(c.red, c.green, c.blue, c.alpha) for c in palette], dtype=np.uint8)
+    out_pixels = palette[octree.get_palette_indices(pixels)].reshape(height, width, 4)
+    Image.fromarray(out_pixels, 'RGBA').save(no_ext + '_out.png')
 
 if __name__ == '__main__':
   if len(sys.argv) >= 2:
@@ -1,5 +1,6 @@
 from io import BytesIO
 from fs_helpers import *
+from strips import strip_triangles
 
 class ModelBounds:
   def __init__(self, data=None):
@@ -13,37 +14,31 @@ class ModelBounds:
     if data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.flags = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.flags = self.data.sread_u32()
     
     if (self.flags & 1):
-      self.scale = sread_float(self.data, self.data.tell())
+      self.scale = self.data.sread_float()
     
     if (self.flags & 2):
-      for i in range(3):
-        self.center.append(sread_float(self.data, self.data.tell()))
-      self.size = sread_float(self.data, self.data.tell())
+      self.center = self.data.sread_floats(3)
+      self.size = self.data.sread_float()
   
-  def save_changes(self):
-    output = BytesIO()
-    write_magic_str(output, 0x0, "SETT", 4)
-    write_u32(output, 0x4, 0)
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    block_offset = output.begin_block("SETT")
     
     if self.scale > 0.0: self.flags |= 1
     if len(self.center) == 3: self.flags |= 2
     
-    write_u32(output, output.tell(), swap32(self.flags))
+    output.swrite_u32(self.flags)
     if (self.flags & 1):
-      write_float(output, output.tell(), swapfloat(self.scale))
+      output.swrite_float(self.scale)
     if (self.flags & 2):
-      for co in self.center:
-        write_float(output, output.tell(), swapfloat(co))
-      write_float(output, output.tell(), swapfloat(self.size))
+      output.swrite_floats(list(self.center))
+      output.swrite_float(self.size)
     
-    output.seek(0)
-    self.block_size = data_len(output) - 0x8
-    write_u32(output, 0x4, swap32(self.block_size))
-    output.seek(0)
+    self.block_size = output.end_block(block_offset)
     return output
     
 
@@ -57,25 +52,20 @@ class ModlMaterialsEntry:
     if data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.count = self.data.sread_u32()
     for i in range(self.count):
       mat_entry_offset = self.data.tell()
       mat = ModlMaterialEntry(self.data, mat_entry_offset)
       self.materials.append(mat)
   
-  def save_changes(self):
-    output = BytesIO()
-    write_magic_str(output, 0x0, "MATL", 4)
-    write_u32(output, 0x4, swap32(self.block_size))
-    write_u32(output, 0x8, swap32(len(self.materials)))
-    self.block_size = 4
+  def save_changes(self, output=None):
+    if output == None: output = BinaryWriter()
+    block_offset = output.begin_block("MATL")
+    output.swrite_u32(len(self.materials))
     for mat in self.materials:
-      mat_data = mat.save_changes()
-      output.write(mat_data.read())
-      self.block_size += data_len(mat_data)
-    write_u32(output, 0x4, swap32(self.block_size))
-    output.seek(0)
+      mat.save_changes(output)
+    self.block_size = output.end_block(block_offset)
     return output
 
 class ModlMaterialEntry:
@@ -94,11 +84,11 @@ class ModlMaterialEntry:
     if self.data == None: return
     
     self.entry_offset = entry_offset
-    self.type = sread_u32(self.data, self.data.tell())
-    self.property_count = sread_u32(self.data, self.data.tell())
+    self.type = self.data.sread_u32()
+    self.property_count = self.data.sread_u32()
     self.properties = []
     for i in range(self.property_count):
-      mat_data = self.ModlMaterialDataEntry(read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()))
+      mat_data = self.ModlMaterialDataEntry(self.data.read_u8(), self.data.read_u8(), self.data.read_u8(), self.data.read_u8())
       fog_bitfield = 0
       property_type = mat_data.type
       if (self.type & 0x2) != 0: fog_bitfield = 0x10
@@ -155,16 +145,12 @@ class ModlMaterialEntry:
     self.properties.append(mat_data)
     self.property_count = len(self.properties)
   
-  def save_changes(self):
-    mat_data = BytesIO()
-    write_u32(mat_data, 0x0, swap32(self.type))
-    write_u32(mat_data, 0x4, swap32(self.property_count))
+  def save_changes(self, mat_data=None):
+    if mat_data == None: mat_data = BinaryWriter()
+    mat_data.swrite_u32(self.type)
+    mat_data.swrite_u32(self.property_count)
     for p in self.properties:
-      write_u8(mat_data, mat_data.tell(), p.texture_index)
-      write_u8(mat_data, mat_data.tell(), p.type)
-      write_u8(mat_data, mat_data.tell(), p.col_sel)
-      write_u8(mat_data, mat_data.tell(), p.flags)
-    mat_data.seek(0)
+      mat_data.write_u8s([p.texture_index, p.type, p.col_sel, p.flags])
     return mat_data
 
 
@@ -180,44 +166,23 @@ class ModelSubmeshEntry:
       if self.data == None: return
       
       mesh_geom_offset = self.data.tell()
-      self.vertex_count = sread_u32(self.data, mesh_geom_offset)
+      self.vertex_count = self.data.sread_u32(mesh_geom_offset)
       self.approx_strip_count = 0
       _uvs = []
-      flip = True
-      for v in range(self.vertex_count):
-        vertex_offset = self.data.tell()
-        v_x = sread_float(self.data, vertex_offset + 0x0)
-        v_y = sread_float(self.data, vertex_offset + 0x4)
-        v_z = sread_float(self.data, vertex_offset + 0x8)
-        n_x = sread_float(self.data, vertex_offset + 0xC)
-        n_y = sread_float(self.data, vertex_offset + 0x10)
-        n_z = sread_float(self.data, vertex_offset + 0x14)
-        u_x = sread_float(self.data, vertex_offset + 0x18)
-        u_y = sread_float(self.data, vertex_offset + 0x1C)
-        face_data = sread_u32(self.data, vertex_offset + 0x20)
+      _flags = []
+      for v, (v_x, v_y, v_z, n_x, n_y, n_z, u_x, u_y, face_data) in enumerate(self.data.sread_records("8fI", self.vertex_count)):
         self.vertices.append([v_x, v_y, v_z])
         self.normals.append([n_x, n_y, n_z])
         _uvs.append([u_x, u_y])
+        _flags.append(face_data)
         if (face_data & 0x8000): self.approx_strip_count += 1
-        if v >= 2:
-          flip = self.add_face(self.faces, v, face_data, flip)
-          #flip = self.reset_winding(face_data, flip)
+      self.faces = strip_triangles(_flags).tolist()
       self.approx_strip_count /= 2
       for face in self.faces:
         self.uvs.append(_uvs[face[0]])
         self.uvs.append(_uvs[face[1]])
         self.uvs.append(_uvs[face[2]])
       
-    def add_face(self, faces, fc, face_data, flip):
-      if (face_data & 0x8000): return True#flip
-      fa = max(0, fc - 2)
-      fb = max(0, fc - 1)
-      flip = (fc % 2) != 0
-      if fc >= 2:
-        if not flip: faces.append([fa, fb, fc])
-        else: faces.append([fb, fa, fc])#([fa, fc, fb])
-      return not flip
-    
     def reset_winding(self, face_data, flip):
       if (face_data & 0x8000): return True
       return flip
@@ -230,8 +195,8 @@ class ModelSubmeshEntry:
     if self.data == None: return
     
     submesh_offset = self.data.tell()
-    self.material_index = sread_u32(self.data, submesh_offset)
-    self.geom_count = sread_u32(self.data, submesh_offset + 0x4)
+    self.material_index = self.data.sread_u32(submesh_offset)
+    self.geom_count = self.data.sread_u32(submesh_offset + 0x4)
     self.approx_strip_count = 0
     for p in range(self.geom_count):
       geom = self.MeshGeomEntry(self.data)
@@ -268,8 +233,8 @@ class ModelLodEntry:
     if self.data == None: return
     
     lod_offset = self.data.tell()
-    self.lod_radius = sread_float(self.data, lod_offset)
-    self.submesh_count = sread_u32(self.data, lod_offset + 0x4)
+    self.lod_radius = self.data.sread_float(lod_offset)
+    self.submesh_count = self.data.sread_u32(lod_offset + 0x4)
     self.approx_strip_count = 0
     for s in range(self.submesh_count):
       submesh = ModelSubmeshEntry(self.data)
@@ -294,9 +259,9 @@ class ModelEntry:
     if self.data == None: return
     
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.entry_offset)
+    self.block_size = self.data.sread_u32(self.entry_offset)
     
-    self.mesh_count_maybe = sread_u32(self.data, self.entry_offset + 4)
+    self.mesh_count_maybe = self.data.sread_u32(self.entry_offset + 4)
     #if self.mesh_count_maybe > 1: print("Mesh Count:%d" % self.mesh_count_maybe)
     self.lod_counts = [0]*self.mesh_count_maybe
     self.populate_meshes()
@@ -305,7 +270,7 @@ class ModelEntry:
     self.data.seek(self.entry_offset + 0x8)
     for m in range(self.mesh_count_maybe):
       mesh_offset = self.data.tell()
-      lod_count = sread_u32(self.data, mesh_offset)
+      lod_count = self.data.sread_u32(mesh_offset)
       self.lod_counts[m] = lod_count
       for l in range(lod_count):
         lod_mesh = ModelLodEntry(self.data, self.name+"_m"+str(m)+"_l"+str(l))
@@ -321,14 +286,13 @@ class ModelEntry:
       lod_radii.append(lod_mesh.lod_radius)
       geometry.append((lod_mesh.get_submesh_geometry(), int(lod_mesh.name.rsplit("_l")[0].rsplit("_m")[1])))
     
-    material_uvs = {}
+    material_ranges = []
     added_offset = 0
-    uv_offset = 0
     face_offset = 0
     vertex_groups = [[]]*self.mesh_count_maybe
     for g, (lod_geometry, group_id) in enumerate(geometry):
       for submesh_vertices, submesh_normals, submesh_uvs, submesh_faces, submesh_material_index, submesh_offset in lod_geometry:
-        if not submesh_material_index in material_uvs: material_uvs[submesh_material_index] = (face_offset, uv_offset, len(submesh_faces), submesh_uvs)
+        material_ranges.append((submesh_material_index, face_offset, len(submesh_faces), [submesh_uvs]))
         adjusted_indices_flat = [ind + added_offset for face in submesh_faces for ind in face]
         adjusted_indices = [adjusted_indices_flat[f:f+3] for f in range(0, len(adjusted_indices_flat), 3)]
         if added_offset == 0:
@@ -342,5 +306,4 @@ class ModelEntry:
         vertex_groups[group_id].extend(adjusted_indices_flat)#(added_offset, len(submesh_vertices)))
         added_offset += len(submesh_vertices)
         face_offset += len(submesh_faces)
-        uv_offset += len(submesh_uvs)
-    return mesh_vertices, mesh_normals, mesh_faces, material_uvs, vertex_groups, lod_radii
+    return mesh_vertices, mesh_normals, mesh_faces, material_ranges, vertex_groups, lod_radii
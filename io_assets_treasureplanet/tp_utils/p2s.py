@@ -4,14 +4,15 @@ import sys
 import math
 
 from fs_helpers import *
-from mathutils import Vector, Matrix
+from strips import strip_triangles
+from linalg import Vector, Matrix
 
 class SkelMaterialsEntry:
   def __init__(self, data):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.count = self.data.sread_u32()
     self.materials = []
     for i in range(self.count):
       mat_entry_offset = self.data.tell()
@@ -29,11 +30,11 @@ class SkelMaterialEntry:
   def __init__(self, data, entry_offset):
     self.data = data
     self.entry_offset = entry_offset
-    self.type = sread_u32(self.data, self.data.tell())
-    self.property_count = sread_u32(self.data, self.data.tell())
+    self.type = self.data.sread_u32()
+    self.property_count = self.data.sread_u32()
     self.properties = []
     for i in range(self.property_count):
-      mat_data = self.SkelMaterialDataEntry(read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()), read_u8(self.data, self.data.tell()))
+      mat_data = self.SkelMaterialDataEntry(self.data.read_u8(), self.data.read_u8(), self.data.read_u8(), self.data.read_u8())
       self.properties.append(mat_data)
   
   def printInfo(self, textures):
@@ -46,9 +47,9 @@ class SkelModelEntry:
   def __init__(self, data):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.entry_offset)
-    self.lod_flag = sread_u32(self.data, self.data.tell())
-    self.mesh_count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32(self.entry_offset)
+    self.lod_flag = self.data.sread_u32()
+    self.mesh_count = self.data.sread_u32()
     self.meshes = []
     for m in range(self.mesh_count):
       self.meshes.append(SkelModelLodEntry(self.data, "_l"+str(m), self.lod_flag))
@@ -87,9 +88,9 @@ class SkelModelLodEntry:
     self.name = name
     self.data = data
     if (lod_flag & 1) != 0:
-      self.lod_radius = sread_float(self.data, self.data.tell())
+      self.lod_radius = self.data.sread_float()
     else: self.lod_radius = 0.0
-    self.submesh_count = sread_u32(self.data, self.data.tell())
+    self.submesh_count = self.data.sread_u32()
     
     #print("Place %08x" % self.data.tell())
     print("Lod Radius: %f" % self.lod_radius)
@@ -101,7 +102,7 @@ class SkelModelLodEntry:
     #print("Place %08x" % self.data.tell())
     #submesh_count > geom_count > strip_count > substrip_count * 8
     for submesh in self.submeshes:
-      submesh.material_index = sread_u32(self.data, self.data.tell())
+      submesh.material_index = self.data.sread_u32()
       for geom in submesh.geometry:
         for sc in geom.strip_counts:
           self.data.seek(self.data.tell() + (sc * 0x4 * 2)) # Likely uvs
@@ -118,9 +119,9 @@ class SkelModelSubmeshEntry:
   class SkelModelGeometry:
     def __init__(self, data, g):
       self.data = data
-      self.joint_count = sread_u32(self.data, self.data.tell())
-      self.vertex_count = sread_u32(self.data, self.data.tell())
-      self.strip_count = sread_u32(self.data, self.data.tell())
+      self.joint_count = self.data.sread_u32()
+      self.vertex_count = self.data.sread_u32()
+      self.strip_count = self.data.sread_u32()
       self.strip_counts = []
       print("Geometry %d Vertex Count: %d Joint Count: %d Strip Count: %d" % (g, self.vertex_count, self.joint_count, self.strip_count))
       for j in range(self.joint_count):
@@ -130,12 +131,10 @@ class SkelModelSubmeshEntry:
       _n = []
       self.faces = []
       self.vert_skips = []
-      for v in range(self.vertex_count):
-        #print("Vertex %d offset: %08x" % (v, self.data.tell()))
-        for p in range(3): _v.append(sread_float(self.data, self.data.tell()))
-        face_data = sread_u32(self.data, self.data.tell()) # question mark
-        for n in range(3): _n.append(sread_float(self.data, self.data.tell()))
-        self.data.seek(self.data.tell() + 0x2 * 2) # skeleton related I believe
+      # x, y, z, face data (question mark), nx, ny, nz, 2 shorts skeleton related I believe
+      for v_x, v_y, v_z, face_data, n_x, n_y, n_z in self.data.sread_records("3fI3f4x", self.vertex_count):
+        _v += (v_x, v_y, v_z)
+        _n += (n_x, n_y, n_z)
         self.vert_skips.append(face_data)
         #if v >= 2:
         #  self.add_face(self.faces, v, face_data)
@@ -144,30 +143,19 @@ class SkelModelSubmeshEntry:
       
       _f = []
       for s in range(self.strip_count):
-        strip_len = sread_u32(self.data, self.data.tell())
+        strip_len = self.data.sread_u32()
         self.strip_counts.append(strip_len)
         #print("Substrip count: %d" % strip_len)
-        for ss in range(strip_len):
-          _f.append(sread_u16(self.data, self.data.tell()) >> 4)
-          _f.append(sread_u16(self.data, self.data.tell()))
+        for vertex_index, winding in self.data.sread_records("HH", strip_len):
+          _f.append(vertex_index >> 4)
+          _f.append(winding)
           #self.data.seek(self.data.tell() + 0x2 * 2) # 2 byte vertex index (index * 0x20), 2 byte winding indicator
       self.face_data = [_f[i:i+2] for i in range(0, len(_f), 2)]
       _v = []
       _n = []
-      for f in range(len(self.face_data)):
-        self.add_face(self.faces, self.face_data[f][0], self.face_data[f][1])
+      self.faces = strip_triangles(_f[1::2], _f[0::2]).tolist()
       #print(self.faces)
     
-    def add_face(self, faces, fc, face_data):
-      if (face_data & 0x8000): return
-      fa = max(0, fc - 2)
-      fb = max(0, fc - 1)
-      flip = (fc % 2) != 0
-      if fc >= 2:
-        if not flip: faces.append([fa, fb, fc])
-        else: faces.append([fb, fa, fc])#([fa, fc, fb])
-      return
-    
     #def add_face(self, faces, fc, face_data, flip):
     #  if (face_data & 0x8000): return flip
     #  fa = 0 if fc < 3 else fc - 2
@@ -182,7 +170,7 @@ class SkelModelSubmeshEntry:
   
   def __init__(self, data, index):
     self.data = data
-    self.geom_count = sread_u32(self.data, self.data.tell())
+    self.geom_count = self.data.sread_u32()
     print("Submesh %d Geom Count: %d" % (index, self.geom_count))
     self.geometry = []
     for g in range(self.geom_count):
@@ -211,8 +199,8 @@ class JointListEntry:
     self.name = name
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.count = self.data.sread_u32()
     self.joints = []
     for i in range(self.count):
       joint_entry_offset = self.data.tell()
@@ -225,11 +213,8 @@ class JointEntry:
     self.data = data
     self.entry_offset = entry_offset
     self.name = try_read_str(self.data, self.entry_offset, 0x10)
-    self.count = sread_u32(self.data, self.data.tell())
-    self.indexes = []
-    index_offset = self.data.tell()
-    for i in range(self.count):
-      self.indexes.append(sread_u32(self.data, index_offset + i * 0x4))
+    self.count = self.data.sread_u32()
+    self.indexes = self.data.sread_u32s(self.count)
     print(root_name + " Joint: " + self.name)
     print(self.indexes)
 
@@ -238,8 +223,8 @@ class SkeletonEntry:
     self.name = name
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.bone_count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.bone_count = self.data.sread_u32()
     self.bones = [None]*self.bone_count
     self.root = BoneEntry(self.data, self.bones)
     #for i in range(self.bone_count):
@@ -251,20 +236,18 @@ class BoneEntry:
     self.data = data
     self.entry_offset = self.data.tell()
 
-    self.bone_index = sread_u32(self.data, self.entry_offset)
+    self.bone_index = self.data.sread_u32(self.entry_offset)
     if self.bone_index == 0xFFFFFFFF: return
     #print(self.bone_index)
     bones[self.bone_index] = self
 
-    _m = [sread_float(self.data, self.data.tell()) for _ in range(4 * 4)]
+    _m = self.data.sread_floats(4 * 4)
     _m = [_m[i:i+4] for i in range(0, len(_m), 4)]
     self.transform = Matrix(_m).transposed()
     
-    self.floats = []
-    for i in range(3):
-      self.floats.append(sread_float(self.data, self.data.tell()))
+    self.floats = self.data.sread_floats(3)
     
-    sread_u32(self.data, self.data.tell())
+    self.data.sread_u32()
     
     self.parent = parent
     self.child_2 = BoneEntry(data, bones, self)
@@ -274,25 +257,25 @@ class BoneEntry:
   #  self.skeleton_block = skeleton_block
   #  self.data = data
   #  self.entry_offset = entry_offset
-  #  self.bone_index = sread_u32(self.data, self.entry_offset)
+  #  self.bone_index = self.data.sread_u32(self.entry_offset)
   #  
-  #  _m = [sread_float(self.data, self.data.tell()) for _ in range(4 * 4)]
+  #  _m = [self.data.sread_float() for _ in range(4 * 4)]
   #  _m = [_m[i:i+4] for i in range(0, len(_m), 4)]
   #  self.transform = Matrix(_m).transposed()
   # 
   #  self.floats = []
   # for i in range(3):
-  #   self.floats.append(sread_float(self.data, self.data.tell()))
+  #   self.floats.append(self.data.sread_float())
   #
-  #  self.unknown = sread_u32(self.data, self.entry_offset + 20 * 0x4)
+  #  self.unknown = self.data.sread_u32(self.entry_offset + 20 * 0x4)
   #  print(skeleton_name + " Bone #" + str(self.bone_index) + " Unk: " + str(self.unknown))
   #  #print(self.transform)
   #  #print(self.floats)
   # 
   #  #Handle padding
-  #  padding_check = sread_s32(self.data, self.data.tell())
+  #  padding_check = self.data.sread_s32()
   # while padding_check == -1:
-  #   padding_check = sread_s32(self.data, self.data.tell())
+  #   padding_check = self.data.sread_s32()
   # self.data.seek(self.data.tell() - 0x4)
 
 class CyclesEntry:
@@ -300,9 +283,9 @@ class CyclesEntry:
     self.name = name
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.flags = sread_u32(self.data, self.data.tell())
-    self.cycles_count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.flags = self.data.sread_u32()
+    self.cycles_count = self.data.sread_u32()
     
     self.cycles = []
     if self.cycles_count != 0:
@@ -347,20 +330,19 @@ class CycleEntry:
     if (self.flags & 0x1) != 0:
       self.name = try_read_str(self.data, self.data.tell(), 0x10)
     if (self.flags & 0x2) != 0:
-      self.unk_1 = sread_s32(self.data, self.data.tell())
+      self.unk_1 = self.data.sread_s32()
     if (self.flags & 0x4) != 0:
-      self.unk_2 = sread_s32(self.data, self.data.tell())
+      self.unk_2 = self.data.sread_s32()
     if (self.flags & 0x8) != 0:
-      self.unk_f1 = sread_float(self.data, self.data.tell())
+      self.unk_f1 = self.data.sread_float()
     if (self.flags & 0x10) != 0:
-      self.unk_f2 = sread_float(self.data, self.data.tell())
+      self.unk_f2 = self.data.sread_float()
     if (self.flags & 0x20) != 0:
-      self.unk_3 = sread_s32(self.data, self.data.tell())
+      self.unk_3 = self.data.sread_s32()
       if self.unk_3 != 0:
-        for i in range(self.unk_3):
-          self.unk_4.append(sread_s32(self.data, self.data.tell()))
+        self.unk_4 = self.data.sread_array("i", self.unk_3)
     if (self.flags & 0x40) != 0:
-      self.unk_5 = sread_s32(self.data, self.data.tell())
+      self.unk_5 = self.data.sread_s32()
       if self.unk_5 != 0:
         for i in range(self.unk_5):
           self.unk_6.append(self.data.read(1))
@@ -368,23 +350,23 @@ class CycleEntry:
           self.unk_6.append(self.data.read(1))
           self.unk_6.append(self.data.read(1))
     if (self.flags & 0x80) != 0:
-      self.unk_7 = sread_s32(self.data, self.data.tell())
+      self.unk_7 = self.data.sread_s32()
     
     self.bunk.append(1)
     if bone_count != 0:
       bone_frames = []
       for b in range(bone_count):
-        bunk = sread_s32(self.data, self.data.tell())
+        bunk = self.data.sread_s32()
         self.bunk.append(bunk)
         self.bunk.append(bunk << 2)
         self.bunk.append(bunk << 4)
         self.LoadKeyframe(bone_frames)
-        bunk = sread_s32(self.data, self.data.tell())
+        bunk = self.data.sread_s32()
         self.bunk.append(bunk)
         self.bunk.append(bunk << 2)
         self.bunk.append(bunk << 4)
         self.LoadKeyframe(bone_frames)
-        bunk = sread_s32(self.data, self.data.tell())
+        bunk = self.data.sread_s32()
         self.bunk.append(bunk)
         self.bunk.append(bunk << 2)
         self.bunk.append(bunk << 4)
@@ -392,10 +374,8 @@ class CycleEntry:
         self.frames.append(bone_frames)
         
   def LoadKeyframe(self, bone_frames):
-    check = sread_s32(self.data, self.data.tell())
+    check = self.data.sread_s32()
     if check != -1:
       self.LoadKeyframe(bone_frames)
-      for i in range(5):
-        v = sread_float(self.data, self.data.tell())
-        bone_frames.append(v)
+      bone_frames += self.data.sread_floats(5)
       self.LoadKeyframe(bone_frames)
\ No newline at end of file
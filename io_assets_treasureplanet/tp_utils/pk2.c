@@ -0,0 +1,48 @@
+/*
+ * Optional native PK2 decoder used by decompress.py through ctypes.
+ * Build next to decompress.py, e.g.:
+ *   cc -O2 -shared -fPIC -o pk2.so pk2.c
+ *   cl /O2 /LD pk2.c /Fe:pk2.dll
+ */
+#include <stddef.h>
+#include <stdint.h>
+
+#if defined(_WIN32)
+#define PK2_EXPORT __declspec(dllexport)
+#else
+#define PK2_EXPORT
+#endif
+
+#define PK2_HEADER_SIZE 0xC
+
+PK2_EXPORT long pk2_decompress(const uint8_t *src, size_t src_size, uint8_t *dst, size_t dst_size)
+{
+  size_t in = PK2_HEADER_SIZE;
+  size_t out = 0;
+  while (out < dst_size) {
+    if (in + 4 > src_size) return -1;
+    uint32_t ctrl = ((uint32_t)src[in] << 24) | ((uint32_t)src[in + 1] << 16) | ((uint32_t)src[in + 2] << 8) | src[in + 3];
+    in += 4;
+    unsigned mask = ctrl & 3;
+    unsigned count_shift = 14 - mask;
+    uint32_t distance_mask = 0x3FFF >> mask;
+    for (int bit = 31; bit > 1 && out < dst_size; bit--) {
+      if ((ctrl >> bit) & 1) {
+        if (in + 2 > src_size) return -1;
+        uint32_t s = ((uint32_t)src[in] << 8) | src[in + 1];
+        in += 2;
+        size_t count = ((s >> count_shift) & 0x1F) + 3;
+        size_t distance = (s & distance_mask) + 1;
+        if (distance > out) return -1;
+        if (count > dst_size - out) count = dst_size - out;
+        const uint8_t *from = dst + out - distance;
+        for (size_t i = 0; i < count; i++) dst[out + i] = from[i];
+        out += count;
+      } else {
+        if (in >= src_size) return -1;
+        dst[out++] = src[in++];
+      }
+    }
+  }
+  return (long)out;
+}
@@ -0,0 +1,59 @@
+import sys
+import time
+import numpy as np
+
+STRIP_RESTART = 0x8000
+
+def strip_triangles(flags, indices=None):
+  # Expands triangle strips into an (N,3) index array.
+  # Strip position f >= 2 closes the triangle (f-2, f-1, f) unless its flags have the restart bit set,
+  # odd positions swap the first two indices to keep the winding. indices gives the position of every
+  # flag when it isn't simply its order in the array (P2S strips store vertex indices).
+  flags = np.asarray(flags, dtype=np.uint32)
+  if indices is None: positions = np.arange(len(flags), dtype=np.int64)
+  else: positions = np.asarray(indices, dtype=np.int64)
+  positions = positions[((flags & STRIP_RESTART) == 0) & (positions >= 2)]
+  odd = (positions & 1) != 0
+  triangles = np.empty((len(positions), 3), dtype=np.int64)
+  triangles[:, 0] = np.where(odd, positions - 1, positions - 2)
+  triangles[:, 1] = np.where(odd, positions - 2, positions - 1)
+  triangles[:, 2] = positions
+  return triangles
+
+def strip_triangles_python(flags, indices=None):
+  # Per vertex loop the format readers used before strip_triangles, kept for the benchmark
+  if indices is None: indices = range(len(flags))
+  triangles = []
+  for fc, face_data in zip(indices, flags):
+    if (face_data & STRIP_RESTART) or fc < 2: continue
+    if (fc % 2) != 0: triangles.append([fc - 1, fc - 2, fc])
+    else: triangles.append([fc - 2, fc - 1, fc])
+  return triangles
+
+def random_strip_flags(vertex_count, strip_length=64, seed=0):
+  # Strips of random length up to strip_length, each starting with two restart vertices
+  rng = np.random.default_rng(seed)
+  flags = np.zeros(vertex_count, dtype=np.uint32)
+  start = 0
+  while start < vertex_count:
+    flags[start:start + 2] = STRIP_RESTART
+    start += int(rng.integers(3, strip_length + 1))
+  return flags
+
+def benchmark(vertex_count=1000000, repeat=5):
+  flags = random_strip_flags(vertex_count)
+  results = []
+  for name, kernel, kernel_flags in (("numpy", strip_triangles, flags), ("python", strip_triangles_python, flags.tolist())):
+    best = None
+    for i in range(repeat):
+      start = time.perf_counter()
+      triangle_count = len(kernel(kernel_flags))
+      elapsed = time.perf_counter() - start
+      if best == None or elapsed < best: best = elapsed
+    results.append((name, triangle_count, best))
+    print("%-8s %d triangles in %.4fs, %.1fM triangles/s" % (name, triangle_count, best, triangle_count / best / 1e6))
+  return results
+
+if __name__ == '__main__':
+  vertex_count = int(sys.argv[1]) if len(sys.argv) >= 2 else 1000000
+  benchmark(vertex_count)
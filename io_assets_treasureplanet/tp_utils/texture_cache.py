@@ -0,0 +1,120 @@
+import os
+import sys
+import struct
+import hashlib
+import numpy as np
+
+from tp2 import read_tp2
+
+CACHE_MAGIC = b"TPTC"
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<4sHHII")
+CACHE_EXTENSION = ".tptc"
+DEFAULT_MAX_CACHE_SIZE = 256 << 20
+
+def get_cache_dir():
+  if sys.platform == "win32":
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+  elif sys.platform == "darwin":
+    base = os.path.join(os.path.expanduser("~"), "Library", "Caches")
+  else:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+  return os.path.join(base, "thousand_worlds", "textures")
+
+class TextureCache:
+  # Decoded TP2 images stored as uint8 RGBA, keyed by a hash of the raw TP2 bytes.
+  # Hits refresh the file mtime, and eviction drops the oldest files first.
+  def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_CACHE_SIZE):
+    self.cache_dir = cache_dir if cache_dir != None else get_cache_dir()
+    self.max_size = max_size
+    self.total_size = None
+  
+  def get_key(self, raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+  
+  def get_path(self, key):
+    return os.path.join(self.cache_dir, key[:2], key + CACHE_EXTENSION)
+  
+  def get(self, key):
+    path = self.get_path(key)
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+      os.utime(path)
+    except OSError:
+      return None
+    if len(data) < CACHE_HEADER.size: return None
+    magic, version, has_alpha, width, height = CACHE_HEADER.unpack_from(data, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION: return None
+    pixels = np.frombuffer(data, dtype=np.uint8, offset=CACHE_HEADER.size)
+    if len(pixels) != width * height * 4: return None
+    return width, height, pixels.astype(np.float32) / 255, bool(has_alpha)
+  
+  def put(self, key, width, height, pixels, has_alpha):
+    # Decoded channels are always n/255, so rounding back to uint8 is lossless
+    path = self.get_path(key)
+    pixels = np.round(np.asarray(pixels, dtype=np.float32) * 255).astype(np.uint8)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, int(has_alpha), width, height)
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      temp_path = path + ".%d.tmp" % os.getpid()
+      with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(pixels.tobytes())
+      os.replace(temp_path, path)
+    except OSError:
+      return
+    if self.total_size == None: self.total_size = sum(size for path, size, mtime in self.get_entries())
+    else: self.total_size += len(header) + pixels.nbytes
+    if self.total_size > self.max_size: self.evict()
+  
+  def get_entries(self):
+    entries = []
+    if not os.path.isdir(self.cache_dir): return entries
+    for root, dirs, files in os.walk(self.cache_dir):
+      for file in files:
+        if not file.endswith(CACHE_EXTENSION): continue
+        path = os.path.join(root, file)
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+        entries.append((path, stat.st_size, stat.st_mtime))
+    return entries
+  
+  def evict(self):
+    entries = sorted(self.get_entries(), key=lambda entry: entry[2])
+    total_size = sum(size for path, size, mtime in entries)
+    for path, size, mtime in entries:
+      if total_size <= self.max_size: break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      total_size -= size
+    self.total_size = total_size
+  
+  def clear(self):
+    for path, size, mtime in self.get_entries():
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+    self.total_size = 0
+
+texture_cache = None
+
+def get_texture_cache():
+  global texture_cache
+  if texture_cache == None: texture_cache = TextureCache()
+  return texture_cache
+
+def read_tp2_cached(data, name, cache=None):
+  # Same result as read_tp2, skipping the decode when these exact TP2 bytes were seen before
+  if cache == None: cache = get_texture_cache()
+  key = cache.get_key(data.getvalue())
+  cached = cache.get(key)
+  if cached != None: return cached
+  width, height, pixels, has_alpha = read_tp2(data, name)
+  cache.put(key, width, height, pixels, has_alpha)
+  return width, height, pixels, has_alpha
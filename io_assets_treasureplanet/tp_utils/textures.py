@@ -9,21 +9,21 @@ class AnimatedTexturesEntry:
   def __init__(self, data, textures):
     self.data = data
     self.entry_offset = self.data.tell()
-    self.block_size = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
     if self.block_size > 0x4:
-      texture_index = sread_u16(self.data, self.data.tell())
+      texture_index = self.data.sread_u16()
       animated_texture_count = 0
       while texture_index != 0xffff:
-        frame_count = sread_u16(self.data, self.data.tell())
+        frame_count = self.data.sread_u16()
         print(textures[texture_index].name + " Frames: " + str(frame_count))
         if frame_count > 0:
           while frame_count > 0:
             frame_count -= 1
-            frame_texture_a = sread_u16(self.data, self.data.tell())
-            frame_texture_b = sread_u16(self.data, self.data.tell())
+            frame_texture_a = self.data.sread_u16()
+            frame_texture_b = self.data.sread_u16()
             #print(textures[frame_texture_a].name)
             #print(textures[frame_texture_b].name)
-        texture_index = sread_u16(self.data, self.data.tell())
+        texture_index = self.data.sread_u16()
         animated_texture_count += 1
       print("Level has " + str(animated_texture_count) + " animated textures")
     else:
@@ -35,18 +35,18 @@ class TextureListEntry:
     self.entry_offset = entry_offset
     self.data = data
     self.data.seek(self.entry_offset)
-    self.block_size = sread_u32(self.data, self.data.tell())
-    self.texture_count = sread_u32(self.data, self.data.tell())
+    self.block_size = self.data.sread_u32()
+    self.texture_count = self.data.sread_u32()
     self.textures = []
     for i in range(self.texture_count):
       magic = try_read_str(self.data, self.data.tell(), 4)
       if magic.startswith("TP2"):
         tex_name = name + ("_%d" % i)
         texture_start = self.data.tell() - 4
-        header_size = sread_u32(self.data, texture_start + 0x8)
+        header_size = self.data.sread_u32(texture_start + 0x8)
         if header_size == 0x44:
-          tex_name = read_str_until_null_character(self.data, texture_start + 0x10)
-        texture_size = sread_u32(self.data, texture_start + 0xC)
+          tex_name = self.data.read_str_until_null_character(texture_start + 0x10)
+        texture_size = self.data.sread_u32(texture_start + 0xC)
         texture = TextureEntry(tex_name, self.entry_offset, texture_start, self.data, texture_size)
         self.textures.append(texture)
         self.data.seek(texture_start + texture_size)
@@ -59,16 +59,13 @@ class TextureListEntry:
     texture = TextureEntry(name, 0, 0, tp2_data, tp2_size)
     self.textures.append(texture)
   
-  def save_changes(self, magic = "TEXT"):
-    output = BytesIO()
-    write_magic_str(output, 0x0, magic, 4)
-    write_u32(output, output.tell(), 0)
-    write_u32(output, output.tell(), swap32(len(self.textures)))
+  def save_changes(self, magic = "TEXT", output=None):
+    if output == None: output = BinaryWriter()
+    block_offset = output.begin_block(magic)
+    output.swrite_u32(len(self.textures))
     for texture in self.textures:
-      output.write(texture.read().read())
-    self.block_size = data_len(output) - 0x8
-    write_u32(output, 0x4, swap32(self.block_size))
-    output.seek(0)
+      texture.save_changes(output)
+    self.block_size = output.end_block(block_offset)
     return output
 
 class TextureEntry:
@@ -85,3 +82,9 @@ class TextureEntry:
     bytes = BytesIO(self.data.read(self.data_size))
     self.data.seek(old_pos)
     return bytes
+  
+  def save_changes(self, output):
+    old_pos = self.data.tell()
+    self.data.seek(self.entry_offset)
+    output.write(self.data.read(self.data_size))
+    self.data.seek(old_pos)
@@ -2,6 +2,11 @@ from io import BytesIO
 from fs_helpers import *
 from octree_quantizer import OctreeQuantizer, Color
 import math
+import numpy as np
+from functools import lru_cache
+
+CLUT_BLOCK_SIZE = 8
+CLUT_BLOCK_ORDER = (0, 1, 2, 3)
 
 def read_tp2(data, name):
   header_size = sread_u32(data, 0x8)
@@ -39,80 +44,55 @@ def read_tp2(data, name):
   
   pixels = read_pixels(data, header_size, width, height, data_size, fmt)
   
-  palette_bytes = BytesIO()
   if fmt == 0x13 or fmt == 0x14:
     #print ("Palette size: %x" % palette_size)
     alpha = 1 if cmbitdepth == 32 else 0
-    palette_bytes = read_palette(data, header_size + data_size, nr_colors * (3 + alpha), alpha) 
-    #print ("Output Palette size: %x" % data_len(palette_bytes))
-  
-  palette = []
-  if fmt == 0x13 or fmt == 0x14:
-    bitdepth = int(round(palette_size / nr_colors)) * 8
-    alpha = 1 if bitdepth == 32 else 0
-    for p in range(nr_colors):
-      b = read_u8(palette_bytes, p * (3 + alpha) + 0)
-      g = read_u8(palette_bytes, p * (3 + alpha) + 1)
-      r = read_u8(palette_bytes, p * (3 + alpha) + 2)
-      a = 255
-      if alpha: a = read_u8(palette_bytes, p * (3 + alpha) + 3)
-      palette.append((r / 255, g / 255, b / 255, a / 255))
+    palette = read_palette(data, header_size + data_size, nr_colors, alpha)
+    out_pixels = palette[pixels[:width * height]]
+  elif fmt == 0x00 or fmt == 0x01:
+    out_pixels = pixels.astype(np.float32) / 255
+  else:
+    out_pixels = np.zeros((width * height, 4), dtype=np.float32)
   
-  out_pixels = [None] * (height * width)
-  fully_opaque = True
-  for i in range(width):
-    for j in range(height):
-      p_index = j * width + i
-      if fmt == 0x13 or fmt == 0x14:
-        index = read_u8(pixels, p_index)
-        color = palette[index]
-      elif fmt == 0x00 or fmt == 0x01:
-        bgra = 1 if fmt == 0x00 else 0
-        b = read_u8(pixels, p_index * (3 + bgra) + 0x0)
-        g = read_u8(pixels, p_index * (3 + bgra) + 0x1)
-        r = read_u8(pixels, p_index * (3 + bgra) + 0x2)
-        a = 255
-        if bgra: a = read_u8(pixels, p_index * (3 + bgra) + 0x3)
-        color = [r, g, b, a]
-      else:
-        color = [0, 0, 0, 0]
-      if color[3] != 255: fully_opaque = False
-      out_pixels[(j) * width + i] = [color[0], color[1], color[2], color[3]]
-      #out_pixels[((height-1)-j) * width + i] = [color[0], color[1], color[2], color[3]]
-  if fully_opaque: out_pixels = [px[:-1] for px in out_pixels]
-  out_pixels = [chan for px in out_pixels for chan in px]
-  return width, height, out_pixels
+  has_alpha = not np.all(out_pixels[:, 3] == 1.0)
+  return width, height, out_pixels.ravel(), has_alpha
+
+def unique_colors(pixels):
+  # Unique RGBA values in order of first appearance, so the octree grows exactly as it would pixel by pixel
+  keys = pixels.astype(np.uint32)
+  keys = (keys[:, 0] << 24) | (keys[:, 1] << 16) | (keys[:, 2] << 8) | keys[:, 3]
+  _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+  order = np.argsort(first)
+  rank = np.empty_like(order)
+  rank[order] = np.arange(len(order))
+  return pixels[first[order]], counts[order], rank[inverse.reshape(-1)]
+
+def pack_indices(indices, fmt):
+  indices = indices.astype(np.uint8)
+  if fmt != 0x5: return indices.tobytes()
+  if len(indices) & 1: indices = np.append(indices, np.uint8(0))
+  # Low nibble holds the first pixel, matching read_pixels_exp
+  return (indices[0::2] | (indices[1::2] << 4)).tobytes()
 
 def reduce_colors(pixels, width, height, name=None, limit=256):
+  # pixels are 0-255 RGB or RGBA values, one row per pixel
+  pixels = np.asarray(pixels).reshape(width * height, -1).astype(np.uint8)
+  if pixels.shape[1] == 3: pixels = np.column_stack((pixels, np.full(width * height, 255, dtype=np.uint8)))
   has_alpha = 1#0
+  colors, counts, inverse = unique_colors(pixels)
   octree = OctreeQuantizer()
-  for j in range(height):
-    for i in range(width):
-      pix = [c for c in pixels[i + width * j]]#((height-1)-j)]]
-      octree.add_color(*pix)
-      if pix[3] < 255: has_alpha = 1
+  octree.add_colors(colors, counts)
   palette = octree.make_palette(limit)
-  palette = read_palette_fixed_size_from_list(palette, len(palette), has_alpha)
-  palette_size = data_len(palette)
-  palette.seek(0)
+  palette = np.array([(c.red, c.green, c.blue, c.alpha) for c in palette], dtype=np.uint8).reshape(-1, 4)
+  palette = palette[:, :3 + has_alpha].tobytes()
+  palette_size = len(palette)
   
   if palette_size > 16 * (3 + has_alpha): fmt = 0x4
   else: fmt = 0x5
   
-  if fmt == 0x5:
-    pixel_data = BytesIO(b'\0'*((width*height)>>1))
-  else: pixel_data = BytesIO(b'\0'*(width*height))
-  for j in range(height):
-    for i in range(width):
-      place = i + width * j#((height-1)-j)
-      index = octree.get_palette_index(*pixels[place])#)*pixels[i, (height - 1) - j])
-      if fmt == 0x5:
-        placeShifted = place // 2
-        val = read_u8(pixel_data, placeShifted)
-        write_u8(pixel_data, placeShifted, (val << 4) | index)
-      else: write_u8(pixel_data, place, index)
-  data_size = data_len(pixel_data)
-  pixel_data.seek(0)
+  color_indices = octree.get_palette_indices(colors)
+  pixel_data = pack_indices(color_indices[inverse], fmt)
+  data_size = len(pixel_data)
   
   output = BytesIO()
   nr_colors = int(palette_size / (3 + has_alpha))
@@ -146,8 +126,8 @@ def reduce_colors(pixels, width, height, name=None, limit=256):
   write_u8(output, offset + 0xD, cmbitdepth) #Uncertain, but fairly sure
   write_u16(output, offset + 0xE, swap16(palette_size))
   write_u32(output, offset + 0x10, swap32(bull)) #Unknown, seems to be either 0 or 1
-  output.write(pixel_data.read())
-  output.write(palette.read())
+  output.write(pixel_data)
+  output.write(palette)
   output.seek(0)
   return output
 
@@ -162,82 +142,47 @@ def read_pixels(data, offset, width, height, data_size, fmt):
     return read_pixels_exp(data, offset, width, height)
 
 def read_pixels_bgra(data, offset, width, height):
-  pixels = BytesIO()
   nr_pixels = width * height
-  for p in range(nr_pixels):
-    r = read_u8(data, offset + p * 4 + 0)
-    g = read_u8(data, offset + p * 4 + 1)
-    b = read_u8(data, offset + p * 4 + 2)
-    a = read_u8(data, offset + p * 4 + 3)
-    write_u8(pixels, p * 4 + 0, b)
-    write_u8(pixels, p * 4 + 1, g)
-    write_u8(pixels, p * 4 + 2, r)
-    write_u8(pixels, p * 4 + 3, a)
-  return pixels
+  data.seek(offset)
+  return np.frombuffer(data.read(nr_pixels * 4), dtype=np.uint8).reshape(nr_pixels, 4)
   
 def read_pixels_bgr(data, offset, width, height):
-  pixels = BytesIO()
   nr_pixels = width * height
-  for p in range(nr_pixels):
-    r = read_u8(data, offset + p * 3 + 0)
-    g = read_u8(data, offset + p * 3 + 1)
-    b = read_u8(data, offset + p * 3 + 2)
-    write_u8(pixels, p * 3 + 0, b)
-    write_u8(pixels, p * 3 + 1, g)
-    write_u8(pixels, p * 3 + 2, r)
+  data.seek(offset)
+  pixels = np.full((nr_pixels, 4), 255, dtype=np.uint8)
+  pixels[:, 0:3] = np.frombuffer(data.read(nr_pixels * 3), dtype=np.uint8).reshape(nr_pixels, 3)
   return pixels
   
 def read_pixels_exp(data, offset, width, height):
-  pixels = BytesIO()
   nr_pixels = (width * height) >> 1
-  for p in range(nr_pixels):
-    pix = read_u8(data, offset + p)
-    write_u8(pixels, p * 2 + 0, pix & 0xF)
-    write_u8(pixels, p * 2 + 1, pix >> 4)
+  data.seek(offset)
+  packed = np.frombuffer(data.read(nr_pixels), dtype=np.uint8)
+  pixels = np.empty(nr_pixels * 2, dtype=np.uint8)
+  pixels[0::2] = packed & 0xF
+  pixels[1::2] = packed >> 4
   return pixels
 
 def read_pixels_raw(data, offset, data_size):
   data.seek(offset)
-  pixels = BytesIO(data.read(data_size))
-  return pixels
+  return np.frombuffer(data.read(data_size), dtype=np.uint8)
+
+@lru_cache(maxsize=None)
+def clut_permutation(nr_colors):
+  # Source entry for every palette index, CLUT_BLOCK_ORDER gives the stored order of the 8-entry blocks in each 32-entry group
+  group_size = CLUT_BLOCK_SIZE * len(CLUT_BLOCK_ORDER)
+  permutation = np.arange(nr_colors)
+  if nr_colors > 16:
+    group, within = np.divmod(permutation, group_size)
+    permutation = group * group_size + np.array(CLUT_BLOCK_ORDER)[within // CLUT_BLOCK_SIZE] * CLUT_BLOCK_SIZE + within % CLUT_BLOCK_SIZE
+  permutation.flags.writeable = False
+  return permutation
 
-def read_palette(data, offset, size, alpha=0):
-  palette = BytesIO()
-  palette.seek(0)
+def read_palette(data, offset, nr_colors, alpha=0):
+  # CLUT entries are always stored as 4 bytes, 24-bit palettes just ignore the last one
   data.seek(offset)
-  current_size = 0
-  for p in range(8):
-    read_palette_block(palette, palette.tell(), data, data.tell(), size, alpha)
-    read_palette_block(palette, palette.tell(), data, data.tell(), size, alpha)# + 32, size, alpha)
-    read_palette_block(palette, palette.tell(), data, data.tell(), size, alpha)# - 64, size, alpha)
-    read_palette_block(palette, palette.tell(), data, data.tell(), size, alpha)# + 32, size, alpha)
+  raw = np.frombuffer(data.read(nr_colors * 4), dtype=np.uint8)
+  entries = np.zeros((nr_colors, 4), dtype=np.uint8)
+  entries.reshape(-1)[:len(raw)] = raw
+  palette = entries[clut_permutation(nr_colors)].astype(np.float32) / 255
+  if not alpha: palette[:, 3] = 1.0
   return palette
-
-def read_palette_block(palette, palette_offset, data, offset, max_size, alpha=0):
-  for pb in range(8):
-    if palette_offset + pb * (3 + alpha) < max_size and (offset + pb * 4) < data_len(data):
-      b = read_u8(data, offset + pb * 4 + 0)
-      g = read_u8(data, offset + pb * 4 + 1)
-      r = read_u8(data, offset + pb * 4 + 2)
-      a = read_u8(data, offset + pb * 4 + 3)
-      write_u8(palette, palette_offset + pb * (3 + alpha) + 0, r)
-      write_u8(palette, palette_offset + pb * (3 + alpha) + 1, g)
-      write_u8(palette, palette_offset + pb * (3 + alpha) + 2, b)
-      if alpha == 1: write_u8(palette, palette_offset + pb * (3 + alpha) + 3, a)
-
-def read_palette_fixed_size_from_list(colors, size, alpha=0):
-    palette = BytesIO()
-    palette.seek(0)
-    for p in range(size):
-      b = colors[p].blue
-      g = colors[p].green
-      r = colors[p].red
-      a = colors[p].alpha
-      write_u8(palette, p * (3 + alpha) + 0, r)
-      write_u8(palette, p * (3 + alpha) + 1, g)
-      write_u8(palette, p * (3 + alpha) + 2, b)
-      if alpha == 1:
-        write_u8(palette, p * (3 + alpha) + 3, a)
-    #palette.write(b'\0'*(size * (3 + alpha) - size * (3 + alpha)))
-    return palette
-